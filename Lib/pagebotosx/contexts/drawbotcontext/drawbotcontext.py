@@ -16,12 +16,23 @@
 #
 
 import os
+import re
+import sys
+import shutil
+import tempfile
+from copy import copy
+import numpy
 from CoreText import (CTFontDescriptorCreateWithNameAndSize, CGPathAddRect,
         CTFramesetterCreateWithAttributedString, CGPathCreateMutable,
         CTFramesetterCreateFrame, CTFrameGetLines, CTFrameGetLineOrigins,
         CTFontDescriptorCopyAttribute, kCTFontURLAttribute, CGRectMake,
-        CTLineGetGlyphRuns, CTRunGetAttributes)
+        CTLineGetGlyphRuns, CTRunGetAttributes, CTRunGetStringRange,
+        CTFramesetterSuggestFrameSizeWithConstraints,
+        CTFrameGetVisibleStringRange, CTLineGetStringRange,
+        CTLineGetTypographicBounds, CTLineGetOffsetForStringIndex,
+        CTRunGetGlyphs, CTRunGetPositions, CTRunGetGlyphCount)
 from AppKit import NSFont
+import objc
 
 import drawBot
 from drawBot import Variable
@@ -30,20 +41,58 @@ from drawBot.context.baseContext import BezierPath
 from pagebot.constants import (DEFAULT_FILETYPE, DEFAULT_FONT, LEFT, RIGHT,
         CENTER, FILETYPE_PDF, FILETYPE_SVG, FILETYPE_PNG, FILETYPE_JPG,
         FILETYPE_GIF, FILETYPE_MOV, SCALE_TYPE_FITWH, SCALE_TYPE_FITW,
-        SCALE_TYPE_FITH, DEFAULT_FALLBACK_FONT_PATH, ORIGIN, EXPORT)
+        SCALE_TYPE_FITH, DEFAULT_FALLBACK_FONT_PATH, ORIGIN, EXPORT,
+        DEFAULT_FONT_SIZE)
 from pagebot.contexts.basecontext.babelstring import BabelString
-from pagebot.contexts.basecontext.babelrun import BabelLineInfo, BabelRunInfo
+from pagebot.contexts.basecontext.babelrun import (BabelRun, BabelLineInfo,
+        BabelRunInfo)
 from pagebot.contexts.basecontext.basecontext import BaseContext
 #from pagebot.contexts.basecontext.basebezierpath import BaseBezierPath
 from pagebot.toolbox.color import color #, noColor
-from pagebot.toolbox.units import pt, upt, point2D, units
-from pagebot.toolbox.transformer import path2Name, path2Dir
+from pagebot.toolbox.units import pt, upt, point2D, units, isUnit
+from pagebot.toolbox.transformer import path2Dir
 from pagebot.fonttoolbox.objects.font import findFont
+from pagebotosx.graphics.glyphoutlines import (GlyphOutlineCache,
+        getGlyphCommands)
+from pagebotosx.graphics.outlinearrays import (getGlyphOutlineArrays,
+        combineOutlines)
+from pagebotosx.images.prescale import (ScaleJob, prescaleImages,
+        drawBotScaleImage)
+from pagebotosx.export.fanout import (saveTargets, normalizeTargets,
+        rasterizePDF, getFormat, getPagePaths, RASTER_FORMATS)
+from pagebotosx.export.incremental import incrementalPages, RecordingBuilder
+from pagebotosx.export.pageranges import exportPageRanges
+from pagebotosx.export.streaming import (streamPages, PDFStreamWriter,
+        DEFAULT_CHUNK_SIZE)
+from pagebotosx.export.tiles import (exportTiles, ImageIOTileWriter,
+        getPDFPageSize, renderPDFTile, DEFAULT_TILE_SIZE, OPAQUE_FORMATS)
+from pagebotosx.images.imageinfo import ImageInfoIndex
+from pagebotosx.images.pixels import PixelSampler
+from pagebotosx.images.scaledcache import ScaledImageCache
+from pagebotosx.mathematics.contours import ContourArrays
+from pagebotosx.mathematics.flatten import flattenGlyph, DEFAULT_FLATNESS
+from pagebotosx.mathematics.pointinpath import pointsInContours, FILL_RULE_NONZERO
+from pagebotosx.mathematics.spatialindex import ContourIndex
+from pagebotosx.strings.layoutcache import (TextLayoutCache, textFingerprint,
+        styleFingerprint, textKey)
+from pagebotosx.strings.paragraphs import splitParagraphs
+from pagebotosx.strings.pattern import TextSearchIndex
+from pagebotosx.strings.runstring import RunStringSlicer
+from pagebotosx.strings.stylecache import StyleCache, runStyleKey
+from pagebotosx.strings.textflow import flowFrames
+from pagebotosx.toolbox.batch import mapUnique
+from pagebotosx.toolbox.fit import bisectFit
+from pagebotosx.toolbox.fontmetrics import FontMetricsTable
+from pagebotosx.toolbox.lrucache import LRUCache
 
 # Identifier to make builder hook name. Views will try to call e.build_html()
 drawBotBuilder = drawBot
 drawBotBuilder.PB_ID = 'drawBot'
 
+# White space between words, replaced by line separators to measure words.
+WORD_SPACE = re.compile(r'\s+')
+LINE_SEPARATOR = '\u2028'
+
 class DrawBotContext(BaseContext):
     """DrawBotContext adapts DrawBot functionality to PageBot."""
     # TODO: switch entirely to our own Bézier path format.
@@ -57,6 +106,32 @@ class DrawBotContext(BaseContext):
     _scaled from .gitignore.
     '''
     SCALED_PATH = '_scaled' # /scaled with upload on Git. /_scaled will be ignored.
+    # Maximum total size in bytes of each scaled images folder, None is
+    # unlimited. Least recently used images are removed first.
+    SCALED_CACHE_SIZE = None
+    # Optional JSON file to keep the image metadata index between runs.
+    IMAGE_INFO_PATH = None
+    # Number of decoded images kept by self.pixelSampler, and optional folder
+    # for decoded images that are memory-mapped by later runs.
+    PIXEL_IMAGE_CACHE_SIZE = 8
+    PIXEL_CACHE_PATH = None
+    # Folder of rendered pages of exportIncremental, next to the export.
+    PAGE_CACHE_PATH = '_pages'
+
+    # Maximum number of text layouts kept by self.textLayoutCache.
+    TEXT_LAYOUT_CACHE_SIZE = 1024
+    # Maximum number of FormattedStrings kept by self.formattedStringCache.
+    FORMATTED_STRING_CACHE_SIZE = 1024
+    # Maximum number of converted run styles kept by self.fsStyleCache.
+    FS_STYLE_CACHE_SIZE = 4096
+    # Maximum number of measured text sizes kept by self.textSizeCache.
+    TEXT_SIZE_CACHE_SIZE = 4096
+    # Maximum number of glyph outlines kept by self.glyphPathCache.
+    GLYPH_PATH_CACHE_SIZE = 2048
+    # Style values that scale with the fontSize, in case they are absolute.
+    SCALED_STYLE_KEYS = ('leading', 'tracking', 'baselineShift', 'indent',
+            'tailIndent', 'firstLineIndent', 'paragraphTopSpacing',
+            'paragraphBottomSpacing')
 
     def __init__(self):
         """Constructor of DrawBotContext if drawBot import exists.
@@ -77,6 +152,31 @@ class DrawBotContext(BaseContext):
         self.name = self.__class__.__name__
         # Holds the extension as soon as the export file path is defined.
         self.fileType = DEFAULT_FILETYPE
+        # Wrapped lines of BabelStrings, keyed on content, style and (w, h).
+        self.textLayoutCache = TextLayoutCache(self.TEXT_LAYOUT_CACHE_SIZE)
+        # Shared styles of CoreText runs, keyed on their attribute values.
+        self.styleCache = StyleCache()
+        # Measured (tw, th) of strings, keyed on content, style and width.
+        self.textSizeCache = LRUCache(self.TEXT_SIZE_CACHE_SIZE)
+        # Converted DrawBot FormattedStrings, keyed on the runs of the
+        # BabelString, and converted run styles, keyed on the style.
+        self.formattedStringCache = LRUCache(self.FORMATTED_STRING_CACHE_SIZE)
+        self.fsStyleCache = LRUCache(self.FS_STYLE_CACHE_SIZE)
+        # DrawBot paths of glyphs, keyed on (font path, glyph name).
+        self.glyphPathCache = GlyphOutlineCache(self.GLYPH_PATH_CACHE_SIZE)
+        # Glyph outlines as OutlineArrays, for getTextOutlineArrays.
+        self.glyphArraysCache = GlyphOutlineCache(self.GLYPH_PATH_CACHE_SIZE)
+        # Spatial indices of flattened glyph outlines.
+        self.contourIndexCache = GlyphOutlineCache(self.GLYPH_PATH_CACHE_SIZE)
+        # ScaledImageCache of each scaled images folder, keyed on its path.
+        self.scaledImageCaches = {}
+        # Size, resolution and pages of image files, read from the headers.
+        self.imageInfoIndex = ImageInfoIndex(self.IMAGE_INFO_PATH)
+        # Decoded RGBA buffers of images, for self.imagePixelColors.
+        self.pixelSampler = PixelSampler(self.PIXEL_IMAGE_CACHE_SIZE,
+                self.PIXEL_CACHE_PATH)
+        # Vertical metrics of fonts, read once per font path.
+        self.fontMetrics = FontMetricsTable()
 
     # Drawing.
 
@@ -98,17 +198,43 @@ class DrawBotContext(BaseContext):
 
     # Saving / export.
 
-    def saveDrawing(self, path, multiPage=None):
+    def saveDrawing(self, path, multiPage=None, workers=None):
         """Save the current image as path, rendering depending on the
         extension. In case the path starts with "_export", optionally creates
         directories if they don't exist yet.
 
+        Path can also be a list of targets: paths, (path, options) tuples or
+        dictionaries with a path key, where options are the DrawBot saveImage
+        options (e.g. imageResolution, imageJPEGCompressionFactor). The
+        drawing is then rendered once as PDF, and the PNG, JPG, TIFF and BMP
+        targets are made from that PDF in a pool of workers threads. Answers
+        the list of TargetResult instances with the time of each target.
+
         >>> context = DrawBotContext()
         >>> context.saveImage('_export/PageBotContext-saveDrawing.pdf')
+        >>> context.newPage(200, 100)
+        >>> results = context.saveDrawing(['_export/PageBotContext-saveDrawing.pdf',
+        ...     ('_export/PageBotContext-saveDrawing.png', dict(imageResolution=144)),
+        ...     dict(path='_export/PageBotContext-saveDrawing.jpg', imageJPEGCompressionFactor=0.5)])
+        >>> [result.method for result in results]
+        ['pdf', 'raster', 'raster']
+        >>> context.imageSize('_export/PageBotContext-saveDrawing.png')
+        (400pt, 200pt)
+        >>> context.newPage(300, 100) # Pages of raster targets as in DrawBot.
+        >>> results = context.saveDrawing(['_export/PageBotContext-saveDrawing-last.png'])
+        >>> context.imageSize('_export/PageBotContext-saveDrawing-last.png')
+        (300pt, 100pt)
+        >>> results = context.saveDrawing(['_export/PageBotContext-saveDrawing-pages.png'],
+        ...     multiPage=True)
+        >>> [os.path.exists('_export/PageBotContext-saveDrawing-pages_%d.png' % n) for n in (1, 2)]
+        [True, True]
         """
         #if not multiPage:
         #    multiPage = True
 
+        if isinstance(path, (list, tuple)):
+            return self._saveTargets(path, multiPage=multiPage, workers=workers)
+
         self.checkExportPath(path)
 
         if path.lower().endswith('.mov'):
@@ -118,6 +244,249 @@ class DrawBotContext(BaseContext):
 
     saveImage = saveDrawing
 
+    def _saveTargets(self, targets, multiPage=None, workers=None):
+        """Saves the drawing to a list of targets, see self.saveDrawing."""
+        targets = normalizeTargets(targets)
+        for path, options in targets:
+            self.checkExportPath(path)
+            if multiPage is not None and getFormat(path) in RASTER_FORMATS:
+                options.setdefault('multipage', multiPage)
+
+        def saveOther(path, options):
+            if not path.lower().endswith('.mov'):
+                options.setdefault('multipage', multiPage)
+            self.b.saveImage(path, **options)
+
+        return saveTargets(targets, lambda path: self.b.saveImage(path, multipage=True),
+                rasterizePDF, saveOther, workers=workers)
+
+    def saveTiled(self, path, tileSize=DEFAULT_TILE_SIZE, imageResolution=72,
+            workers=None, multiPage=None, imageJPEGCompressionFactor=None):
+        """Saves the drawing as raster image (PNG, JPG, TIFF, BMP) in tiles
+        of tileSize by tileSize pixels, for posters at high imageResolution
+        that are too large for a single bitmap. The drawing is saved once as
+        PDF; the tiles of each page are rendered from it in a pool of workers
+        processes (default the number of CPUs) and written in order into a
+        memory-mapped file, which the system can page out instead of keeping
+        the bitmap in memory, and which is encoded when all tiles are
+        written. As in DrawBot saveImage, only the last page is saved, unless
+        multiPage is True, which saves all pages numbered from 1.
+
+        Tiles are rendered from the PDF into the same CoreGraphics bitmaps
+        as the raster targets of self.saveDrawing with a list of targets, and
+        encoded by the same ImageIO destination with the same options, so
+        tiled files are identical to those, also with transparency and for
+        JPEG. Without tileSize, each page is a single tile. DrawBot
+        saveImage renders raster files through AppKit instead, so its
+        antialiasing is not guaranteed to be identical.
+
+        >>> context = DrawBotContext()
+        >>> context.newDrawing()
+        >>> context.newPage(200, 100)
+        >>> context.fill((1, 0, 0, 0.5))
+        >>> context.oval((20, 10), 160, 80)
+        >>> for extension, options in (('png', {}), ('jpg', dict(imageJPEGCompressionFactor=0.6))):
+        ...     rasterPath = '_export/DrawBotContext-saveTiled-raster.' + extension
+        ...     tiledPath = '_export/DrawBotContext-saveTiled.' + extension
+        ...     results = context.saveDrawing([(rasterPath, dict(imageResolution=300, **options))])
+        ...     context.saveTiled(tiledPath, tileSize=128, imageResolution=300, **options)
+        ...     raster = context.pixelSampler.getPixels(rasterPath)
+        ...     tiled = context.pixelSampler.getPixels(tiledPath)
+        ...     print(extension, tiled.shape, bool((raster == tiled).all()),
+        ...         open(rasterPath, 'rb').read() == open(tiledPath, 'rb').read())
+        png (417, 833, 4) True True
+        jpg (417, 833, 4) True True
+        >>> alpha = context.pixelSampler.getPixels('_export/DrawBotContext-saveTiled-raster.png')[..., 3]
+        >>> int(alpha.min()), 0 < int(alpha.max()) < 255 # Half transparent oval.
+        (0, True)
+        """
+        self.checkExportPath(path)
+        options = dict(imageResolution=imageResolution)
+        if imageJPEGCompressionFactor is not None:
+            options['imageJPEGCompressionFactor'] = imageJPEGCompressionFactor
+        opaque = getFormat(path) in OPAQUE_FORMATS
+        tmpDir = tempfile.mkdtemp(prefix='pagebot-tiles-')
+        pdfPath = os.path.join(tmpDir, 'drawing.pdf')
+
+        try:
+            self.b.saveImage(pdfPath, multipage=True)
+            pagePaths = getPagePaths(path, self.numberOfImages(pdfPath), multiPage)
+            for pageIndex, pagePath in pagePaths:
+                w, h = getPDFPageSize(pdfPath, pageIndex + 1, imageResolution)
+                writer = ImageIOTileWriter(pagePath, w, h, options)
+                source = pdfPath, pageIndex + 1, imageResolution, opaque
+                exportTiles(writer, renderPDFTile, source, tileSize=tileSize,
+                        workers=workers)
+        finally:
+            shutil.rmtree(tmpDir, ignore_errors=True)
+
+    def exportStreaming(self, path, pageCount, drawPages,
+            chunkSize=DEFAULT_CHUNK_SIZE):
+        """Exports a multi-page PDF document with bounded memory. Instead of
+        keeping all pages in the drawing until saveDrawing, the pages are
+        drawn in chunks of chunkSize pages by drawPages(context, start, end).
+        Each chunk is saved, its pages are appended to the PDF file at path,
+        and the drawing is cleared, so the peak memory depends on the chunk
+        size, not on pageCount. Links of linkURL are kept, as well as links
+        of linkRect to destinations in the same chunk. Answers a
+        StreamReport with the time and the peak RSS of the process, which
+        includes the memory used before the export.
+
+        >>> from pagebotosx.export.pageranges import drawNumberedPages
+        >>> context = DrawBotContext()
+        >>> report = context.exportStreaming('_export/DrawBotContext-exportStreaming.pdf',
+        ...     20, drawNumberedPages, chunkSize=8)
+        >>> report
+        <StreamReport 20 pages, 3 chunks>
+        >>> context.numberOfImages('_export/DrawBotContext-exportStreaming.pdf')
+        20
+        >>> def drawLinkedPages(context, start, end):
+        ...     for pageIndex in range(start, end):
+        ...         context.newPage(200, 100)
+        ...         context.b.linkURL('https://pagebot.io', (0, 0, 100, 50))
+        >>> report = context.exportStreaming('_export/DrawBotContext-exportStreaming-links.pdf',
+        ...     3, drawLinkedPages, chunkSize=2)
+        >>> from Foundation import NSURL
+        >>> from Quartz import PDFDocument
+        >>> document = PDFDocument.alloc().initWithURL_(NSURL.fileURLWithPath_(
+        ...     '_export/DrawBotContext-exportStreaming-links.pdf'))
+        >>> [len(document.pageAtIndex_(index).annotations()) for index in range(3)]
+        [1, 1, 1]
+        """
+        self.checkExportPath(path)
+        return streamPages(path, pageCount, drawPages, self._renderChunk,
+                PDFStreamWriter, chunkSize=chunkSize)
+
+    def _renderChunk(self, drawPages, start, end, path):
+        """Draws the pages start up to end in a new drawing of self, saves
+        them as path and releases the drawing."""
+        with objc.autorelease_pool():
+            self.newDrawing()
+            drawPages(self, start, end)
+            self.saveDrawing(path)
+            self.endDrawing()
+
+    def exportParallel(self, path, pageCount, drawPages, workers=None,
+            rangeSize=None, compare=False):
+        """Exports a multi-page PDF document in page ranges, each drawn and
+        saved by its own worker process with its own drawing, then merged in
+        page order into path. The drawing of this context is not used.
+        drawPages(context, start, end) is a module level function that draws
+        the pages start up to end, e.g. by making the Document and drawing
+        doc.pages[start:end]. Workers is the number of processes (default the
+        number of CPUs). If compare is True, the document is also exported
+        serially, and the answered ExportReport shows the speedup. Print the
+        report for the times of all ranges.
+
+        >>> from pagebotosx.export.pageranges import drawNumberedPages
+        >>> context = DrawBotContext()
+        >>> report = context.exportParallel('_export/DrawBotContext-exportParallel.pdf',
+        ...     6, drawNumberedPages, workers=2, compare=True)
+        >>> report
+        <ExportReport 6 pages, 4 ranges, 2 workers>
+        >>> context.numberOfImages('_export/DrawBotContext-exportParallel.pdf')
+        6
+        >>> report.speedup > 0
+        True
+        >>> context.newDrawing()
+        >>> context.newPage(100, 100)
+        >>> report = context.exportParallel('_export/DrawBotContext-exportParallel.pdf',
+        ...     1, drawNumberedPages, workers=1)
+        >>> context.b.pageCount() # The drawing of the context is kept.
+        1
+        """
+        self.checkExportPath(path)
+        return exportPageRanges(path, pageCount, drawPages, workers=workers,
+                rangeSize=rangeSize, compare=compare)
+
+    def exportIncremental(self, path, pageCount, drawPages, cachePath=None):
+        """Exports a multi-page PDF document, rendering only the pages that
+        changed since the previous export. Each page is drawn by
+        drawPages(context, index, index + 1) in a new drawing, while the
+        calls to DrawBot are fingerprinted with their arguments: text and
+        attributes of FormattedStrings, path elements, and the content of
+        image and font files. Pages with a fingerprint in the cache folder,
+        default _pages/<file name> next to path, are not rendered again. The
+        pages are then written in order into path. Links of linkURL are
+        kept. Links of linkRect to other pages are lost, as each page is
+        saved by itself. Answers an IncrementalReport.
+
+        >>> from pagebotosx.export.pageranges import drawNumberedPages
+        >>> context = DrawBotContext()
+        >>> path = '_export/DrawBotContext-exportIncremental.pdf'
+        >>> report = context.exportIncremental(path, 12, drawNumberedPages)
+        >>> report = context.exportIncremental(path, 12, drawNumberedPages)
+        >>> report
+        <IncrementalReport 12 pages, 0 rendered, 12 reused>
+        >>> context.numberOfImages(path)
+        12
+        """
+        self.checkExportPath(path)
+        if cachePath is None:
+            cachePath = os.path.join(os.path.dirname(path),
+                    self.PAGE_CACHE_PATH, os.path.basename(path))
+        converters = self._getFingerprintConverters()
+        b = self.b
+
+        def drawPage(index, fingerprint):
+            fingerprint.converters = converters
+            self.newDrawing()
+            self.b = RecordingBuilder(b, fingerprint)
+            try:
+                drawPages(self, index, index + 1)
+            finally:
+                self.b = b
+
+        def savePage(pagePath):
+            with objc.autorelease_pool():
+                self.saveDrawing(pagePath)
+
+        try:
+            return incrementalPages(path, pageCount, drawPage, savePage,
+                    PDFStreamWriter, cachePath, salt=drawBot.__version__)
+        finally:
+            self.endDrawing()
+
+    def _getFingerprintConverters(self):
+        """Answers the functions that convert DrawBot and AppKit objects into
+        values for page fingerprints, keyed on class name."""
+        return dict(FormattedString=self._getFormattedStringFingerprint,
+                BezierPath=self._getBezierPathFingerprint,
+                NSFont=self._getFontFingerprint,
+                NSDictionary=dict,
+                NSArray=list,
+                NSObject=lambda value: str(value.description()))
+
+    def _getFormattedStringFingerprint(self, fs):
+        """Answers the list of (text, attributes) runs of the
+        FormattedString."""
+        attributedString = fs.getNSObject()
+        s = attributedString.string()
+        runs = []
+        index = 0
+
+        while index < attributedString.length():
+            attributes, r = attributedString.attributesAtIndex_effectiveRange_(index, None)
+            runs.append((s.substringWithRange_(r), dict(attributes)))
+            index = r.location + r.length
+        return runs
+
+    def _getBezierPathFingerprint(self, path):
+        """Answers the elements and the winding rule of the BezierPath."""
+        nsPath = path.getNSBezierPath()
+        elements = []
+
+        for index in range(nsPath.elementCount()):
+            instruction, points = nsPath.elementAtIndex_associatedPoints_(index)
+            elements.append((instruction, [(point.x, point.y) for point in points]))
+        return elements, nsPath.windingRule()
+
+    def _getFontFingerprint(self, nsFont):
+        """Answers the name, size and file path of the NSFont. The path adds
+        the content hash of the font file to the fingerprint."""
+        fontName = str(nsFont.fontName())
+        return fontName, nsFont.pointSize(), self.fontName2FontPath(fontName)
+
     def export(self, fileName, folderName=None, extension=None):
         """Saves file to filename with default folder name and extension."""
         if not folderName:
@@ -212,29 +581,38 @@ class DrawBotContext(BaseContext):
         h = h or bs.th
         assert w
         assert h
-        textLines = []
         wpt, hpt = upt(w, h)
-
-        # bs.x and bs.y don't exist yet.
-        box = (0, 0, w, h)
-
-        '''
-        baselines = self.b.textBoxBaselines(bs.cs, box)
-        # We can also get the baseline coordinates from textBoxBaslines, do we
-        # really need to deconstruct CoreText runs?
-
-        for x, y in baselines:
-            #lineInfo = BabelLineInfo(x, y, None, self)
-            #textLines.append(lineInfo)
-        '''
-
+        # The same paragraphs get wrapped over and over during element
+        # layout. Answer a copy of the list, so callers cannot alter the
+        # cached layout.
+        return list(self.textLayoutCache.getLayout(bs, wpt, hpt,
+            self._getTextLines))
+
+    def _getTextLines(self, bs, wpt, hpt):
+        """Wraps the BabelString by a CoreText framesetter in a (wpt, hpt)
+        box and answers the list of BabelLineInfo instances. Called by
+        self.getTextLines if the layout is not cached."""
         # Get the FormattedString bs.cs. Let the context create it,
         # if it does not exist.
         attrString = bs.cs.getNSObject()
+        slicer = RunStringSlicer(str(attrString.string()))
         setter = CTFramesetterCreateWithAttributedString(attrString)
+        ctBox = self._newFrame(setter, 0, wpt, hpt)
+        return self._getFrameLines(ctBox, hpt, slicer)
+
+    def _newFrame(self, setter, start, wpt, hpt):
+        """Answers the CTFrame of the framesetter in a (wpt, hpt) box,
+        starting at string index start in UTF-16 code units. Length 0 fills
+        the frame with as much text as fits."""
         path = CGPathCreateMutable()
         CGPathAddRect(path, None, CGRectMake(0, 0, wpt, hpt))
-        ctBox = CTFramesetterCreateFrame(setter, (0, 0), path, None)
+        return CTFramesetterCreateFrame(setter, (start, 0), path, None)
+
+    def _getFrameLines(self, ctBox, hpt, slicer):
+        """Answers the list of BabelLineInfo instances of the lines in the
+        CTFrame, with y measured from the top of the frame. The slicer holds
+        the source string of the framesetter."""
+        textLines = []
         ctLines = CTFrameGetLines(ctBox)
         origins = CTFrameGetLineOrigins(ctBox, (0, len(ctLines)), None)
 
@@ -244,13 +622,13 @@ class DrawBotContext(BaseContext):
             for index, ctLine in enumerate(ctLines):
                 origin = origins[index]
                 x = pt(origin.x)
-                y = pt(h - origin.y)
+                y = pt(hpt - origin.y)
                 #y = pt(origin.y)
 
                 #if y > h:
                 #    break
 
-                lineInfo = BabelLineInfo(x, y, ctLine, self)
+                lineInfo = BabelLineInfo(x, y, context=self, cLine=ctLine)
                 textLines.append(lineInfo)
 
                 for ctRun in CTLineGetGlyphRuns(ctLine):
@@ -260,25 +638,213 @@ class DrawBotContext(BaseContext):
                     # determine the fontSize(s) in the first line or to find the
                     # pattern of markers. The reconstructed string cannot be
                     # used for display, as it is missing important style
-                    # parameters, such as OT-feature settings. Hack for now to
-                    # find the string in repr-string if self._ctLine.
-                    # for uCode in CTRunGetGlyphs(ctRun, (0, CTRunGetGlyphCount(ctRun)), None):
-                    #    s += glyphOrder[uCode]
-                    s = ''
-                    splitString = str(ctRun).split('"')[1].replace('\\n', '').split('\\u')
-                    for index, part in enumerate(splitString):
-                        if index == 0:
-                            s += part
-                        elif len(part) >= 4:
-                            s += chr(int(part[0:4], 16))
-
+                    # parameters, such as OT-feature settings. The run string
+                    # is sliced from the source by the string range of the run.
+                    stringRange = CTRunGetStringRange(ctRun)
+                    s = slicer.runString(stringRange.location, stringRange.length)
                     babelRunInfo = BabelRunInfo(s, style, context=self, cRun=ctRun)
                     lineInfo.runs.append(babelRunInfo)
 
         return textLines
 
+    def flowText(self, bs, boxes):
+        """Flows the BabelString through a sequence of linked boxes, such as
+        columns or continued pages. Boxes is a list of (w, h) sizes. The
+        framesetter is made once and each frame starts at the end of the
+        visible range of the previous one, so the total flow is linear in the
+        length of the text. Answers the tuple (boxLines, overflow), where
+        boxLines is a list with the BabelLineInfo list of each box that got
+        text, and overflow is a BabelString with the remaining text, or None
+        if all text fits.
+
+        >>> from pagebot.toolbox.loremipsum import loremIpsum
+        >>> context = DrawBotContext()
+        >>> style = dict(font='PageBot-Regular', fontSize=pt(12))
+        >>> bs = context.newString(loremIpsum(), style)
+        >>> boxes = [(pt(200), pt(300))] * 3
+        >>> boxLines, overflow = context.flowText(bs, boxes)
+        >>> len(boxLines), overflow is not None
+        (3, True)
+        >>> len(boxLines[0]) > 0 and len(overflow) < len(bs)
+        True
+        >>> boxLines, overflow = context.flowText(bs, [(pt(500), pt(10000))])
+        >>> len(boxLines), overflow is None
+        (1, True)
+        """
+        attrString = bs.cs.getNSObject()
+        slicer = RunStringSlicer(str(attrString.string()))
+        setter = CTFramesetterCreateWithAttributedString(attrString)
+
+        def placeFrame(start, box):
+            wpt, hpt = upt(box[0], box[1])
+            ctBox = self._newFrame(setter, start, wpt, hpt)
+            visibleRange = CTFrameGetVisibleStringRange(ctBox)
+            return (ctBox, hpt), visibleRange.length
+
+        frames, overflowStart = flowFrames(attrString.length(), boxes,
+                placeFrame)
+        boxLines = [self._getFrameLines(ctBox, hpt, slicer)
+                for _, _, (ctBox, hpt) in frames]
+
+        if overflowStart is None:
+            return boxLines, None
+        return boxLines, bs[slicer.index(overflowStart):]
+
+    def reflowTextLines(self, bs, w=None, h=None):
+        """Answers the list of BabelLineInfo instances of the BabelString,
+        similar to self.getTextLines, but wrapped paragraph by paragraph.
+        The layout of each paragraph is kept in self.textLayoutCache, so after
+        an edit only the changed paragraphs are wrapped again. The lines of
+        the following paragraphs are copied with a shifted y. If h is
+        defined, then the lines below h are omitted.
+
+        As each paragraph is wrapped in its own frame, spacing between
+        paragraphs is the measured height of each paragraph, which can differ
+        slightly from wrapping the full text by CoreText at once.
+
+        >>> from pagebot.toolbox.loremipsum import loremIpsum
+        >>> context = DrawBotContext()
+        >>> style = dict(font='PageBot-Regular', fontSize=pt(12))
+        >>> bs = context.newString('', w=pt(300))
+        >>> for n in range(10):
+        ...     bs.add(loremIpsum()[:500] + chr(10), style)
+        >>> lines = context.reflowTextLines(bs)
+        >>> len(lines) == len(context.getTextLines(bs, w=pt(300), h=pt(10000)))
+        True
+        >>> bs.runs[0].s = 'Edited ' + bs.runs[0].s # Changes the first paragraph.
+        >>> misses = context.textLayoutCache.misses
+        >>> lines = context.reflowTextLines(bs)
+        >>> context.textLayoutCache.misses - misses
+        1
+        """
+        wpt = upt(w or bs.w or bs.tw)
+        hpt = upt(h)
+        textLines = []
+        # Distance from the top of the box to the top of the paragraph.
+        y = 0
+
+        for paragraph in splitParagraphs(bs.runs):
+            pbs = BabelString(context=self, w=wpt)
+            for s, style in paragraph:
+                pbs.runs.append(BabelRun(s, style))
+            _, th = self.textSizeCache.getOrCreate(textKey(pbs, wpt),
+                    self._measureString, pbs, wpt)
+
+            for line in self.getTextLines(pbs, w=wpt, h=2 * upt(th) + 1):
+                lineY = y + upt(line.y)
+                if hpt is not None and lineY > hpt:
+                    return textLines
+                # Copy, as the cached lines are shared with other texts.
+                lineInfo = copy(line)
+                lineInfo.y = pt(lineY)
+                textLines.append(lineInfo)
+            y += upt(th)
+
+        return textLines
+
+    def invalidateTextLayout(self, bs=None):
+        """Removes the cached layouts of the BabelString. Clears all cached
+        text layouts if bs is None.
+
+        >>> from pagebot.toolbox.units import pt
+        >>> context = DrawBotContext()
+        >>> bs = context.newString('ABCD', dict(fontSize=pt(24)))
+        >>> lines = context.getTextLines(bs)
+        >>> lines = context.getTextLines(bs)
+        >>> context.textLayoutCache.hits > 0
+        True
+        >>> context.invalidateTextLayout(bs)
+        >>> lines = context.getTextLines(bs)
+        >>> context.invalidateTextLayout()
+        >>> len(context.textLayoutCache)
+        0
+        """
+        self.textLayoutCache.invalidate(bs)
+
+    def getTextSearchIndex(self, bs, w=None, h=None):
+        """Answers a TextSearchIndex with the string ranges of the lines of
+        the BabelString, wrapped in a (w, h) box as in self.getTextLines. The
+        index can be searched many times, for many patterns at once.
+
+        >>> from pagebot.toolbox.loremipsum import loremIpsum
+        >>> context = DrawBotContext()
+        >>> style = dict(font='PageBot-Regular', fontSize=pt(12))
+        >>> bs = context.newString(loremIpsum(), style, w=pt(300))
+        >>> index = context.getTextSearchIndex(bs)
+        >>> len(index) == len(bs.lines)
+        True
+        """
+        text = ''.join(run.s for run in bs.runs)
+        slicer = RunStringSlicer(text)
+        index = TextSearchIndex(text)
+
+        for line in self.getTextLines(bs, w=w, h=h):
+            ctLine = line.cLine
+            lineX = upt(line.x)
+            lineRange = CTLineGetStringRange(ctLine)
+            width, ascent, descent, _ = CTLineGetTypographicBounds(ctLine,
+                    None, None, None)
+            runs = []
+
+            for run in line.runs:
+                runRange = CTRunGetStringRange(run.cRun)
+                runs.append((slicer.index(runRange.location),
+                    slicer.index(runRange.location + runRange.length), run))
+
+            def offset(i, ctLine=ctLine, lineX=lineX):
+                x, _ = CTLineGetOffsetForStringIndex(ctLine,
+                        slicer.utf16Index(i), None)
+                return lineX + x
+
+            index.addLine(slicer.index(lineRange.location),
+                    slicer.index(lineRange.location + lineRange.length),
+                    y=upt(line.y), h=ascent + descent, w=lineX + width,
+                    line=line, runs=runs, offset=offset)
+
+        return index
+
+    def findPatterns(self, bs, patterns, w=None, h=None):
+        """Answers the list of FoundPattern instances of all regex patterns in
+        the BabelString, wrapped in a (w, h) box. The lines of each match are
+        found in a TextSearchIndex. Each FoundPattern has the line, run, x, y (baseline, from
+        the top), w and h of the match in a line.
+
+        >>> context = DrawBotContext()
+        >>> style = dict(font='PageBot-Regular', fontSize=pt(12))
+        >>> bs = context.newString('See note [1] and [2], or index {A}.', style, w=pt(500))
+        >>> found = context.findPatterns(bs, [r'\\[[0-9]\\]', r'{[A-Z]}'])
+        >>> [f.s for f in found]
+        ['[1]', '[2]', '{A}']
+        >>> found[0].x < found[1].x < found[2].x
+        True
+        """
+        return self.getTextSearchIndex(bs, w=w, h=h).search(patterns)
+
     def getStyleFromRun(self, ctRun):
-        """Reverse-engineers typographic elements from a CoreText Run."""
+        """Reverse-engineers typographic elements from a CoreText Run. Runs
+        with equal font, paragraph style, color, baseline offset and language
+        answer the same read-only RunStyle, made once by
+        self.getStyleFromAttributes. The number of different styles is
+        available as self.styleCache.uniqueStyles.
+
+        >>> from pagebot.toolbox.units import pt
+        >>> from pagebot.toolbox.loremipsum import loremIpsum
+        >>> context = DrawBotContext()
+        >>> style = dict(font='PageBot-Regular', fontSize=pt(12))
+        >>> bs = context.newString(loremIpsum(), style, w=pt(300))
+        >>> lines = bs.lines
+        >>> len(lines) > 1, context.styleCache.uniqueStyles
+        (True, 1)
+        >>> lines[0].runs[0].style is lines[1].runs[0].style
+        True
+        """
+        attributes = CTRunGetAttributes(ctRun)
+        return self.styleCache.getStyle(runStyleKey(attributes),
+                self.getStyleFromAttributes, attributes)
+
+    def getStyleFromAttributes(self, attributes):
+        """Answers the style dictionary that is reconstructed from the
+        attributes of a CoreText run."""
         # https://developer.apple.com/documentation/uikit/nsparagraphstyle
         # paragraph.maximumLineHeight()
         # paragraph.minimumLineHeight()
@@ -292,7 +858,6 @@ class DrawBotContext(BaseContext):
         # paragraph.tighteningFactorForTruncation()
         # paragraph.allewsDefaultTighteningForTruncation()
         # paragraph.headerLevel()
-        attributes = CTRunGetAttributes(ctRun)
         c = attributes['NSColor']
         textFill = color(r=c.redComponent(),
                         g=c.greenComponent(),
@@ -357,11 +922,34 @@ class DrawBotContext(BaseContext):
         >>> doc = Document(w=tw+50, h=th+100, context=context)
         >>> e = newText(bs, x=20, y=120, parent=doc[1])
         >>> doc.export('_export/DrawBotContext-fromBabelString.pdf')
+
+        Conversions are cached on the content and styles of the runs, so a
+        changed run makes a new FormattedString. The answer is a copy, which
+        can be altered without changing the cache.
+
+        >>> bs = context.newString('Hkpx', style)
+        >>> fs1 = context.fromBabelString(bs)
+        >>> fs2 = context.fromBabelString(context.newString('Hkpx', style))
+        >>> fs1 is not fs2, str(fs1) == str(fs2), context.formattedStringCache.hits > 0
+        (True, True, True)
+        >>> bs.runs[0].s = 'Hkpxx'
+        >>> context.fromBabelString(bs)
+        Hkpxx
         """
+        fs = self.formattedStringCache.getOrCreate(textFingerprint(bs),
+                self._makeFormattedString, bs)
+        return fs.copy()
+
+    def _makeFormattedString(self, bs):
+        """Answers a new DrawBot FormattedString with the runs of the
+        BabelString. The converted style of each run is cached in
+        self.fsStyleCache, so equal styles are converted once, also across
+        strings."""
         fs = self.b.FormattedString()
 
         for run in bs.runs:
-            fsStyle, hyphenation = run.getFSStyle()
+            fsStyle, hyphenation = self.fsStyleCache.getOrCreate(
+                    styleFingerprint(run.style), run.getFSStyle)
 
             # TODO: take care of hyphenation in BabelStrings or during draw.
             #self.b.hyphenation(hyphenation)
@@ -454,7 +1042,15 @@ class DrawBotContext(BaseContext):
         >>> tw, th = context.textSize(bs, w=bs.w, h=bs.h) # Render to FormattedString for new size.
         >>> tw.rounded, th.rounded
         (105pt, 50pt)
-        >>>
+
+        With ascDesc, the height is the sum of the ascender minus descender
+        of each line, also for multiple lines.
+
+        >>> tw, th1 = context.textSize(context.newString('Hkpx', style), ascDesc=True)
+        >>> bs = context.newString('Hkpx'+chr(10)+'Hkpx', style)
+        >>> tw, th2 = context.textSize(bs, ascDesc=True)
+        >>> th2.rounded == (2 * th1).rounded
+        True
         """
         #assert isinstance(bs, BabelString)
         assert bs.context == self
@@ -469,26 +1065,233 @@ class DrawBotContext(BaseContext):
             w = bs.w
             #h = bs.h
 
+        textSize = units(self.b.textSize(bs.cs, width=w, height=h, align=align or LEFT))
         if not ascDesc:
-            return units(self.b.textSize(bs.cs, width=w, height=h, align=align or LEFT))
-        else:
-            # FIXME: runs into recursion error in case of multiple lines, for
-            # now setting Flat counterpart to ascDesc=False.
-            # textSize -> bs.lines -> getTextLines -> testSize
-            textHeight = 0
-            for line in bs.lines:
-                lineHeight = 0
-                for run in  line.runs:
+            return textSize
+
+        # Wrap the lines in an explicit box, as bs.lines would ask for bs.tw
+        # and bs.th, which calls self.textSize again. The height of each line
+        # is made from the ascenders and descenders of its runs, read from
+        # the font metrics table.
+        textWidth, textHeight = textSize
+        wpt = upt(w) or upt(textWidth) + 1
+        hpt = 2 * upt(textHeight) + 1
+        textHeight = 0
+
+        for line in self.getTextLines(bs, w=wpt, h=hpt):
+            ascender, descender = self.fontMetrics.lineAscDesc(
+                (run.style['font'], upt(run.style['fontSize']),
+                    upt(run.style.get('baselineShift') or 0))
+                for run in line.runs)
+            textHeight += ascender - descender
+
+        return textWidth, pt(textHeight)
+
+    def textSizes(self, bss, widths=None, workers=None):
+        """Answers the list of (tw, th) sizes of the BabelStrings, in the
+        order of bss. Widths is None, a single width for all strings or a list
+        with a width for every string. A width of None measures at bs.w.
+        Strings with equal runs are converted into an attributed string and
+        framesetter once, and equal strings with equal widths are measured
+        once. If workers is larger than 1, then the measurements are spread
+        over a pool of threads. All widths of a string are measured by the
+        same thread, as a CoreText framesetter cannot be used by multiple
+        threads at the same time.
 
-                    size = run.style['fontSize']
-                    font = run.style['font']
-                    upem = font.upem
-                    runHeight = size * (font.info.typoAscender - font.info.typoDescender) / upem
-                    lineHeight = max(lineHeight, runHeight)
-                textHeight += lineHeight
+        >>> from pagebot.toolbox.units import em
+        >>> context = DrawBotContext()
+        >>> style = dict(font='PageBot-Regular', leading=em(1), fontSize=pt(100))
+        >>> bss = [context.newString(s, style) for s in ('Hkpx', 'H', 'Hkpx')]
+        >>> sizes = context.textSizes(bss)
+        >>> sizes[0] == sizes[2] == context.textSize(bss[0])
+        True
+        >>> context.textSizes(bss, workers=2) == sizes
+        True
+        >>> sizes = context.textSizes(bss, widths=[pt(100), pt(200), pt(300)])
+        >>> len(sizes)
+        3
+        >>> bs = context.newString('Hkpx ' * 40, dict(font='PageBot-Regular', fontSize=pt(20)))
+        >>> widths = [pt(w) for w in (100, 200, 300, 400, 500, 600)]
+        >>> sizes = context.textSizes([bs] * len(widths), widths, workers=4)
+        >>> sizes == [context.textSize(bs, w=w) for w in widths]
+        True
+        """
+        if not isinstance(widths, (list, tuple)):
+            widths = [widths] * len(bss)
+        assert len(widths) == len(bss)
+
+        # Attributed string, framesetter and widths for every different
+        # content.
+        groups = {}
+        keys = []
+
+        for bs, w in zip(bss, widths):
+            assert bs.context == self
+            if w is None:
+                w = bs.w
+            wpt = upt(w)
+            fingerprint = textFingerprint(bs)
+            if fingerprint is None:
+                # No exact key, so it is not shared with other strings.
+                fingerprint = id(bs)
+
+            if fingerprint not in groups:
+                attrString = bs.cs.getNSObject()
+                groups[fingerprint] = ((attrString,
+                    CTFramesetterCreateWithAttributedString(attrString)), {})
+
+            groups[fingerprint][1][wpt] = None
+            keys.append((fingerprint, wpt))
+
+        # Each group is measured by one thread, that owns its framesetter.
+        items = list(groups.values())
+        groupSizes = mapUnique(self._measureTexts, items, list(groups),
+                workers=workers)
+        sizes = {}
+
+        for fingerprint, (_, groupWidths), groupSize in zip(groups, items, groupSizes):
+            for wpt, size in zip(groupWidths, groupSize):
+                sizes[fingerprint, wpt] = size
+
+        return [sizes[key] for key in keys]
+
+    def scaledString(self, bs, factor):
+        """Answers a copy of the BabelString with the fontSize of all runs
+        multiplied by factor. Absolute values of leading, tracking, indents
+        and paragraph spacing are scaled too, relative values (e.g. em) follow
+        the fontSize by themselves.
+
+        >>> from pagebot.toolbox.units import em
+        >>> context = DrawBotContext()
+        >>> style = dict(fontSize=pt(20), leading=pt(24), tracking=em(0.1))
+        >>> bs = context.newString('Hkpx', style)
+        >>> scaled = context.scaledString(bs, 0.5)
+        >>> scaled.fontSize, scaled.leading, scaled.tracking
+        (10pt, 12pt, 0.1em)
+        >>> bs.fontSize
+        20pt
+        """
+        scaled = BabelString(context=self, w=bs.w, h=bs.h)
+
+        for run in bs.runs:
+            style = dict(run.style)
+            style['fontSize'] = pt(upt(style.get('fontSize', DEFAULT_FONT_SIZE)) * factor)
+
+            for key in self.SCALED_STYLE_KEYS:
+                value = style.get(key)
+                if isinstance(value, (int, float)) or (isUnit(value) and not value.isRelative):
+                    style[key] = pt(upt(value) * factor)
+            scaled.runs.append(BabelRun(run.s, style))
+
+        return scaled
+
+    def fitString(self, bs, w, h, minFontSize=None, maxFontSize=None,
+            tolerance=0.1):
+        """Answers the tuple (fitted, fontSize, layouts) where fitted is a
+        scaled copy of bs with the largest fontSize that fits the (w, h) box,
+        and layouts is the number of text layouts that had to be made. In
+        case of multiple sizes in bs, fontSize is the size of the largest run
+        and the other runs scale proportionally. Fitted is None if the text
+        does not fit, even at minFontSize. Sizes only fit if the longest
+        word fits the width, as CoreText breaks longer words anywhere.
+
+        The search bisects between minFontSize (default 1pt) and maxFontSize
+        (default h) and stops when the interval is smaller than tolerance.
+        Measurements are cached in self.textSizeCache, keyed on the scaled
+        content, so repeated fits of the same copy and sizes that were tried
+        before do not make new layouts.
+
+        >>> from pagebot.toolbox.units import em
+        >>> context = DrawBotContext()
+        >>> style = dict(font='PageBot-Regular', leading=em(1), fontSize=pt(100))
+        >>> bs = context.newString('Hkpx', style)
+        >>> fitted, fontSize, layouts = context.fitString(bs, pt(100), pt(100))
+        >>> tw, th = context.textSize(fitted, w=pt(100))
+        >>> th <= 100, fitted.cs.getNSObject().size().width <= 100, 0 < layouts < 40
+        (True, True, True)
+        >>> fitted, fontSize, layouts = context.fitString(bs, pt(100), pt(100))
+        >>> layouts # All measurements are cached now.
+        0
+        >>> bs = context.newString('Hkpx Hkpx Hkpx', style)
+        >>> fitted, fontSize, layouts = context.fitString(bs, pt(100), pt(300))
+        >>> words = context.wordString(fitted).cs.getNSObject()
+        >>> words.size().width <= 100 # No word is broken.
+        True
+        >>> fitted, fontSize, layouts = context.fitString(bs, pt(100), pt(0.5))
+        >>> fontSize is None or fontSize <= 0.5 # Boxes under 1pt high.
+        True
+        >>> context.fitString(bs, pt(100), pt(0))
+        (None, None, 0)
+        """
+        wpt, hpt = upt(w, h)
+        baseFontSize = max([upt(run.style.get('fontSize', DEFAULT_FONT_SIZE))
+            for run in bs.runs] or [upt(DEFAULT_FONT_SIZE)])
+        maxFontSize = upt(maxFontSize or hpt)
+        minFontSize = min(upt(minFontSize or 1), maxFontSize)
+        if maxFontSize <= 0:
+            return None, None, 0
+        misses = self.textSizeCache.misses
+
+        def fits(fontSize):
+            scaled = self.scaledString(bs, fontSize / baseFontSize)
+            _, th = self.textSizeCache.getOrCreate(
+                    textKey(scaled, wpt), self._measureString, scaled, wpt)
+            if th > hpt:
+                return False
+            # The layout width always fits, so test the longest word.
+            words = self.wordString(scaled)
+            ww, _ = self.textSizeCache.getOrCreate(textKey(words, None),
+                    self._measureString, words, None)
+            return ww <= wpt
+
+        fontSize, _ = bisectFit(fits, minFontSize, maxFontSize,
+                tolerance=tolerance)
+        layouts = self.textSizeCache.misses - misses
+
+        if fontSize is None:
+            return None, None, layouts
+        return (self.scaledString(bs, fontSize / baseFontSize), pt(fontSize),
+                layouts)
+
+    def wordString(self, bs):
+        """Answers a copy of the BabelString with all white space replaced
+        by line separators, so its unconstrained width is the width of the
+        longest word.
+
+        >>> context = DrawBotContext()
+        >>> bs = context.newString('Hkpx  Hkpx', dict(fontSize=pt(20)))
+        >>> context.wordString(bs).runs[0].s == 'Hkpx' + LINE_SEPARATOR + 'Hkpx'
+        True
+        """
+        words = BabelString(context=self, w=bs.w, h=bs.h)
+        for run in bs.runs:
+            words.runs.append(BabelRun(WORD_SPACE.sub(LINE_SEPARATOR, run.s),
+                    dict(run.style)))
+        return words
 
-            textWidth, _ = units(self.b.textSize(bs.cs, width=w, height=h, align=align or LEFT))
-            return (textWidth, textHeight)
+    def _measureString(self, bs, wpt):
+        """Answers the (tw, th) of the BabelString, measured at width wpt."""
+        attrString = bs.cs.getNSObject()
+        setter = CTFramesetterCreateWithAttributedString(attrString)
+        return self._measureText(((attrString, setter), wpt))
+
+    def _measureTexts(self, group):
+        """Answers the list of (tw, th) of a ((attrString, framesetter),
+        widths) group of self.textSizes, for each width in order."""
+        text, widths = group
+        return [self._measureText((text, wpt)) for wpt in widths]
+
+    def _measureText(self, item):
+        """Answers the (tw, th) of an ((attrString, framesetter), wpt) item,
+        measured the same way as DrawBot textSize."""
+        (attrString, setter), wpt = item
+
+        if wpt is None:
+            tw, th = attrString.size()
+        else:
+            (tw, th), _ = CTFramesetterSuggestFrameSizeWithConstraints(setter,
+                    (0, 0), None, (wpt, sys.float_info.max), None)
+        return pt(tw), pt(th)
 
 
 
@@ -511,39 +1314,149 @@ class DrawBotContext(BaseContext):
 
     def getGlyphPath(self, glyph, p=None, path=None):
         """Answers the DrawBot path. Allow optional position offset and path,
-        in case we do recursive component drawing.
+        to append the glyph to. The outline of each (font path, glyph name)
+        is made once, with components resolved, and kept in
+        self.glyphPathCache. Placing a cached glyph is a copy, translate and
+        append of its path.
 
         >>> from pagebot.fonttoolbox.objects.font import findFont
         >>> context = DrawBotContext()
         >>> f = findFont('Roboto-Regular')
         >>> g = f['H']
         >>> path = context.getGlyphPath(g)
+        >>> path = context.getGlyphPath(g, (100, 0), path)
+        >>> context.glyphPathCache.hits, context.glyphPathCache.misses
+        (1, 1)
         """
         if path is None:
             path = self.newPath()
 
+        glyphPath = self.glyphPathCache.getOutline(glyph, self._makeGlyphPath).copy()
+
+        if p is not None and (p[0] or p[1]):
+            glyphPath.translate(p[0], p[1])
+        path.appendPath(glyphPath)
+        return path
+
+    def getTextGlyphPlacements(self, bs, w=None, h=None, p=None):
+        """Answers the list of (glyph, x, y, scale) tuples of all glyphs in
+        the laid-out lines of the BabelString, as answered by
+        self.getTextLines. The glyphs and their positions are read from the
+        CoreText runs, so kerning, ligatures and other OT-features are
+        included. Positions are in DrawBot coordinates, as if the string is
+        drawn by textBox in a (w, h) box with the bottom-left at p. Scale
+        converts the font units of the glyph into points.
+
+        >>> from pagebot.toolbox.units import pt
+        >>> context = DrawBotContext()
+        >>> style = dict(font='PageBot-Regular', fontSize=pt(100))
+        >>> bs = context.newString('HH', style)
+        >>> placements = context.getTextGlyphPlacements(bs, w=pt(500), h=pt(200))
+        >>> len(placements) # One placement for each glyph of the runs.
+        2
+        >>> [g.name for g, _, _, _ in placements]
+        ['H', 'H']
+        >>> (g1, x1, y1, scale), (g2, x2, y2, _) = placements
+        >>> x1 < x2, y1 == y2, scale == 100 / g1.font.upem
+        (True, True, True)
+        """
         if p is None:
             px = py = 0
         else:
-            px = p[0]
-            py = p[1]
+            px, py = upt(p[0], p[1])
+        hpt = upt(h or bs.th)
+        placements = []
+
+        for line in self.getTextLines(bs, w=w, h=h):
+            lineX = px + upt(line.x)
+            lineY = py + hpt - upt(line.y)
+
+            for run in line.runs:
+                if run.cRun is None:
+                    continue
+                font = run.style['font']
+                scale = upt(run.style['fontSize']) / font.upem
+                runY = lineY + upt(run.style.get('baselineShift') or 0)
+                glyphOrder = font.ttFont.getGlyphOrder()
+                # The length of the range is the size of the answered
+                # buffers, so a range of (0, 0) would answer no glyphs.
+                glyphRange = 0, CTRunGetGlyphCount(run.cRun)
+                glyphs = CTRunGetGlyphs(run.cRun, glyphRange, None)
+                positions = CTRunGetPositions(run.cRun, glyphRange, None)
+
+                for glyphId, position in zip(glyphs, positions):
+                    placements.append((font[glyphOrder[glyphId]],
+                        lineX + position.x, runY + position.y, scale))
+
+        return placements
+
+    def getTextOutlineArrays(self, bs, w=None, h=None, p=None):
+        """Answers the outline of the laid-out BabelString as a single
+        OutlineArrays, with the segment types and the points of all glyphs.
+        The outline of each glyph is made once and kept in
+        self.glyphArraysCache. All points are placed in one vectorized pass.
+        Use outline.flatten() to get the ContourArrays.
+
+        >>> from pagebot.toolbox.units import pt
+        >>> context = DrawBotContext()
+        >>> style = dict(font='PageBot-Regular', fontSize=pt(100))
+        >>> bs = context.newString('HH', style)
+        >>> outline = context.getTextOutlineArrays(bs, w=pt(500), h=pt(200))
+        >>> context.glyphArraysCache.misses, context.glyphArraysCache.hits
+        (1, 1)
+        >>> minX, minY, maxX, maxY = outline.bounds()
+        >>> 0 <= minX < maxX < 500 and 0 <= minY < maxY < 200
+        True
+        """
+        placements = []
+        for glyph, x, y, scale in self.getTextGlyphPlacements(bs, w=w, h=h, p=p):
+            outline = self.glyphArraysCache.getOutline(glyph, getGlyphOutlineArrays)
+            placements.append((outline, x, y, scale))
+        return combineOutlines(placements)
+
+    def getTextOutlinePath(self, bs, w=None, h=None, p=None, path=None):
+        """Answers the outline of the laid-out BabelString as a single DrawBot
+        path, e.g. for knockouts and effects. The cached path of each glyph
+        in self.glyphPathCache is copied, transformed and appended, instead of
+        drawing the text into the path. Optional path to append to.
+
+        >>> from pagebot.toolbox.units import pt
+        >>> context = DrawBotContext()
+        >>> style = dict(font='PageBot-Regular', fontSize=pt(100))
+        >>> bs = context.newString('Hello', style)
+        >>> path = context.getTextOutlinePath(bs, w=pt(500), h=pt(200))
+        >>> path.__class__.__name__
+        'BezierPath'
+        >>> minX, minY, maxX, maxY = path.bounds()
+        >>> 0 <= minX < maxX < 500 and 0 <= minY < maxY < 200
+        True
+        """
+        if path is None:
+            path = self.newPath()
 
-        for command, t in glyph.cubic:
-            # TODO: quadTo()
+        for glyph, x, y, scale in self.getTextGlyphPlacements(bs, w=w, h=h, p=p):
+            glyphPath = self.glyphPathCache.getOutline(glyph, self._makeGlyphPath).copy()
+            glyphPath.transform((scale, 0, 0, scale, x, y))
+            path.appendPath(glyphPath)
+
+        return path
 
+    def _makeGlyphPath(self, glyph):
+        """Answers a new DrawBot path with the outline of the glyph at the
+        origin, with components resolved."""
+        path = self.b.BezierPath()
+
+        for command, points in getGlyphCommands(glyph):
             if command == 'moveTo':
-                path.moveTo((px+t[0], py+t[1]))
+                path.moveTo(points[0])
             elif command == 'lineTo':
-                path.lineTo((px+t[0], py+t[1]))
+                path.lineTo(points[0])
             elif command == 'curveTo':
-                path.curveTo((px+t[0][0], py+t[0][1]),
-                        (px+t[1][0], py+t[1][1]), (px+t[2][0], py+t[2][1]))
+                path.curveTo(*points)
+            elif command == 'qCurveTo':
+                path.qCurveTo(*points)
             elif command == 'closePath':
                 path.closePath()
-            elif command == 'component':
-                # Recursively for components.
-                (x, y), componentGlyph = t
-                self.getGlyphPath(componentGlyph, (px+x, py+y), path)
 
         return path
 
@@ -603,6 +1516,97 @@ class DrawBotContext(BaseContext):
 
         return flattenedContours
 
+    def getFlattenedContourArrays(self, path=None):
+        """Answers the flattened Bézier path as ContourArrays, with one (N, 2)
+        float64 point buffer and the contour offsets, instead of lists of
+        tuples. The contours are the same as answered by
+        self.getFlattenedContours, which is available as
+        contourArrays.toLists(). Indexing answers ContourView instances.
+
+        >>> from pagebot.fonttoolbox.objects.font import findFont
+        >>> context = DrawBotContext()
+        >>> f = findFont('Roboto-Regular')
+        >>> g = f['H']
+        >>> path = context.getGlyphPath(g)
+        >>> contours = context.getFlattenedContourArrays(path)
+        >>> contours.points.shape[1], contours.points.dtype
+        (2, dtype('float64'))
+        >>> contours.toLists() == context.getFlattenedContours(path)
+        True
+        """
+        flatPath = self.bezierPathByFlatteningPath(path)
+        count = 0 if flatPath is None else flatPath.elementCount()
+        points = numpy.empty((count, 2), dtype=numpy.float64)
+        offsets = [0]
+        n = 0
+
+        for index in range(count):
+            # NSBezierPath size + index call.
+            p = flatPath.elementAtIndex_associatedPoints_(index)[1]
+
+            if p:
+                points[n] = p[0].x, p[0].y
+                n += 1
+            else:
+                offsets.append(n)
+        offsets.append(n)
+
+        return ContourArrays(points[:n], offsets)
+
+    def getFlattenedGlyphContours(self, glyph, p=None,
+            tolerance=DEFAULT_FLATNESS):
+        """Answers the flattened outline of the glyph as ContourArrays, made
+        from the glyph.cubic stream by the NumPy flattener instead of
+        NSBezierPath. Tolerance is the maximum distance between the curves
+        and the line segments. The contours are equal to
+        self.getFlattenedContourArrays of the glyph path within tolerance.
+
+        >>> from pagebot.fonttoolbox.objects.font import findFont
+        >>> context = DrawBotContext()
+        >>> f = findFont('Roboto-Regular')
+        >>> g = f['O']
+        >>> contours = context.getFlattenedGlyphContours(g)
+        >>> nsContours = context.getFlattenedContourArrays(context.getGlyphPath(g))
+        >>> len(contours) == len(nsContours)
+        True
+        >>> all(abs(v1 - v2) <= 0.6 for v1, v2 in zip(contours.bounds(), nsContours.bounds()))
+        True
+        """
+        return flattenGlyph(glyph, p=p, tolerance=tolerance)
+
+    def getContourIndex(self, path=None):
+        """Answers a ContourIndex of the flattened contours of the path, with
+        the bounding boxes of all contours and segments in a uniform grid, for
+        repeated point, rectangle and nearest-segment queries. Build it once
+        and keep it as long as the path does not change.
+
+        >>> from pagebot.fonttoolbox.objects.font import findFont
+        >>> context = DrawBotContext()
+        >>> f = findFont('Roboto-Regular')
+        >>> path = context.getGlyphPath(f['O'])
+        >>> index = context.getContourIndex(path)
+        >>> len(index.contoursInRect(path.bounds())) > 0
+        True
+        """
+        return ContourIndex(self.getFlattenedContourArrays(path))
+
+    def getGlyphContourIndex(self, glyph):
+        """Answers the ContourIndex of the glyph outline in font units,
+        flattened by getFlattenedGlyphContours. The index of each (font path,
+        glyph name) is built once and kept in self.contourIndexCache.
+
+        >>> from pagebot.fonttoolbox.objects.font import findFont
+        >>> context = DrawBotContext()
+        >>> f = findFont('Roboto-Regular')
+        >>> index = context.getGlyphContourIndex(f['O'])
+        >>> index is context.getGlyphContourIndex(f['O'])
+        True
+        >>> len(index.contours) >= 2
+        True
+        """
+        return self.contourIndexCache.getOutline(glyph,
+                lambda g: ContourIndex(self.getFlattenedGlyphContours(g)))
+
     def onBlack(self, p, path=None):
         """Answers if the single point (x, y) is on black.
 
@@ -622,6 +1626,33 @@ class DrawBotContext(BaseContext):
         p = point2D(p)
         return path._path.containsPoint_(p)
 
+    def onBlackMany(self, points, path=None, fillRule=FILL_RULE_NONZERO):
+        """Answers the boolean mask of the (x, y) points in the (N, 2) array
+        that are on black, by a vectorized winding-number test over the
+        flattened contours of the path, instead of calling onBlack for each
+        point. Points outside the bounding box of the path are skipped.
+        fillRule is 'nonzero' (as NSBezierPath) or 'evenodd'. The path can
+        also be ContourArrays, e.g. from getFlattenedGlyphContours, so the
+        flattening is done once for repeated queries.
+
+        >>> from pagebot.fonttoolbox.objects.font import findFont
+        >>> context = DrawBotContext()
+        >>> f = findFont('Roboto-Regular')
+        >>> g = f['H']
+        >>> path = context.getGlyphPath(g)
+        >>> grid = numpy.mgrid[0:1200:50, 0:1500:50].reshape(2, -1).T + 1
+        >>> mask = context.onBlackMany(grid, path=path)
+        >>> mask.shape == (len(grid),) and mask.any()
+        True
+        >>> mask.tolist() == [context.onBlack(p, path=path) for p in grid.tolist()]
+        True
+        """
+        if isinstance(path, ContourArrays):
+            contours = path
+        else:
+            contours = self.getFlattenedContourArrays(path)
+        return pointsInContours(points, contours, fillRule=fillRule)
+
 
     # Path drawing behavior.
 
@@ -707,7 +1738,7 @@ class DrawBotContext(BaseContext):
         if p is None:
             p = ORIGIN
 
-        iw, ih = self.imageSize(path)
+        iw, ih = self.imageSize(path, pageNumber)
         assert iw, ih
 
         if not w and not h:
@@ -756,8 +1787,34 @@ class DrawBotContext(BaseContext):
         """
         return self.b.ImageObject(path=path)
 
+    def getScaledImageCache(self, path):
+        """Answers the ScaledImageCache of the _scaled folder next to the
+        image at path. Use cache.stats() for the hits and misses, and
+        cache.prune() to remove stale and unused scaled images.
+
+        >>> from pagebot.filepaths import getResourcesPath
+        >>> context = DrawBotContext()
+        >>> path = getResourcesPath() + '/images/peppertom.png'
+        >>> cache = context.getScaledImageCache(path)
+        >>> cache.root.endswith('/images/_scaled')
+        True
+        >>> cache is context.getScaledImageCache(path)
+        True
+        """
+        # /_scaled will be ignored with default .gitignore settings.
+        # If docs/images/_scaled need to be committed into Git repo,
+        # then remove _scaled from .gitignore.
+        cachePath = '%s/%s' % (path2Dir(path), self.SCALED_PATH)
+        cache = self.scaledImageCaches.get(cachePath)
+        if cache is None:
+            cache = ScaledImageCache(cachePath, maxSize=self.SCALED_CACHE_SIZE)
+            self.scaledImageCaches[cachePath] = cache
+        return cache
+
     def path2ScaledImagePath(self, path, w, h, index=None, exportExtension=None):
-        """Answers the path to the scaled image.
+        """Answers the path to the scaled image. The file name includes the
+        content hash of the source image, so a changed source makes a new
+        scaled image, instead of answering the old one.
 
         >>> context = DrawBotContext()
         >>> context.path2ScaledImagePath('/xxx/yyy/zzz/This.Is.An.Image.jpg', 110, 120)
@@ -769,17 +1826,9 @@ class DrawBotContext(BaseContext):
         >>> fileName
         'This.Is.An.Image.110x120.0.jpg'
         """
-        # /_scaled will be ignored with default .gitignore settings.
-        # If docs/images/_scaled need to be committed into Git repo,
-        # then remove _scaled from .gitignore.
-        cachePath = '%s/%s/' % (path2Dir(path), self.SCALED_PATH)
-        fileNameParts = path2Name(path).split('.')
-
-        # If undefined, take the original extension for exporting the cache.
-        if not exportExtension:
-            exportExtension = fileNameParts[-1].lower()
-        cachedFileName = '%s.%dx%d.%d.%s' % ('.'.join(fileNameParts[:-1]), w, h, index or 0, exportExtension)
-        return cachePath, cachedFileName
+        cache = self.getScaledImageCache(path)
+        # If undefined, the original extension is taken for the cached file.
+        return cache.root + '/', cache.getFileName(path, w, h, index, exportExtension)
 
     def scaleImage(self, path, w, h, index=None, showImageLoresMarker=False,
             exportExtension=None, force=False):
@@ -804,14 +1853,21 @@ class DrawBotContext(BaseContext):
         >>> scaledImagePath = context.scaleImage(path, 3, 4) # Reall small
         >>> os.path.exists(scaledImagePath)
         True
+        >>> context.scaleImage(path, 3, 4) == scaledImagePath
+        True
+        >>> context.getScaledImageCache(path).hits > 0
+        True
         """
-        # If default _scaled directory does not exist, then create it.
-        cachePath, fileName = self.path2ScaledImagePath(path, w, h, index, exportExtension)
-        if not os.path.exists(cachePath):
-            os.makedirs(cachePath)
-        cachedFilePath = cachePath + fileName
-
-        if force or not os.path.exists(cachedFilePath):
+        cache = self.getScaledImageCache(path)
+        cachedFilePath = None
+        if not force:
+            cachedFilePath = cache.get(path, w, h, index, exportExtension)
+
+        if cachedFilePath is None:
+            # If default _scaled directory does not exist, then create it.
+            if not os.path.exists(cache.root):
+                os.makedirs(cache.root)
+            cachedFilePath = cache.getPath(path, w, h, index, exportExtension)
             # Clean the drawing stack.
             self.newDrawing()
             self.newPage(w=w, h=h)
@@ -824,20 +1880,136 @@ class DrawBotContext(BaseContext):
                 tw, th = bs.size
                 self.text(bs, (w/2-tw/2, h/2-th/4))
             self.saveImage(cachedFilePath)
+            cache.add(path, w, h, index, exportExtension)
 
             # Clean the drawing stack again.
             self.newDrawing()
         return cachedFilePath
 
+    def scaleImages(self, jobs, workers=None, exportExtension=None,
+            force=False):
+        """Scales a batch of images into their cached files, as
+        self.scaleImage does for each single image, but in a pool of worker
+        processes. Each worker draws in its own DrawBot drawing, so the
+        drawing of this context is not touched and pages can already be
+        drawn. Jobs is a list of (path, w, h, index) tuples. Answers the list
+        of ScaleResult instances, with the cached path and the time of each
+        job. Use prescaleReport(results) for a readable summary.
+
+        >>> from pagebot.filepaths import getResourcesPath
+        >>> context = DrawBotContext()
+        >>> path = getResourcesPath() + '/images/peppertom.png'
+        >>> results = context.scaleImages([(path, 300, 400, 0), (path, 30, 40, 0)], force=True)
+        >>> [os.path.exists(result.path) for result in results]
+        [True, True]
+        >>> results[0].path == context.scaleImage(path, 300, 400)
+        True
+        >>> cache = context.getScaledImageCache(path)
+        >>> fileName = os.path.basename(results[1].path)
+        >>> entry = cache.manifest['images'].pop(fileName) # Keep the file.
+        >>> results = context.scaleImages([(path, 30, 40, 0)]) # Exists, not in manifest.
+        >>> results[0].skipped, fileName in cache.manifest['images']
+        (True, True)
+        """
+        scaleJobs = []
+
+        for path, w, h, index in jobs:
+            cachePath, fileName = self.path2ScaledImagePath(path, w, h, index,
+                    exportExtension)
+            scaleJobs.append(ScaleJob(path, w, h, index, target=cachePath + fileName))
+
+        results = prescaleImages(scaleJobs, scaler=drawBotScaleImage,
+                workers=workers, force=force)
+
+        # Register the new scaled images in the manifest of their folder.
+        # Skipped images that exist but are not in the manifest are added
+        # too, otherwise pruning would remove them as unknown files.
+        for (path, w, h, index), result in zip(jobs, results):
+            cache = self.getScaledImageCache(path)
+            if result.skipped:
+                if cache.get(path, w, h, index, exportExtension) is None:
+                    cache.add(path, w, h, index, exportExtension)
+            elif not result.error:
+                cache.add(path, w, h, index, exportExtension)
+
+        return results
+
     def imagePixelColor(self, path, p=None):
         if p is None:
             p = ORIGIN
         ppt = point2D(upt(p))
         return self.b.imagePixelColor(path, ppt)
 
+    def imagePixelColors(self, path, points, pageNumber=0):
+        """Answers the (N, 4) array with the (r, g, b, a) colors of the
+        (N, 2) array of (x, y) points in the image, instead of calling
+        self.imagePixelColor for every point. The image is decoded once into
+        a NumPy buffer and kept by self.pixelSampler. Points outside the
+        image answer NaN.
+
+        >>> from pagebot.filepaths import getResourcesPath
+        >>> context = DrawBotContext()
+        >>> path = getResourcesPath() + '/images/peppertom.png'
+        >>> colors = context.imagePixelColors(path, [(10, 10), (100, 200)])
+        >>> colors.shape
+        (2, 4)
+        >>> r, g, b, a = context.imagePixelColor(path, (10, 10))
+        >>> bool(abs(colors[0] - (r, g, b, a)).max() < 0.02)
+        True
+        """
+        return self.pixelSampler.sample(path, points, index=pageNumber)
+
+    def imageSize(self, path, pageNumber=None):
+        """Answers the size of the image at path. PNG, JPEG, TIFF and PDF
+        sizes are read from the file header, once for each version of the
+        file, by self.imageInfoIndex. Other formats, and the pages of
+        multi-page files that are selected by pageNumber as in self.image,
+        are measured by DrawBot. Use self.imageInfoIndex.save(path) to keep
+        the index for the next run.
+
+        >>> from pagebot.filepaths import getResourcesPath
+        >>> context = DrawBotContext()
+        >>> path = getResourcesPath() + '/images/cookbot1.jpg'
+        >>> context.imageSize(path)
+        (1376pt, 1350pt)
+        >>> context.imageSize(path) == context.b.imageSize(path)
+        True
+        >>> context.imageInfoIndex.hits, context.imageInfoIndex.misses
+        (1, 1)
+        >>> import tempfile
+        >>> pdfPath = os.path.join(tempfile.mkdtemp(), 'pages.pdf')
+        >>> context.b.newDrawing()
+        >>> context.b.newPage(100, 200)
+        >>> context.b.newPage(300, 400)
+        >>> context.b.saveImage(pdfPath)
+        >>> context.b.endDrawing()
+        >>> context.imageSize(pdfPath)
+        (100pt, 200pt)
+        >>> context.imageSize(pdfPath, 2) == pt(context.b.imageSize(pdfPath, pageNumber=2))
+        True
+        """
+        if pageNumber:
+            size = self.b.imageSize(path, pageNumber=pageNumber)
+        else:
+            size = self.imageInfoIndex.imageSize(path)
+            if size is None:
+                size = self.b.imageSize(path)
+        return pt(size)
+
     def numberOfImages(self, path):
-        """Answers the number of images in the file referenced by path."""
-        return self.b.numberOfPages(path)
+        """Answers the number of images in the file referenced by path. The
+        page count is read from the header by self.imageInfoIndex, if
+        possible.
+
+        >>> from pagebot.filepaths import getResourcesPath
+        >>> context = DrawBotContext()
+        >>> context.numberOfImages(getResourcesPath() + '/images/cookbot1.jpg')
+        1
+        """
+        pages = self.imageInfoIndex.numberOfPages(path)
+        if pages is None:
+            pages = self.b.numberOfPages(path)
+        return pages
 
     def translate(self, tx, ty):
         self.b.translate(tx, ty)
@@ -1055,5 +2227,4 @@ class DrawBotContext(BaseContext):
 
 if __name__ == '__main__':
     import doctest
-    import sys
     sys.exit(doctest.testmod()[0])
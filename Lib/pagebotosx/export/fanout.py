@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     fanout.py
+#
+#     Saves one drawing to multiple targets, such as a PDF, PNG previews and
+#     JPG thumbnails. The drawing is rendered once as PDF; the raster targets
+#     are made from that PDF, concurrently in a pool of threads.
+#
+
+import os
+import shutil
+import tempfile
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+
+FORMAT_PDF = 'pdf'
+RASTER_FORMATS = ('png', 'jpg', 'jpeg', 'tif', 'tiff', 'bmp')
+# Raster formats that are written without alpha channel, on white.
+OPAQUE_FORMATS = ('jpg', 'jpeg', 'bmp')
+# Options of raster targets that rasterizers support. Targets with other
+# options are saved by the context.
+RASTER_OPTIONS = ('imageResolution', 'imageJPEGCompressionFactor', 'multipage')
+
+def getFormat(path):
+    """Answers the lowercase extension of path, without the dot.
+
+    >>> getFormat('_export/Catalogue.JPG')
+    'jpg'
+    """
+    return os.path.splitext(path)[1][1:].lower()
+
+def normalizeTargets(targets):
+    """Answers the list of (path, options) of the targets, which can be
+    paths, (path, options) tuples or dictionaries with a path key.
+
+    >>> normalizeTargets(['a.pdf', ('b.png', dict(imageResolution=144)), dict(path='c.jpg')])
+    [('a.pdf', {}), ('b.png', {'imageResolution': 144}), ('c.jpg', {})]
+    """
+    normalized = []
+    for target in targets:
+        if isinstance(target, str):
+            normalized.append((target, {}))
+        elif isinstance(target, dict):
+            options = dict(target)
+            normalized.append((options.pop('path'), options))
+        else:
+            path, options = target
+            normalized.append((path, dict(options or {})))
+    return normalized
+
+def getPagePaths(path, pageCount, multipage=None):
+    """Answers the list of (pageIndex, path) of the pages that are saved in
+    a raster target, following DrawBot saveImage. If multipage is True, all
+    pages are saved, numbered from 1, also if there is only one page.
+    Otherwise, only the last page is saved, as path.
+
+    >>> getPagePaths('_export/Preview.png', 1)
+    [(0, '_export/Preview.png')]
+    >>> getPagePaths('_export/Preview.png', 3)
+    [(2, '_export/Preview.png')]
+    >>> getPagePaths('_export/Preview.png', 3, multipage=True)
+    [(0, '_export/Preview_1.png'), (1, '_export/Preview_2.png'), (2, '_export/Preview_3.png')]
+    >>> getPagePaths('_export/Preview.png', 1, multipage=True)
+    [(0, '_export/Preview_1.png')]
+    """
+    if not multipage:
+        return [(pageCount - 1, path)]
+    base, extension = os.path.splitext(path)
+    return [(index, '%s_%d%s' % (base, index + 1, extension)) for index in range(pageCount)]
+
+class TargetResult:
+    """Saved target path, with the way it was made ('pdf', 'copy', 'raster'
+    or 'context') and the time it took."""
+
+    def __init__(self, path, method, seconds=0):
+        self.path = path
+        self.method = method
+        self.seconds = seconds
+
+    def __repr__(self):
+        return '<%s %s %s>' % (self.__class__.__name__,
+                os.path.basename(self.path), self.method)
+
+def _timed(function, *args):
+    t = perf_counter()
+    function(*args)
+    return perf_counter() - t
+
+def saveTargets(targets, savePDF, rasterize, saveOther, workers=None):
+    """Saves the drawing to all targets. savePDF(path) renders the drawing
+    once as PDF, to the first PDF target or a temporary file. Other PDF
+    targets are copies. Raster targets with supported options are made by
+    rasterize(pdfPath, path, options) in a pool of workers threads (default
+    the number of CPUs). Remaining targets, e.g. SVG or raster targets with
+    other options, are saved by saveOther(path, options). Answers the list of
+    TargetResult in the order of targets.
+
+    >>> root = tempfile.mkdtemp()
+    >>> calls = []
+    >>> def savePDF(path):
+    ...     calls.append('pdf')
+    ...     open(path, 'w').write('PDF')
+    >>> def rasterize(pdfPath, path, options):
+    ...     open(path, 'w').write(open(pdfPath).read() + ' at %d dpi' % options.get('imageResolution', 72))
+    >>> def saveOther(path, options):
+    ...     open(path, 'w').write('Other')
+    >>> targets = [os.path.join(root, 'a.pdf'), (os.path.join(root, 'a.png'), dict(imageResolution=144)),
+    ...     os.path.join(root, 'b.pdf'), os.path.join(root, 'a.jpg'), os.path.join(root, 'a.svg')]
+    >>> results = saveTargets(targets, savePDF, rasterize, saveOther, workers=2)
+    >>> [(os.path.basename(r.path), r.method) for r in results]
+    [('a.pdf', 'pdf'), ('a.png', 'raster'), ('b.pdf', 'copy'), ('a.jpg', 'raster'), ('a.svg', 'context')]
+    >>> calls, open(os.path.join(root, 'a.png')).read(), open(os.path.join(root, 'a.svg')).read()
+    (['pdf'], 'PDF at 144 dpi', 'Other')
+    >>> results = saveTargets([os.path.join(root, 'c.png')], savePDF, rasterize, saveOther)
+    >>> sorted(os.listdir(root)) # Temporary PDF is removed.
+    ['a.jpg', 'a.pdf', 'a.png', 'a.svg', 'b.pdf', 'c.png']
+    """
+    targets = normalizeTargets(targets)
+    results = [None] * len(targets)
+    pdfTargets = []
+    rasterTargets = []
+
+    for index, (path, options) in enumerate(targets):
+        fileFormat = getFormat(path)
+        if fileFormat == FORMAT_PDF and not options:
+            pdfTargets.append(index)
+        elif fileFormat in RASTER_FORMATS and set(options) <= set(RASTER_OPTIONS):
+            rasterTargets.append(index)
+        else:
+            results[index] = TargetResult(path, 'context', _timed(saveOther, path, options))
+
+    if not pdfTargets and not rasterTargets:
+        return results
+
+    tmpDir = None
+    if pdfTargets:
+        pdfPath = targets[pdfTargets[0]][0]
+    else:
+        tmpDir = tempfile.mkdtemp(prefix='pagebot-targets-')
+        pdfPath = os.path.join(tmpDir, 'drawing.pdf')
+
+    try:
+        seconds = _timed(savePDF, pdfPath)
+        for index in pdfTargets:
+            path = targets[index][0]
+            if path == pdfPath:
+                results[index] = TargetResult(path, 'pdf', seconds)
+            else:
+                results[index] = TargetResult(path, 'copy', _timed(shutil.copyfile, pdfPath, path))
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+        jobs = [(rasterize, pdfPath, targets[index][0], targets[index][1]) for index in rasterTargets]
+        if workers > 1 and len(jobs) > 1:
+            with ThreadPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+                times = list(executor.map(lambda job: _timed(*job), jobs))
+        else:
+            times = [_timed(*job) for job in jobs]
+        for index, seconds in zip(rasterTargets, times):
+            results[index] = TargetResult(targets[index][0], 'raster', seconds)
+    finally:
+        if tmpDir is not None:
+            shutil.rmtree(tmpDir, ignore_errors=True)
+
+    return results
+
+# Uniform type identifiers of the raster formats for ImageIO.
+RASTER_UTIS = {'png': 'public.png', 'jpg': 'public.jpeg', 'jpeg': 'public.jpeg',
+        'tif': 'public.tiff', 'tiff': 'public.tiff', 'bmp': 'com.microsoft.bmp'}
+
+def getRasterProperties(options):
+    """Answers the ImageIO properties of raster files with the options
+    imageResolution (default 72) and imageJPEGCompressionFactor."""
+    from Quartz import (kCGImageDestinationLossyCompressionQuality,
+        kCGImagePropertyDPIWidth, kCGImagePropertyDPIHeight)
+
+    resolution = options.get('imageResolution', 72)
+    properties = {kCGImagePropertyDPIWidth: resolution,
+            kCGImagePropertyDPIHeight: resolution}
+    if options.get('imageJPEGCompressionFactor') is not None:
+        properties[kCGImageDestinationLossyCompressionQuality] = options['imageJPEGCompressionFactor']
+    return properties
+
+def createRasterBitmap(w, h, opaque):
+    """Answers the CoreGraphics bitmap context of w by h pixels that pages
+    are rendered into: RGB on white if opaque, otherwise RGBA with
+    premultiplied alpha."""
+    from Quartz import (CGBitmapContextCreate, CGColorSpaceCreateDeviceRGB,
+        kCGImageAlphaPremultipliedLast, kCGImageAlphaNoneSkipLast,
+        CGContextSetRGBFillColor, CGContextFillRect, CGRectMake)
+
+    alphaInfo = kCGImageAlphaNoneSkipLast if opaque else kCGImageAlphaPremultipliedLast
+    bitmap = CGBitmapContextCreate(None, w, h, 8, 0, CGColorSpaceCreateDeviceRGB(), alphaInfo)
+    if opaque:
+        CGContextSetRGBFillColor(bitmap, 1, 1, 1, 1)
+        CGContextFillRect(bitmap, CGRectMake(0, 0, w, h))
+    return bitmap
+
+def writeRasterImage(image, path, properties):
+    """Encodes the CGImage as the raster file path by ImageIO."""
+    from Foundation import NSURL
+    from Quartz import (CGImageDestinationCreateWithURL,
+        CGImageDestinationAddImage, CGImageDestinationFinalize)
+
+    destination = CGImageDestinationCreateWithURL(NSURL.fileURLWithPath_(path),
+            RASTER_UTIS[getFormat(path)], 1, None)
+    CGImageDestinationAddImage(destination, image, properties)
+    assert CGImageDestinationFinalize(destination), 'Cannot write %s' % path
+
+def rasterizePDF(pdfPath, path, options):
+    """Renders the pages of the PDF file into the raster image file path,
+    with CoreGraphics and ImageIO, which can run in multiple threads. The
+    options imageResolution (default 72), imageJPEGCompressionFactor and
+    multipage are the same as of DrawBot saveImage."""
+    from Foundation import NSURL
+    from Quartz import (CGPDFDocumentCreateWithURL, CGPDFDocumentGetNumberOfPages,
+        CGPDFDocumentGetPage, CGPDFPageGetBoxRect, kCGPDFMediaBox,
+        CGContextScaleCTM, CGContextTranslateCTM, CGContextDrawPDFPage,
+        CGBitmapContextCreateImage)
+
+    scale = options.get('imageResolution', 72) / 72
+    opaque = getFormat(path) in OPAQUE_FORMATS
+    properties = getRasterProperties(options)
+
+    document = CGPDFDocumentCreateWithURL(NSURL.fileURLWithPath_(pdfPath))
+    pageCount = CGPDFDocumentGetNumberOfPages(document)
+
+    for pageIndex, pagePath in getPagePaths(path, pageCount, options.get('multipage')):
+        page = CGPDFDocumentGetPage(document, pageIndex + 1)
+        box = CGPDFPageGetBoxRect(page, kCGPDFMediaBox)
+        w = int(round(box.size.width * scale))
+        h = int(round(box.size.height * scale))
+        bitmap = createRasterBitmap(w, h, opaque)
+        CGContextScaleCTM(bitmap, scale, scale)
+        CGContextTranslateCTM(bitmap, -box.origin.x, -box.origin.y)
+        CGContextDrawPDFPage(bitmap, page)
+        writeRasterImage(CGBitmapContextCreateImage(bitmap), pagePath, properties)
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
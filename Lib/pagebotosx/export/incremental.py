@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     incremental.py
+#
+#     Incremental export of multi-page documents. Each page is drawn with a
+#     recording builder that fingerprints the drawing calls and their inputs,
+#     including the content of image and font files. Rendered pages are kept
+#     in a cache folder under their fingerprint, so only pages that changed
+#     since the previous export are rendered again before the output file is
+#     assembled.
+#
+
+import os
+import json
+import hashlib
+from time import time, perf_counter
+from pagebotosx.images.scaledcache import getFileHash
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+class PageFingerprint:
+    """SHA-256 hash of the drawing calls of a page. Call arguments are
+    serialized recursively; strings that are paths of existing files also
+    add the content hash of the file, answered by fileHash(path). Other
+    objects are converted by the function in converters of the first class
+    name in their MRO, or else by repr. Objects with an address in their
+    repr give a different fingerprint each time, so their pages are always
+    rendered.
+
+    >>> a = PageFingerprint()
+    >>> a.add('newPage', (595, 842))
+    >>> a.add('text', ('Page 1', (50, 50)), dict(align='left'))
+    >>> b = PageFingerprint()
+    >>> b.add('newPage', (595, 842))
+    >>> b.add('text', ('Page 1', (50, 50)), dict(align='left'))
+    >>> a.hexdigest() == b.hexdigest(), a.calls
+    (True, 2)
+    >>> b.add('fill', (1, 0, 0))
+    >>> a.hexdigest() == b.hexdigest()
+    False
+    >>> class Color:
+    ...     def __init__(self, r):
+    ...         self.r = r
+    >>> converters = dict(Color=lambda color: ('Color', color.r))
+    >>> fingerprints = []
+    >>> for color in (Color(1), Color(1), Color(0.5)):
+    ...     fingerprint = PageFingerprint(converters=converters)
+    ...     fingerprint.add('fill', (color,))
+    ...     fingerprints.append(fingerprint.hexdigest())
+    >>> fingerprints[0] == fingerprints[1], fingerprints[0] == fingerprints[2]
+    (True, False)
+    """
+
+    def __init__(self, fileHash=getFileHash, converters=None, salt=''):
+        self.fileHash = fileHash
+        self.converters = converters or {}
+        self.calls = 0
+        self._hash = hashlib.sha256(salt.encode('utf-8'))
+
+    def add(self, name, args=(), kwargs=None):
+        """Adds the call of name with args and kwargs."""
+        self.calls += 1
+        self._update('%s(' % name)
+        self.update(tuple(args))
+        self.update(kwargs or {})
+        self._update(')\n')
+
+    def update(self, value):
+        """Adds the serialized value."""
+        if value is None or isinstance(value, (bool, int, float)):
+            self._update(repr(value))
+        elif isinstance(value, str):
+            self._update(repr(value))
+            if os.path.isfile(value):
+                self._update('#' + self.fileHash(value))
+        elif isinstance(value, bytes):
+            self._update('b#' + hashlib.sha256(value).hexdigest())
+        elif isinstance(value, (list, tuple)):
+            self._update('(')
+            for item in value:
+                self.update(item)
+                self._update(',')
+            self._update(')')
+        elif isinstance(value, dict):
+            self._update('{')
+            for key in sorted(value, key=str):
+                self.update(key)
+                self._update(':')
+                self.update(value[key])
+                self._update(',')
+            self._update('}')
+        elif hasattr(value, '__fspath__'):
+            self.update(os.fspath(value))
+        else:
+            for cls in type(value).__mro__:
+                converter = self.converters.get(cls.__name__)
+                if converter is not None:
+                    self.update(converter(value))
+                    break
+            else:
+                self._update(repr(value))
+
+    def _update(self, s):
+        self._hash.update(s.encode('utf-8', 'surrogatepass'))
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+class RecordingBuilder:
+    """Wraps a builder, e.g. the drawBot module, and adds all calls of its
+    functions to the fingerprint before they are executed. Other attributes
+    are answered unchanged.
+
+    >>> import math
+    >>> fingerprint = PageFingerprint()
+    >>> b = RecordingBuilder(math, fingerprint)
+    >>> b.floor(2.5), b.pi == math.pi, fingerprint.calls
+    (2, True, 1)
+    """
+
+    def __init__(self, builder, fingerprint):
+        self._builder = builder
+        self._fingerprint = fingerprint
+
+    def __getattr__(self, name):
+        value = getattr(self._builder, name)
+        if not callable(value):
+            return value
+        def record(*args, **kwargs):
+            self._fingerprint.add(name, args, kwargs)
+            return value(*args, **kwargs)
+        return record
+
+class PageCache:
+    """Folder of rendered pages, each a file named by the fingerprint of the
+    page, with a JSON manifest that keeps the content hashes of the input
+    files for their (modification time, size), and the fingerprints of the
+    pages of the last export.
+
+    >>> import tempfile
+    >>> root = tempfile.mkdtemp()
+    >>> cache = PageCache(root)
+    >>> path = os.path.join(root, 'a.txt')
+    >>> with open(path, 'w') as f:
+    ...     _ = f.write('PageBot')
+    >>> cache.fileHash(path)[:16], cache.fileHash(path) == getFileHash(path)
+    ('0d3fb409fc6298ec', True)
+    >>> cache.getPath('0123abcd', '.pdf') == os.path.join(root, '0123abcd.pdf')
+    True
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.manifest = self._readManifest()
+
+    def __repr__(self):
+        return '<%s %s %d pages>' % (self.__class__.__name__, self.root,
+                len(self.manifest['pages']))
+
+    def _get_manifestPath(self):
+        return os.path.join(self.root, MANIFEST_NAME)
+    manifestPath = property(_get_manifestPath)
+
+    def _readManifest(self):
+        try:
+            with open(self.manifestPath) as f:
+                manifest = json.load(f)
+            if manifest.get('version') == MANIFEST_VERSION:
+                return manifest
+        except (OSError, ValueError):
+            pass
+        return dict(version=MANIFEST_VERSION, pages=[], files={})
+
+    def save(self):
+        """Writes the manifest, replacing the file in one step."""
+        os.makedirs(self.root, exist_ok=True)
+        tmpPath = self.manifestPath + '.tmp'
+        with open(tmpPath, 'w') as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(tmpPath, self.manifestPath)
+
+    def fileHash(self, path):
+        """Answers the content hash of the file at path. The file is read
+        again only if its modification time or size changed."""
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        entry = self.manifest['files'].get(key)
+        if entry is not None and entry[:2] == [stat.st_mtime_ns, stat.st_size]:
+            return entry[2]
+        fileHash = getFileHash(path)
+        self.manifest['files'][key] = [stat.st_mtime_ns, stat.st_size, fileHash]
+        return fileHash
+
+    def getPath(self, fingerprint, extension):
+        """Answers the path of the rendered page with fingerprint."""
+        return os.path.join(self.root, fingerprint + extension)
+
+    def prune(self, fingerprints, extension):
+        """Removes the rendered pages that are not in fingerprints, and the
+        file hashes of files that no longer exist. Answers the number of
+        removed pages."""
+        keep = set(fingerprint + extension for fingerprint in fingerprints)
+        removed = 0
+        for fileName in os.listdir(self.root):
+            if fileName.endswith(extension) and fileName not in keep:
+                os.remove(os.path.join(self.root, fileName))
+                removed += 1
+        for path in list(self.manifest['files']):
+            if not os.path.exists(path):
+                del self.manifest['files'][path]
+        return removed
+
+class IncrementalReport:
+    """Result of an incremental export, with the indices of the rendered
+    pages and the time it took."""
+
+    def __init__(self, path, pageCount, rendered, seconds, removed=0):
+        self.path = path
+        self.pageCount = pageCount
+        self.rendered = rendered
+        self.seconds = seconds
+        self.removed = removed
+
+    def _get_reused(self):
+        return self.pageCount - len(self.rendered)
+    reused = property(_get_reused)
+
+    def __repr__(self):
+        return '<%s %d pages, %d rendered, %d reused>' % (self.__class__.__name__,
+                self.pageCount, len(self.rendered), self.reused)
+
+    def __str__(self):
+        return '%s: %d pages, rendered %d, reused %d, %0.1f ms' % (
+            os.path.basename(self.path), self.pageCount, len(self.rendered),
+            self.reused, self.seconds * 1000)
+
+def incrementalPages(path, pageCount, drawPage, savePage, writerClass,
+        cachePath, salt=''):
+    """Exports the pageCount pages as the file path, rendering only pages
+    that changed since the previous export with the same cachePath. For each
+    page index, drawPage(index, fingerprint) draws the page and adds its
+    drawing calls to the PageFingerprint. If there is no rendered page with
+    the same fingerprint in the cache, savePage(path) saves the drawn page.
+    The rendered pages are appended in order by the writer. Salt, e.g. the
+    version of the renderer, is part of all fingerprints. Answers an
+    IncrementalReport.
+
+    >>> import tempfile
+    >>> from pagebotosx.export.streaming import TextStreamWriter
+    >>> root = tempfile.mkdtemp()
+    >>> path = os.path.join(root, 'catalogue.txt')
+    >>> cachePath = os.path.join(root, '_pages')
+    >>> pages = ['Page %d' % (index + 1) for index in range(10)]
+    >>> drawn = []
+    >>> def drawPage(index, fingerprint):
+    ...     drawn[:] = [pages[index]]
+    ...     fingerprint.add('text', (pages[index], (50, 50)))
+    >>> def savePage(pagePath):
+    ...     with open(pagePath, 'w') as f:
+    ...         _ = f.write(drawn[0] + chr(10))
+    >>> incrementalPages(path, 10, drawPage, savePage, TextStreamWriter, cachePath)
+    <IncrementalReport 10 pages, 10 rendered, 0 reused>
+    >>> pages[3] = 'Page 4, changed'
+    >>> report = incrementalPages(path, 10, drawPage, savePage, TextStreamWriter, cachePath)
+    >>> report, report.rendered, report.removed
+    (<IncrementalReport 10 pages, 1 rendered, 9 reused>, [3], 1)
+    >>> open(path).read().split(chr(10))[2:5]
+    ['Page 3', 'Page 4, changed', 'Page 5']
+    >>> incrementalPages(path, 10, drawPage, savePage, TextStreamWriter, cachePath, salt='2')
+    <IncrementalReport 10 pages, 10 rendered, 0 reused>
+    """
+    t = perf_counter()
+    extension = os.path.splitext(path)[1]
+    cache = PageCache(cachePath)
+    os.makedirs(cachePath, exist_ok=True)
+    writer = writerClass(path)
+    fingerprints = []
+    rendered = []
+
+    try:
+        for index in range(pageCount):
+            fingerprint = PageFingerprint(cache.fileHash, salt=salt)
+            drawPage(index, fingerprint)
+            fingerprint = fingerprint.hexdigest()
+            pagePath = cache.getPath(fingerprint, extension)
+            if not os.path.exists(pagePath):
+                # Save next to the page, so an interrupted export never
+                # leaves a partial page in the cache.
+                tmpPath = os.path.join(cachePath, 'page.tmp' + extension)
+                savePage(tmpPath)
+                os.replace(tmpPath, pagePath)
+                rendered.append(index)
+            writer.appendFile(pagePath)
+            fingerprints.append(fingerprint)
+    finally:
+        writer.close()
+
+    cache.manifest['pages'] = fingerprints
+    cache.manifest['exported'] = time()
+    removed = cache.prune(fingerprints, extension)
+    cache.save()
+    return IncrementalReport(path, pageCount, rendered, perf_counter() - t,
+            removed=removed)
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
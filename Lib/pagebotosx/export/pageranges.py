@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     pageranges.py
+#
+#     Parallel export of a multi-page document. The pages are split into
+#     ranges, each range is drawn and saved in its own worker process, with
+#     its own drawing, and the files of the ranges are merged in page order.
+#
+#     Pages are drawn by a drawPages(context, start, end) function that draws
+#     pages start up to end into the context. It runs in the workers, so it
+#     must be a module level function (picklable) that builds what it needs,
+#     e.g. the Document, by itself.
+#
+
+import os
+import shutil
+import tempfile
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+
+def splitPageRanges(pageCount, workers, rangeSize=None):
+    """Answers the list of (start, end) page ranges of about equal size.
+    Without rangeSize, there are two ranges for each worker, so that a slow
+    range does not keep the other workers waiting. Otherwise ranges have at
+    most rangeSize pages.
+
+    >>> splitPageRanges(10, 2)
+    [(0, 3), (3, 6), (6, 8), (8, 10)]
+    >>> splitPageRanges(10, 4, rangeSize=6)
+    [(0, 5), (5, 10)]
+    >>> splitPageRanges(3, 8)
+    [(0, 1), (1, 2), (2, 3)]
+    >>> splitPageRanges(0, 4)
+    []
+    """
+    if pageCount <= 0:
+        return []
+    if rangeSize is None:
+        count = min(pageCount, max(1, workers) * 2)
+    else:
+        count = (pageCount + rangeSize - 1) // rangeSize
+    size, rest = divmod(pageCount, count)
+    ranges = []
+    start = 0
+    for index in range(count):
+        end = start + size + (1 if index < rest else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+def renderDrawBotRange(drawPages, start, end, path):
+    """Draws the pages start up to end with drawPages in a new DrawBotContext
+    and saves them as path. Only to be called in a worker process, as it
+    replaces the drawing of the process."""
+    from pagebotosx.contexts.drawbotcontext.drawbotcontext import DrawBotContext
+    context = DrawBotContext()
+    context.newDrawing()
+    drawPages(context, start, end)
+    context.saveDrawing(path)
+    context.endDrawing()
+
+def mergePDFs(paths, path):
+    """Merges the PDF files of paths, in order, into the PDF file path, using
+    PDFKit."""
+    from Foundation import NSURL
+    from Quartz import PDFDocument
+
+    merged = PDFDocument.alloc().init()
+    for rangePath in paths:
+        document = PDFDocument.alloc().initWithURL_(NSURL.fileURLWithPath_(rangePath))
+        for index in range(document.pageCount()):
+            merged.insertPage_atIndex_(document.pageAtIndex_(index), merged.pageCount())
+    assert merged.writeToFile_(path), 'Cannot write %s' % path
+
+def drawNumberedPages(context, start, end, w=595, h=842):
+    """Example drawPages function, draws pages with their page number."""
+    for pageIndex in range(start, end):
+        context.newPage(w, h)
+        context.text(context.newString('Page %d' % (pageIndex + 1)), (50, 50))
+
+def renderTextRange(drawPages, start, end, path):
+    """Stand-in for renderDrawBotRange that writes one line for each page,
+    so that splitting, workers and merging run without DrawBot."""
+    with open(path, 'w') as f:
+        for pageIndex in range(start, end):
+            f.write('Page %d\n' % (pageIndex + 1))
+
+def mergeTextFiles(paths, path):
+    """Stand-in for mergePDFs that concatenates the files."""
+    with open(path, 'wb') as f:
+        for rangePath in paths:
+            with open(rangePath, 'rb') as rangeFile:
+                shutil.copyfileobj(rangeFile, f)
+
+class RangeResult:
+    """Page range (start, end) that was saved as path, with the time it
+    took."""
+
+    def __init__(self, start, end, path, seconds=0):
+        self.start = start
+        self.end = end
+        self.path = path
+        self.seconds = seconds
+
+    def __repr__(self):
+        return '<%s pages %d-%d %0.1f ms>' % (self.__class__.__name__,
+                self.start + 1, self.end, self.seconds * 1000)
+
+class ExportReport:
+    """Timing of a parallel export. If serialSeconds is defined, speedup is
+    the serial time divided by the parallel time."""
+
+    def __init__(self, path, pageCount, workers, ranges, seconds,
+            mergeSeconds=0, serialSeconds=None):
+        self.path = path
+        self.pageCount = pageCount
+        self.workers = workers
+        self.ranges = ranges
+        self.seconds = seconds
+        self.mergeSeconds = mergeSeconds
+        self.serialSeconds = serialSeconds
+
+    def _get_speedup(self):
+        if self.serialSeconds is None or not self.seconds:
+            return None
+        return self.serialSeconds / self.seconds
+    speedup = property(_get_speedup)
+
+    def __repr__(self):
+        return '<%s %d pages, %d ranges, %d workers>' % (self.__class__.__name__,
+                self.pageCount, len(self.ranges), self.workers)
+
+    def __str__(self):
+        lines = ['%s: %d pages in %d ranges on %d workers' % (
+            os.path.basename(self.path), self.pageCount, len(self.ranges), self.workers)]
+        for result in self.ranges:
+            lines.append('    pages %4d-%-4d %10.1f ms' % (result.start + 1,
+                result.end, result.seconds * 1000))
+        lines.append('    merge %20.1f ms' % (self.mergeSeconds * 1000))
+        lines.append('    parallel %17.1f ms' % (self.seconds * 1000))
+        if self.serialSeconds is not None:
+            lines.append('    serial %19.1f ms' % (self.serialSeconds * 1000))
+            lines.append('    speedup %18.2fx' % self.speedup)
+        return '\n'.join(lines)
+
+def _renderRange(renderRange, drawPages, start, end, path):
+    t = perf_counter()
+    renderRange(drawPages, start, end, path)
+    return RangeResult(start, end, path, perf_counter() - t)
+
+def exportPageRanges(path, pageCount, drawPages, workers=None, rangeSize=None,
+        renderRange=renderDrawBotRange, mergeFiles=mergePDFs, compare=False):
+    """Exports the pageCount pages that drawPages draws as the file path, in
+    page ranges that are rendered by a pool of worker processes (default the
+    number of CPUs) and then merged in page order. Ranges are always
+    rendered in workers, also with a single worker or range, so the drawing
+    of this process is not touched. If compare is True, the document is also
+    exported serially, as a single range in one worker, for the speedup in
+    the answered ExportReport.
+
+    >>> root = tempfile.mkdtemp()
+    >>> path = os.path.join(root, 'catalogue.txt')
+    >>> report = exportPageRanges(path, 10, None, workers=2,
+    ...     renderRange=renderTextRange, mergeFiles=mergeTextFiles, compare=True)
+    >>> report, [(r.start, r.end) for r in report.ranges]
+    (<ExportReport 10 pages, 4 ranges, 2 workers>, [(0, 3), (3, 6), (6, 8), (8, 10)])
+    >>> open(path).read().split(chr(10))[:-1] == ['Page %d' % (i+1) for i in range(10)]
+    True
+    >>> report.speedup > 0
+    True
+    >>> sorted(os.listdir(root)) # Range files are removed.
+    ['catalogue.txt']
+    >>> exportPageRanges(path, 1, None, workers=1,
+    ...     renderRange=renderTextRange, mergeFiles=mergeTextFiles)
+    <ExportReport 1 pages, 1 ranges, 1 workers>
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    serialSeconds = None
+    if compare:
+        # Single range in a single worker, so the drawing of this process
+        # is not touched.
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            serialSeconds = executor.submit(_renderRange, renderRange,
+                    drawPages, 0, pageCount, path).result().seconds
+
+    extension = os.path.splitext(path)[1]
+    tmpDir = tempfile.mkdtemp(prefix='pagebot-ranges-')
+    ranges = splitPageRanges(pageCount, workers, rangeSize)
+    rangePaths = [os.path.join(tmpDir, 'range-%05d%s' % (index, extension))
+            for index in range(len(ranges))]
+
+    try:
+        t = perf_counter()
+        # Rendering a range replaces the drawing of its process, so even a
+        # single range runs in a worker.
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(ranges)))) as executor:
+            futures = [executor.submit(_renderRange, renderRange, drawPages,
+                start, end, rangePath) for (start, end), rangePath in zip(ranges, rangePaths)]
+            results = [future.result() for future in futures]
+
+        tMerge = perf_counter()
+        mergeFiles(rangePaths, path)
+        mergeSeconds = perf_counter() - tMerge
+        seconds = perf_counter() - t
+    finally:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+
+    return ExportReport(path, pageCount, workers, results, seconds,
+            mergeSeconds=mergeSeconds, serialSeconds=serialSeconds)
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
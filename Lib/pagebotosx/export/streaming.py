@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     streaming.py
+#
+#     Streaming export of long documents. Pages are drawn in chunks; each
+#     chunk is saved, appended to the output file and then released, so the
+#     memory depends on the chunk size instead of on the number of pages.
+#
+
+import os
+import sys
+import shutil
+import tempfile
+import resource
+from time import perf_counter
+
+# Number of pages drawn in memory before they are written.
+DEFAULT_CHUNK_SIZE = 16
+
+def getPeakRSS():
+    """Answers the peak resident memory of this process in bytes.
+
+    >>> getPeakRSS() > 0
+    True
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak # Bytes on OS X.
+    return peak * 1024 # Kilobytes on Linux.
+
+class PDFStreamWriter:
+    """Writes the pages of PDF files, appended one file at a time, into a
+    single PDF file, through a CoreGraphics PDF context. Pages are written
+    when they are appended; only the open page is kept in memory. Drawing a
+    page does not copy its annotations, so the links of DrawBot linkURL and
+    linkRect are added again. Links to destinations in other appended files
+    cannot be resolved and are left out."""
+
+    def __init__(self, path):
+        from Foundation import NSURL
+        from Quartz import CGPDFContextCreateWithURL
+        self.path = path
+        self.pageCount = 0
+        self._context = CGPDFContextCreateWithURL(NSURL.fileURLWithPath_(path), None, None)
+
+    def appendFile(self, path):
+        """Appends all pages of the PDF file at path, with their links. The
+        PDFKit objects of the file are released when it is appended, so the
+        memory does not grow with the number of appended files."""
+        import objc
+        from Foundation import NSURL
+        from Quartz import (PDFDocument, CGPDFPageGetBoxRect, kCGPDFMediaBox,
+            CGContextBeginPage, CGContextDrawPDFPage, CGContextEndPage,
+            CGPDFContextSetURLForRect, CGPDFContextAddDestinationAtPoint,
+            CGPDFContextSetDestinationForRect)
+
+        with objc.autorelease_pool():
+            document = PDFDocument.alloc().initWithURL_(NSURL.fileURLWithPath_(path))
+            pages = [document.pageAtIndex_(index) for index in range(document.pageCount())]
+            links, destinations = self._getLinks(document, pages)
+
+            for pageIndex, page in enumerate(pages):
+                pageRef = page.pageRef()
+                CGContextBeginPage(self._context, CGPDFPageGetBoxRect(pageRef, kCGPDFMediaBox))
+                CGContextDrawPDFPage(self._context, pageRef)
+                for name, point in destinations.get(pageIndex, {}).items():
+                    CGPDFContextAddDestinationAtPoint(self._context, name, point)
+                for url, name, rect in links[pageIndex]:
+                    if url is not None:
+                        CGPDFContextSetURLForRect(self._context, url, rect)
+                    else:
+                        CGPDFContextSetDestinationForRect(self._context, name, rect)
+                CGContextEndPage(self._context)
+                self.pageCount += 1
+            del document, pages, links, destinations
+
+    def _getLinks(self, document, pages):
+        """Answers the list of (url, destinationName, rect) links of each
+        page and the {destinationName: point} destinations by page index.
+        Destination names are unique in the output file."""
+        links = []
+        destinations = {}
+
+        for page in pages:
+            pageLinks = []
+            for annotation in page.annotations() or ():
+                url = annotation.URL()
+                destination = annotation.destination()
+                if url is not None:
+                    pageLinks.append((url, None, annotation.bounds()))
+                elif destination is not None and destination.page() is not None:
+                    targetIndex = document.indexForPage_(destination.page())
+                    point = destination.point()
+                    name = 'page%d-%g-%g' % (self.pageCount + targetIndex + 1,
+                            point.x, point.y)
+                    destinations.setdefault(targetIndex, {})[name] = point
+                    pageLinks.append((None, name, annotation.bounds()))
+            links.append(pageLinks)
+
+        return links, destinations
+
+    def close(self):
+        from Quartz import CGPDFContextClose
+        CGPDFContextClose(self._context)
+        self._context = None
+
+class TextStreamWriter:
+    """Stand-in for PDFStreamWriter that appends the content of text files,
+    so that the chunking runs without OS X."""
+
+    def __init__(self, path):
+        self.path = path
+        self.pageCount = 0
+        self._file = open(path, 'w')
+
+    def appendFile(self, path):
+        with open(path) as f:
+            for line in f:
+                self._file.write(line)
+                self.pageCount += 1
+
+    def close(self):
+        self._file.close()
+
+class StreamReport:
+    """Result of a streaming export, with the number of pages and chunks,
+    and the time. PeakRSS is the peak resident memory in bytes of the whole
+    process since it started, not of this export only; to measure an
+    export, run it in a new process, as scripts/benchmarks/exportmemory.py
+    does."""
+
+    def __init__(self, path, pageCount, chunks, seconds, peakRSS):
+        self.path = path
+        self.pageCount = pageCount
+        self.chunks = chunks
+        self.seconds = seconds
+        self.peakRSS = peakRSS
+
+    def __repr__(self):
+        return '<%s %d pages, %d chunks>' % (self.__class__.__name__,
+                self.pageCount, self.chunks)
+
+    def __str__(self):
+        return '%s: %d pages in %d chunks, %0.1f ms, process peak RSS %0.1f MB' % (
+            os.path.basename(self.path), self.pageCount, self.chunks,
+            self.seconds * 1000, self.peakRSS / 1024 / 1024)
+
+def streamPages(path, pageCount, drawPages, renderChunk, writerClass,
+        chunkSize=DEFAULT_CHUNK_SIZE):
+    """Exports the pageCount pages of drawPages as the file path, chunkSize
+    pages at a time. For each chunk, renderChunk(drawPages, start, end,
+    chunkPath) draws and saves the pages start up to end, which are then
+    appended by the writer and removed. Both release the objects of the
+    chunk before the next chunk, renderChunk and PDFStreamWriter in an
+    autorelease pool. Answers a StreamReport.
+
+    Links are kept by PDFStreamWriter, except links to destinations in other
+    chunks, which DrawBot cannot resolve when it saves a chunk.
+
+    >>> from pagebotosx.export.pageranges import renderTextRange
+    >>> root = tempfile.mkdtemp()
+    >>> path = os.path.join(root, 'catalogue.txt')
+    >>> report = streamPages(path, 10, None, renderTextRange, TextStreamWriter, chunkSize=4)
+    >>> report
+    <StreamReport 10 pages, 3 chunks>
+    >>> open(path).read().split(chr(10))[:-1] == ['Page %d' % (i+1) for i in range(10)]
+    True
+    >>> os.listdir(root)
+    ['catalogue.txt']
+    """
+    t = perf_counter()
+    tmpDir = tempfile.mkdtemp(prefix='pagebot-stream-')
+    chunkPath = os.path.join(tmpDir, 'chunk' + os.path.splitext(path)[1])
+    writer = writerClass(path)
+    chunks = 0
+
+    try:
+        for start in range(0, pageCount, chunkSize):
+            end = min(pageCount, start + chunkSize)
+            renderChunk(drawPages, start, end, chunkPath)
+            writer.appendFile(chunkPath)
+            os.remove(chunkPath)
+            chunks += 1
+    finally:
+        writer.close()
+        shutil.rmtree(tmpDir, ignore_errors=True)
+
+    assert writer.pageCount == pageCount, 'Wrote %d of %d pages' % (writer.pageCount, pageCount)
+    return StreamReport(path, pageCount, chunks, perf_counter() - t, getPeakRSS())
+
+if __name__ == '__main__':
+    import doctest
+    sys.exit(doctest.testmod()[0])
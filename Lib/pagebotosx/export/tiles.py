@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     tiles.py
+#
+#     Tiled raster export of large images. The image is split into square
+#     tiles, which are rendered by worker processes. Rows of tiles are put
+#     together in order into bands of scanlines and written to the encoder,
+#     so the memory depends on the tile size and the number of workers
+#     instead of on the size of the image.
+#
+#     Tiles are rendered by a renderTile(source, x, y, w, h) function that
+#     answers the (h, w, 4) uint8 pixels of the rectangle (x, y, w, h) of the
+#     image, with y counted from the top row. It runs in the workers, so it
+#     must be a module level function (picklable). Each pixel only depends on
+#     its position in the image, so a tiled export is identical to a single
+#     tile of the whole image. PDF pages are rendered by renderPDFTile into
+#     the same bitmaps as rasterizePDF and encoded by the same ImageIO
+#     destination, so a tiled page is identical to the rasterized page.
+#
+
+import os
+import zlib
+import struct
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy
+from pagebotosx.export.fanout import (getFormat, getRasterProperties,
+        createRasterBitmap, writeRasterImage, OPAQUE_FORMATS)
+
+HAS_PIL = True
+
+try:
+    from PIL import Image
+except ImportError:
+    HAS_PIL = False
+
+# Width and height of tiles in pixels.
+DEFAULT_TILE_SIZE = 1024
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+def splitTiles(w, h, tileSize=DEFAULT_TILE_SIZE):
+    """Answers the rows of (x, y, w, h) tiles of an image of w by h pixels,
+    top row first. Tiles at the right and bottom can be smaller. Without
+    tileSize, the whole image is a single tile.
+
+    >>> splitTiles(5, 3, 2)
+    [[(0, 0, 2, 2), (2, 0, 2, 2), (4, 0, 1, 2)], [(0, 2, 2, 1), (2, 2, 2, 1), (4, 2, 1, 1)]]
+    >>> splitTiles(5, 3)
+    [[(0, 0, 5, 3)]]
+    >>> splitTiles(5, 3, None)
+    [[(0, 0, 5, 3)]]
+    """
+    tw = th = tileSize or max(w, h, 1)
+    return [[(x, y, min(tw, w - x), min(th, h - y)) for x in range(0, w, tw)]
+            for y in range(0, h, th)]
+
+def renderPatternTile(source, x, y, w, h):
+    """Stand-in for renderPDFTile that answers a pattern of colors made from
+    the position of each pixel in the image, so that tiling, workers and
+    encoding run without OS X.
+
+    >>> renderPatternTile(None, 3, 1, 2, 1).tolist()
+    [[[5, 3, 24, 255], [6, 3, 32, 255]]]
+    """
+    ys, xs = numpy.mgrid[y:y+h, x:x+w]
+    pixels = numpy.empty((h, w, 4), dtype=numpy.uint8)
+    pixels[..., 0] = (xs + 2 * ys) % 256
+    pixels[..., 1] = (3 * ys) % 256
+    pixels[..., 2] = (xs * 8) % 256
+    pixels[..., 3] = 255
+    return pixels
+
+def getPDFPageSize(pdfPath, pageNumber=1, imageResolution=72):
+    """Answers the (w, h) in pixels of the page of the PDF file at
+    imageResolution, rounded as in rasterizePDF."""
+    from Foundation import NSURL
+    from Quartz import (CGPDFDocumentCreateWithURL, CGPDFDocumentGetPage,
+        CGPDFPageGetBoxRect, kCGPDFMediaBox)
+
+    document = CGPDFDocumentCreateWithURL(NSURL.fileURLWithPath_(pdfPath))
+    box = CGPDFPageGetBoxRect(CGPDFDocumentGetPage(document, pageNumber), kCGPDFMediaBox)
+    scale = imageResolution / 72
+    return int(round(box.size.width * scale)), int(round(box.size.height * scale))
+
+def renderPDFTile(source, x, y, w, h):
+    """Renders the tile (x, y, w, h) of a page of a PDF file with
+    CoreGraphics. Source is (pdfPath, pageNumber, imageResolution, opaque).
+    The tile is drawn into the bitmap of rasterizePDF, in the device space
+    of the whole page moved by whole pixels, so the tile has the same pixels
+    as the page. Answers the (h, w, 4) uint8 pixels of the bitmap,
+    premultiplied RGBA, or RGBX if opaque, to be written by an
+    ImageIOTileWriter."""
+    from Foundation import NSURL
+    from Quartz import (CGPDFDocumentCreateWithURL, CGPDFDocumentGetPage,
+        CGPDFPageGetBoxRect, kCGPDFMediaBox, CGContextScaleCTM,
+        CGContextTranslateCTM, CGContextDrawPDFPage, CGBitmapContextCreateImage,
+        CGImageGetBytesPerRow, CGImageGetDataProvider, CGDataProviderCopyData)
+
+    pdfPath, pageNumber, imageResolution, opaque = source
+    document = CGPDFDocumentCreateWithURL(NSURL.fileURLWithPath_(pdfPath))
+    page = CGPDFDocumentGetPage(document, pageNumber)
+    box = CGPDFPageGetBoxRect(page, kCGPDFMediaBox)
+    scale = imageResolution / 72
+    ph = int(round(box.size.height * scale))
+
+    bitmap = createRasterBitmap(w, h, opaque)
+    # Origin of the bitmap is bottom-left, y of the tile is from the top.
+    CGContextTranslateCTM(bitmap, -x, -(ph - y - h))
+    CGContextScaleCTM(bitmap, scale, scale)
+    CGContextTranslateCTM(bitmap, -box.origin.x, -box.origin.y)
+    CGContextDrawPDFPage(bitmap, page)
+
+    image = CGBitmapContextCreateImage(bitmap)
+    data = bytes(CGDataProviderCopyData(CGImageGetDataProvider(image)))
+    rows = numpy.frombuffer(data, dtype=numpy.uint8).reshape(h, CGImageGetBytesPerRow(image))
+    return rows[:, :w*4].reshape(h, w, 4).copy()
+
+class PNGStreamWriter:
+    """Writes a PNG file from bands of scanlines, top first. Each band is
+    compressed and written as IDAT chunk when it is added, so only the band
+    is kept in memory.
+
+    >>> from pagebotosx.images.imageinfo import readImageInfo
+    >>> path = os.path.join(tempfile.mkdtemp(), 'poster.png')
+    >>> writer = PNGStreamWriter(path, 5, 3, dpi=300)
+    >>> writer.writeRows(renderPatternTile(None, 0, 0, 5, 2))
+    >>> writer.writeRows(renderPatternTile(None, 0, 2, 5, 1))
+    >>> writer.close()
+    >>> readImageInfo(path)
+    <ImageInfo png 5x3 dpi=(300.0, 300.0) pages=1>
+    >>> bool((numpy.asarray(Image.open(path)) == renderPatternTile(None, 0, 0, 5, 3)).all())
+    True
+    """
+
+    def __init__(self, path, w, h, alpha=True, dpi=None, compressLevel=6):
+        self.path = path
+        self.w = w
+        self.h = h
+        self.alpha = alpha
+        self.rows = 0
+        self._compressor = zlib.compressobj(compressLevel)
+        self._file = open(path, 'wb')
+        self._file.write(PNG_SIGNATURE)
+        self._writeChunk(b'IHDR', struct.pack('>IIBBBBB', w, h, 8,
+            6 if alpha else 2, 0, 0, 0))
+        if dpi:
+            ppm = int(round(dpi / 0.0254)) # Pixels per meter.
+            self._writeChunk(b'pHYs', struct.pack('>IIB', ppm, ppm, 1))
+
+    def _writeChunk(self, chunkType, data):
+        self._file.write(struct.pack('>I', len(data)) + chunkType + data)
+        self._file.write(struct.pack('>I', zlib.crc32(chunkType + data)))
+
+    def writeRows(self, rows):
+        """Writes the (n, w, 4) uint8 RGBA scanlines, dropping the alpha
+        channel if the image has none."""
+        if not self.alpha:
+            rows = rows[..., :3]
+        n = len(rows)
+        # Each scanline starts with filter type 0 (none).
+        scanlines = numpy.zeros((n, 1 + self.w * rows.shape[2]), dtype=numpy.uint8)
+        scanlines[:, 1:] = rows.reshape(n, -1)
+        data = self._compressor.compress(scanlines.tobytes())
+        if data:
+            self._writeChunk(b'IDAT', data)
+        self.rows += n
+
+    def close(self):
+        self._writeChunk(b'IDAT', self._compressor.flush())
+        self._writeChunk(b'IEND', b'')
+        self._file.close()
+        assert self.rows == self.h, 'Wrote %d of %d rows' % (self.rows, self.h)
+
+class MemmapImageWriter:
+    """Writes formats that cannot be encoded in bands, such as JPEG and
+    TIFF. Bands are kept in a memory-mapped temporary file and the image is
+    encoded from it by Pillow when the writer is closed. The pixels are
+    kept as RGBA or RGBX, which Pillow maps instead of copying, so they do
+    not all need to be in memory. Options are the options of Pillow save,
+    e.g. quality.
+
+    >>> root = tempfile.mkdtemp()
+    >>> path = os.path.join(root, 'poster.tif')
+    >>> writer = MemmapImageWriter(path, 5, 3, dpi=150)
+    >>> writer.writeRows(renderPatternTile(None, 0, 0, 5, 3))
+    >>> writer.close()
+    >>> image = Image.open(path)
+    >>> image.size, image.info['dpi'] == (150, 150)
+    ((5, 3), True)
+    >>> os.listdir(os.path.dirname(path))
+    ['poster.tif']
+    >>> writer = MemmapImageWriter(os.path.join(root, 'poster.jpg'), 5, 3, alpha=False)
+    >>> writer.writeRows(renderPatternTile(None, 0, 0, 5, 3))
+    >>> image = writer.getImage()
+    >>> image.mode, bool(image.readonly) # Mapped, not copied.
+    ('RGBX', True)
+    >>> writer.close()
+    >>> Image.open(os.path.join(root, 'poster.jpg')).mode
+    'RGB'
+    """
+
+    def __init__(self, path, w, h, alpha=True, dpi=None, **options):
+        self.path = path
+        self.w = w
+        self.h = h
+        self.alpha = alpha
+        self.dpi = dpi
+        self.options = options
+        self.rows = 0
+        fd, self._pixelsPath = tempfile.mkstemp(prefix='pagebot-tiles-',
+                dir=os.path.dirname(os.path.abspath(path)))
+        os.close(fd)
+        self._pixels = numpy.memmap(self._pixelsPath, dtype=numpy.uint8,
+                mode='w+', shape=(h, w, 4))
+
+    def writeRows(self, rows):
+        n = len(rows)
+        self._pixels[self.rows:self.rows+n] = rows
+        if not self.alpha:
+            self._pixels[self.rows:self.rows+n, :, 3] = 255
+        self.rows += n
+
+    def getImage(self):
+        """Answers the Pillow image that maps the pixels. Pillow cannot map
+        RGB, so images without alpha are RGBX, except for BMP, which cannot
+        be written as RGBX and is written as RGBA with opaque alpha."""
+        assert HAS_PIL, 'Pillow is needed to encode %s' % self.path
+        if self.alpha or os.path.splitext(self.path)[1].lower() == '.bmp':
+            mode = 'RGBA'
+        else:
+            mode = 'RGBX'
+        return Image.frombuffer(mode, (self.w, self.h), self._pixels, 'raw', mode, 0, 1)
+
+    def close(self):
+        assert self.rows == self.h, 'Wrote %d of %d rows' % (self.rows, self.h)
+        try:
+            options = dict(self.options)
+            if self.dpi:
+                options['dpi'] = self.dpi, self.dpi
+            self.getImage().save(self.path, **options)
+        finally:
+            del self._pixels
+            os.remove(self._pixelsPath)
+
+class ImageIOTileWriter(MemmapImageWriter):
+    """Writes the tiles of renderPDFTile through the ImageIO destination of
+    rasterizePDF, with the same options (imageResolution and
+    imageJPEGCompressionFactor). The bitmap pixels are kept in a
+    memory-mapped temporary file, which is the data of a CGImage with the
+    bitmap format of rasterizePDF when the writer is closed. ImageIO then
+    encodes the same pixels in the same way as for a single bitmap, also
+    for transparent and lossy formats."""
+
+    def __init__(self, path, w, h, options=None):
+        super().__init__(path, w, h, alpha=getFormat(path) not in OPAQUE_FORMATS)
+        self.options = dict(options or {})
+
+    def close(self):
+        from Foundation import NSURL
+        from Quartz import (CGDataProviderCreateWithURL, CGImageCreate,
+            CGColorSpaceCreateDeviceRGB, kCGImageAlphaPremultipliedLast,
+            kCGImageAlphaNoneSkipLast, kCGRenderingIntentDefault)
+
+        assert self.rows == self.h, 'Wrote %d of %d rows' % (self.rows, self.h)
+        try:
+            self._pixels.flush()
+            provider = CGDataProviderCreateWithURL(NSURL.fileURLWithPath_(self._pixelsPath))
+            alphaInfo = kCGImageAlphaPremultipliedLast if self.alpha else kCGImageAlphaNoneSkipLast
+            image = CGImageCreate(self.w, self.h, 8, 32, self.w * 4,
+                    CGColorSpaceCreateDeviceRGB(), alphaInfo, provider, None,
+                    False, kCGRenderingIntentDefault)
+            writeRasterImage(image, self.path, getRasterProperties(self.options))
+        finally:
+            del self._pixels
+            os.remove(self._pixelsPath)
+
+def getTileWriter(path, w, h, dpi=None, **options):
+    """Answers the writer of RGBA tiles with straight alpha, such as those of
+    renderPatternTile, for the format of path: a PNGStreamWriter for PNG
+    files and a MemmapImageWriter for other formats. Formats in
+    OPAQUE_FORMATS are written without alpha channel. Tiles of
+    renderPDFTile are written by an ImageIOTileWriter.
+
+    >>> root = tempfile.mkdtemp()
+    >>> getTileWriter(os.path.join(root, 'a.png'), 5, 3).__class__.__name__
+    'PNGStreamWriter'
+    >>> writer = getTileWriter(os.path.join(root, 'a.jpg'), 5, 3, quality=90)
+    >>> writer.__class__.__name__, writer.alpha, writer.options
+    ('MemmapImageWriter', False, {'quality': 90})
+    """
+    fileFormat = getFormat(path)
+    alpha = fileFormat not in OPAQUE_FORMATS
+    if fileFormat == 'png':
+        return PNGStreamWriter(path, w, h, alpha=alpha, dpi=dpi)
+    return MemmapImageWriter(path, w, h, alpha=alpha, dpi=dpi, **options)
+
+def _renderBand(renderTile, source, tiles, executor):
+    """Answers the list of tile results of the band, futures if there is an
+    executor."""
+    if executor is None:
+        return [renderTile(source, *tile) for tile in tiles]
+    return [executor.submit(renderTile, source, *tile) for tile in tiles]
+
+def exportTiles(writer, renderTile, source, tileSize=DEFAULT_TILE_SIZE,
+        workers=None):
+    """Renders the image of writer.w by writer.h pixels in tiles of tileSize
+    by renderTile(source, x, y, w, h), in a pool of workers processes
+    (default the number of CPUs). Rows of tiles are written in order, as
+    bands of scanlines, into the writer, which is then closed. At most
+    workers + 1 bands are rendered or waiting, which bounds the memory.
+    Answers the number of tiles.
+
+    >>> root = tempfile.mkdtemp()
+    >>> single = os.path.join(root, 'single.png')
+    >>> tiled = os.path.join(root, 'tiled.png')
+    >>> exportTiles(PNGStreamWriter(single, 37, 23), renderPatternTile, None, tileSize=None, workers=1)
+    1
+    >>> exportTiles(PNGStreamWriter(tiled, 37, 23), renderPatternTile, None, tileSize=8, workers=2)
+    15
+    >>> bool((numpy.asarray(Image.open(single)) == numpy.asarray(Image.open(tiled))).all())
+    True
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    bands = splitTiles(writer.w, writer.h, tileSize)
+    tileCount = sum(len(tiles) for tiles in bands)
+    executor = None
+    if workers > 1 and tileCount > 1:
+        executor = ProcessPoolExecutor(max_workers=min(workers, tileCount))
+
+    try:
+        pending = deque()
+        nextBand = 0
+        for tiles in bands:
+            while nextBand < len(bands) and len(pending) <= workers:
+                pending.append(_renderBand(renderTile, source, bands[nextBand], executor))
+                nextBand += 1
+            results = pending.popleft()
+            if executor is not None:
+                results = [future.result() for future in results]
+            writer.writeRows(numpy.concatenate(results, axis=1))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    writer.close()
+    return tileCount
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
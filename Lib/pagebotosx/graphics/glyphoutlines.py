@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     glyphoutlines.py
+#
+
+from pagebotosx.toolbox.lrucache import LRUCache
+
+def getGlyphCommands(glyph, p=None, commands=None):
+    """Answers the list of (command, points) segments of the glyph.cubic
+    stream, with components resolved recursively and their offsets applied.
+    Commands are 'moveTo', 'lineTo', 'curveTo' and 'qCurveTo' with a tuple of
+    points, and 'closePath' with None.
+
+    >>> from types import SimpleNamespace as Glyph
+    >>> bar = Glyph(name='bar', cubic=[('moveTo', (0, 0)), ('lineTo', (10, 0)),
+    ...     ('curveTo', ((10, 5), (5, 10), (0, 10))), ('closePath', None)])
+    >>> glyph = Glyph(name='T', cubic=[('component', ((100, 20), bar))])
+    >>> for command in getGlyphCommands(glyph):
+    ...     command
+    ('moveTo', ((100, 20),))
+    ('lineTo', ((110, 20),))
+    ('curveTo', ((110, 25), (105, 30), (100, 30)))
+    ('closePath', None)
+    """
+    if commands is None:
+        commands = []
+    if p is None:
+        px = py = 0
+    else:
+        px, py = p
+
+    for command, t in glyph.cubic:
+        if command in ('moveTo', 'lineTo'):
+            commands.append((command, ((px+t[0], py+t[1]),)))
+        elif command in ('curveTo', 'qCurveTo'):
+            commands.append((command, tuple((px+x, py+y) for x, y in t)))
+        elif command == 'closePath':
+            commands.append((command, None))
+        elif command == 'component':
+            (x, y), componentGlyph = t
+            getGlyphCommands(componentGlyph, (px+x, py+y), commands)
+
+    return commands
+
+def glyphKey(glyph):
+    """Answers the cache key (font path, glyph name) of the glyph. Answers
+    None for glyphs of fonts without path, e.g. made in memory, as outlines
+    of different fonts would get the same key. These are not cached.
+
+    >>> from types import SimpleNamespace as Glyph
+    >>> glyphKey(Glyph(name='H', font=Glyph(path='/fonts/Roboto-Regular.ttf')))
+    ('/fonts/Roboto-Regular.ttf', 'H')
+    >>> glyphKey(Glyph(name='H', font=Glyph(path=None))) is None
+    True
+    """
+    path = getattr(getattr(glyph, 'font', None), 'path', None)
+    if path is None:
+        return None
+    return path, glyph.name
+
+class GlyphOutlineCache(LRUCache):
+    """Bounded cache of glyph outlines, keyed on (font path, glyph name). By
+    default the outline is the component-resolved command list of
+    getGlyphCommands. Contexts can supply another function to make the
+    outline, such as a native path object.
+
+    >>> from types import SimpleNamespace as Glyph
+    >>> font = Glyph(path='/fonts/Roboto-Regular.ttf')
+    >>> glyph = Glyph(name='I', font=font, cubic=[('moveTo', (0, 0)), ('lineTo', (0, 10)), ('closePath', None)])
+    >>> cache = GlyphOutlineCache(maxSize=100)
+    >>> len(cache.getOutline(glyph))
+    3
+    >>> cache.getOutline(glyph) is cache.getOutline(glyph)
+    True
+    >>> cache.report()
+    'GlyphOutlineCache: 1 glyphs, 2 hits, 1 misses, 0 evictions, hit rate 66.7%'
+    >>> glyph.font = Glyph(path=None) # Fonts without path are not cached.
+    >>> cache.getOutline(glyph) is cache.getOutline(glyph), len(cache)
+    (False, 1)
+    """
+
+    def getOutline(self, glyph, makeOutline=getGlyphCommands):
+        """Answers the cached outline of the glyph. Otherwise call
+        `makeOutline(glyph)` and store the result."""
+        return self.getOrCreate(glyphKey(glyph), makeOutline, glyph)
+
+    def report(self):
+        """Answers a readable line with the size and hit rate of the cache."""
+        return '%s: %d glyphs, %d hits, %d misses, %d evictions, hit rate %0.1f%%' % (
+            self.__class__.__name__, len(self), self.hits, self.misses,
+            self.evictions, self.hitRate * 100)
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     outlinearrays.py
+#
+#     Bézier outlines as NumPy arrays of segment types and points, so that the
+#     outlines of many placed glyphs can be combined into a single outline in
+#     one vectorized pass.
+#
+
+import numpy
+from pagebotosx.graphics.glyphoutlines import getGlyphCommands
+from pagebotosx.mathematics.flatten import flattenCommands, DEFAULT_FLATNESS
+
+MOVETO = 0
+LINETO = 1
+CURVETO = 2
+QCURVETO = 3
+CLOSEPATH = 4
+
+COMMAND_TYPES = {'moveTo': MOVETO, 'lineTo': LINETO, 'curveTo': CURVETO,
+        'qCurveTo': QCURVETO, 'closePath': CLOSEPATH}
+COMMAND_NAMES = {t: command for command, t in COMMAND_TYPES.items()}
+# Number of points of each segment type.
+POINT_COUNTS = numpy.array((1, 1, 3, 2, 0), dtype=numpy.intp)
+
+class OutlineArrays:
+    """Bézier outline as a uint8 array with the segment type of each command
+    and one (N, 2) float64 array with the points of all segments, in the
+    same order as the command stream of getGlyphCommands.
+
+    >>> commands = [('moveTo', ((0, 0),)), ('lineTo', ((10, 0),)),
+    ...     ('curveTo', ((10, 5), (5, 10), (0, 10))), ('closePath', None)]
+    >>> outline = OutlineArrays.fromCommands(commands)
+    >>> outline
+    <OutlineArrays 4 segments, 5 points>
+    >>> outline.types.tolist(), outline.bounds()
+    ([0, 1, 2, 4], (0.0, 0.0, 10.0, 10.0))
+    >>> outline.commands()[2]
+    ('curveTo', ((10.0, 5.0), (5.0, 10.0), (0.0, 10.0)))
+    >>> len(outline.flatten()[0]) > 3
+    True
+    """
+
+    def __init__(self, types, points):
+        self.types = numpy.asarray(types, dtype=numpy.uint8)
+        self.points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        assert POINT_COUNTS[self.types].sum() == len(self.points)
+
+    @classmethod
+    def fromCommands(cls, commands):
+        """Answers a new OutlineArrays from a list of (command, points)
+        tuples, as answered by getGlyphCommands."""
+        types = []
+        points = []
+        for command, commandPoints in commands:
+            types.append(COMMAND_TYPES[command])
+            if commandPoints:
+                points.extend(commandPoints)
+        return cls(types, numpy.array(points, dtype=numpy.float64).reshape(-1, 2))
+
+    def __len__(self):
+        return len(self.types)
+
+    def __repr__(self):
+        return '<%s %d segments, %d points>' % (self.__class__.__name__,
+                len(self), len(self.points))
+
+    def commands(self):
+        """Answers the list of (command, points) tuples of the outline."""
+        commands = []
+        points = [tuple(p) for p in self.points.tolist()]
+        index = 0
+
+        for t in self.types.tolist():
+            count = POINT_COUNTS[t]
+            if count:
+                commands.append((COMMAND_NAMES[t], tuple(points[index:index+count])))
+            else:
+                commands.append((COMMAND_NAMES[t], None))
+            index += count
+
+        return commands
+
+    def bounds(self):
+        """Answers (minX, minY, maxX, maxY) of all points, including the
+        off-curve points, or None if there are no points."""
+        if not len(self.points):
+            return None
+        (minX, minY), (maxX, maxY) = self.points.min(axis=0), self.points.max(axis=0)
+        return float(minX), float(minY), float(maxX), float(maxY)
+
+    def flatten(self, tolerance=DEFAULT_FLATNESS):
+        """Answers the ContourArrays of the flattened outline."""
+        return flattenCommands(self.commands(), tolerance=tolerance)
+
+def getGlyphOutlineArrays(glyph):
+    """Answers the OutlineArrays of the glyph, with components resolved, in
+    font units. To be used as the makeOutline function of
+    GlyphOutlineCache.
+
+    >>> from types import SimpleNamespace as Glyph
+    >>> glyph = Glyph(name='I', cubic=[('moveTo', (0, 0)), ('lineTo', (0, 10)), ('closePath', None)])
+    >>> getGlyphOutlineArrays(glyph).points.tolist()
+    [[0.0, 0.0], [0.0, 10.0]]
+    """
+    return OutlineArrays.fromCommands(getGlyphCommands(glyph))
+
+def combineOutlines(placements):
+    """Answers a single OutlineArrays with all outlines of the placements, a
+    sequence of (outline, x, y, scale) tuples. Each outline is scaled and
+    then translated by (x, y). Equal outlines can be placed any number of
+    times; the points of all placements are transformed together.
+
+    >>> outline = OutlineArrays.fromCommands([('moveTo', ((0, 0),)),
+    ...     ('lineTo', ((100, 0),)), ('lineTo', ((0, 100),)), ('closePath', None)])
+    >>> combined = combineOutlines([(outline, 0, 0, 0.1), (outline, 20, 5, 0.1)])
+    >>> combined
+    <OutlineArrays 8 segments, 6 points>
+    >>> combined.points.tolist()
+    [[0.0, 0.0], [10.0, 0.0], [0.0, 10.0], [20.0, 5.0], [30.0, 5.0], [20.0, 15.0]]
+    >>> combineOutlines([])
+    <OutlineArrays 0 segments, 0 points>
+    """
+    if not placements:
+        return OutlineArrays(numpy.empty(0, dtype=numpy.uint8),
+                numpy.empty((0, 2), dtype=numpy.float64))
+
+    outlines = [outline for outline, _, _, _ in placements]
+    transforms = numpy.array([(x, y, scale) for _, x, y, scale in placements],
+            dtype=numpy.float64)
+    counts = [len(outline.points) for outline in outlines]
+
+    points = numpy.concatenate([outline.points for outline in outlines])
+    transforms = numpy.repeat(transforms, counts, axis=0)
+    points = points * transforms[:, 2:] + transforms[:, :2]
+    types = numpy.concatenate([outline.types for outline in outlines])
+    return OutlineArrays(types, points)
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     imageinfo.py
+#
+#     Reads the size, resolution and number of pages of PNG, JPEG, TIFF and
+#     PDF files from their headers, without decoding the pixels. Answers are
+#     kept for the (modification time, size) of each file, and the index can
+#     be saved as JSON for the next run.
+#
+
+import os
+import re
+import json
+import mmap
+import struct
+
+FORMAT_PNG = 'png'
+FORMAT_JPEG = 'jpeg'
+FORMAT_TIFF = 'tiff'
+FORMAT_PDF = 'pdf'
+
+# Number of bytes read for the header of bitmap formats.
+HEADER_SIZE = 64 * 1024
+# Maximum number of TIFF pages (IFDs) that are counted.
+MAX_TIFF_PAGES = 10000
+
+class ImageInfo:
+    """Metadata of an image file. For bitmaps, w and h are in pixels; for
+    PDF they are the points of the CropBox of the first page, turned by its
+    /Rotate. Dpi is the (x, y) resolution if the file defines it, otherwise
+    None. Values that could not be read are None."""
+
+    def __init__(self, format=None, w=None, h=None, dpi=None, pages=1):
+        self.format = format
+        self.w = w
+        self.h = h
+        self.dpi = dpi
+        self.pages = pages
+
+    def __repr__(self):
+        return '<%s %s %sx%s dpi=%s pages=%s>' % (self.__class__.__name__,
+                self.format, self.w, self.h, self.dpi, self.pages)
+
+    def asDict(self):
+        return dict(format=self.format, w=self.w, h=self.h,
+                dpi=list(self.dpi) if self.dpi else None, pages=self.pages)
+
+    @classmethod
+    def fromDict(cls, d):
+        dpi = d.get('dpi')
+        return cls(format=d.get('format'), w=d.get('w'), h=d.get('h'),
+                dpi=tuple(dpi) if dpi else None, pages=d.get('pages'))
+
+def _roundDpi(v):
+    return round(v, 1)
+
+def readPNGInfo(data):
+    """Answers the ImageInfo from the bytes of the start of a PNG file. The
+    resolution is read from the pHYs chunk, if it is before the image data.
+
+    >>> header = b'\\x89PNG\\r\\n\\x1a\\n' + struct.pack('>I4sIIBBBBB', 13, b'IHDR', 640, 480, 8, 6, 0, 0, 0) + b'CRC!'
+    >>> readPNGInfo(header)
+    <ImageInfo png 640x480 dpi=None pages=1>
+    >>> phys = struct.pack('>I4sIIB', 9, b'pHYs', 11811, 11811, 1) + b'CRC!'
+    >>> readPNGInfo(header + phys).dpi
+    (300.0, 300.0)
+    """
+    w, h = struct.unpack('>II', data[16:24])
+    info = ImageInfo(FORMAT_PNG, w, h)
+    offset = 33
+
+    while offset + 8 <= len(data):
+        length, chunkType = struct.unpack('>I4s', data[offset:offset+8])
+        if chunkType in (b'IDAT', b'IEND'):
+            break
+        if chunkType == b'pHYs' and offset + 17 <= len(data):
+            px, py, unit = struct.unpack('>IIB', data[offset+8:offset+17])
+            if unit == 1: # Pixels per meter.
+                info.dpi = _roundDpi(px * 0.0254), _roundDpi(py * 0.0254)
+            break
+        offset += 12 + length
+
+    return info
+
+# Start of frame markers with the size of the image.
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def readJPEGInfo(data):
+    """Answers the ImageInfo from the bytes of the start of a JPEG file, from
+    the JFIF density and the first start of frame segment.
+
+    >>> jfif = b'\\xff\\xe0' + struct.pack('>H5sBBBHHBB', 16, b'JFIF\\x00', 1, 1, 1, 72, 72, 0, 0)
+    >>> sof = b'\\xff\\xc0' + struct.pack('>HBHHB', 11, 8, 480, 640, 3) + b'\\x00' * 3
+    >>> readJPEGInfo(b'\\xff\\xd8' + jfif + sof)
+    <ImageInfo jpeg 640x480 dpi=(72, 72) pages=1>
+    """
+    info = ImageInfo(FORMAT_JPEG)
+    offset = 2
+
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            break
+        marker = data[offset+1]
+        if marker == 0xFF: # Padding.
+            offset += 1
+            continue
+        length, = struct.unpack('>H', data[offset+2:offset+4])
+        segment = data[offset+4:offset+2+length]
+
+        if marker == 0xE0 and segment[:5] == b'JFIF\x00' and len(segment) >= 12:
+            units, dx, dy = struct.unpack('>BHH', segment[7:12])
+            if units == 1 and dx and dy: # Dots per inch.
+                info.dpi = dx, dy
+            elif units == 2 and dx and dy: # Dots per cm.
+                info.dpi = _roundDpi(dx * 2.54), _roundDpi(dy * 2.54)
+        elif marker in JPEG_SOF_MARKERS and len(segment) >= 5:
+            info.h, info.w = struct.unpack('>HH', segment[1:5])
+            break
+        elif marker == 0xDA: # Start of scan without frame.
+            break
+        offset += 2 + length
+
+    return info
+
+TIFF_TYPES = {3: ('H', 2), 4: ('I', 4), 5: ('II', 8)}
+
+def readTIFFInfo(f):
+    """Answers the ImageInfo of the open TIFF file. Size and resolution are
+    read from the first image file directory, pages is the number of
+    directories.
+
+    >>> import io
+    >>> def entry(tag, t, value):
+    ...     return struct.pack('<HHI', tag, t, 1) + struct.pack('<I' if t != 3 else '<HH', *((value,) if t != 3 else (value, 0)))
+    >>> entries = [entry(256, 3, 640), entry(257, 4, 480), entry(282, 5, 8), entry(283, 5, 8), entry(296, 3, 2)]
+    >>> ifd = struct.pack('<H', len(entries)) + b''.join(entries) + struct.pack('<I', 0)
+    >>> rational = struct.pack('<II', 300, 1)
+    >>> data = b'II*\\x00' + struct.pack('<I', 16) + rational + ifd
+    >>> readTIFFInfo(io.BytesIO(data))
+    <ImageInfo tiff 640x480 dpi=(300.0, 300.0) pages=1>
+    """
+    f.seek(0)
+    order = '<' if f.read(2) == b'II' else '>'
+    _, offset = struct.unpack(order + 'HI', f.read(6))
+    info = ImageInfo(FORMAT_TIFF, pages=0)
+    values = {}
+
+    while offset and info.pages < MAX_TIFF_PAGES:
+        f.seek(offset)
+        count, = struct.unpack(order + 'H', f.read(2))
+        entries = f.read(12 * count)
+        nextOffset, = struct.unpack(order + 'I', f.read(4))
+
+        if not info.pages:
+            for index in range(count):
+                tag, t, n, value = struct.unpack(order + 'HHI4s',
+                        entries[index*12:index*12+12])
+                if tag in (256, 257, 296) and t in (3, 4):
+                    fmt, _ = TIFF_TYPES[t]
+                    values[tag] = struct.unpack(order + fmt, value[:struct.calcsize(fmt)])[0]
+                elif tag in (282, 283) and t == 5:
+                    values[tag] = struct.unpack(order + 'I', value)[0]
+        info.pages += 1
+        offset = nextOffset
+
+    info.w = values.get(256)
+    info.h = values.get(257)
+
+    if 282 in values and 283 in values:
+        resolution = []
+        for tag in (282, 283):
+            f.seek(values[tag])
+            numerator, denominator = struct.unpack(order + 'II', f.read(8))
+            resolution.append(numerator / (denominator or 1))
+        unit = values.get(296, 2)
+        if unit == 2: # Inch.
+            info.dpi = tuple(_roundDpi(v) for v in resolution)
+        elif unit == 3: # Centimeter.
+            info.dpi = tuple(_roundDpi(v * 2.54) for v in resolution)
+
+    return info
+
+PDF_PAGES = re.compile(rb'/Type\s*/Pages\b')
+PDF_COUNT = re.compile(rb'/Count\s+(\d+)')
+PDF_ROOT = re.compile(rb'/Root\s+(\d+\s+\d+\s+R)')
+PDF_REF = re.compile(rb'(\d+)\s+(\d+)\s+R\b')
+PDF_KIDS = re.compile(rb'/Kids\s*\[([^\]]*)\]')
+# Dictionary brackets and strings, that can hold brackets.
+PDF_DICT_TOKEN = re.compile(rb'<<|>>|\((?:\\.|[^\\()])*\)|<[0-9A-Fa-f\s]*>')
+# Maximum depth of the page tree that is followed to the first page.
+MAX_PDF_DEPTH = 32
+
+def _getPDFObject(data, ref):
+    """Answers the bytes of the object with the (number, generation) ref,
+    the last one in the file in case of incremental updates, or None if it
+    cannot be found, e.g. inside a compressed object stream."""
+    match = None
+    for match in re.finditer(rb'(?<!\d)%d\s+%d\s+obj\b' % ref, data):
+        pass
+    if match is None:
+        return None
+    end = data.find(b'endobj', match.end())
+    return data[match.end():end if end >= 0 else len(data)]
+
+def _getPDFDict(body):
+    """Answers the top level of the first dictionary in the bytes of body,
+    without nested dictionaries and strings, or None.
+
+    >>> _getPDFDict(b'<< /Type /Page /Resources << /MediaBox [0 0 1 1] >> /Title (a >> b) /MediaBox [0 0 9 9] >>')
+    b' /Type /Page /Resources   /Title   /MediaBox [0 0 9 9] '
+    """
+    if body is None:
+        return None
+    parts = []
+    depth = 0
+    position = 0
+    for token in PDF_DICT_TOKEN.finditer(body):
+        if depth == 1:
+            parts.append(body[position:token.start()])
+        t = token.group()
+        if t == b'<<':
+            depth += 1
+        elif t == b'>>':
+            depth -= 1
+            if depth == 0:
+                return b' '.join(parts)
+        position = token.end()
+    return None
+
+def _getPDFValue(data, node, name, resolve=True):
+    """Answers the bytes of the value of name in the dictionary node, or
+    None. If resolve is True, indirect references answer the bytes of the
+    object they refer to."""
+    match = re.search(rb'/%s(?![A-Za-z0-9])\s*(\[[^\]]*\]|\d+\s+\d+\s+R\b|[-+\d.]+)' % name, node)
+    if match is None:
+        return None
+    value = match.group(1)
+    ref = PDF_REF.fullmatch(value)
+    if resolve and ref is not None:
+        value = _getPDFObject(data, (int(ref.group(1)), int(ref.group(2))))
+        if value is None:
+            return None
+    return value.strip()
+
+def _getPDFNode(data, value):
+    """Answers the dictionary of the object that value refers to, or None."""
+    ref = PDF_REF.fullmatch(value.strip()) if value else None
+    if ref is None:
+        return None
+    return _getPDFDict(_getPDFObject(data, (int(ref.group(1)), int(ref.group(2)))))
+
+def _getPDFBox(value):
+    """Answers the (x0, y0, x1, y1) of the rectangle value, or None."""
+    try:
+        x0, y0, x1, y1 = (float(v) for v in value.strip(b'[]').split())
+    except (AttributeError, ValueError):
+        return None
+    return min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)
+
+def getPDFPageInfo(data):
+    """Answers (w, h, pages) of the first page of the PDF, following the
+    page tree from the /Root of the trailer, with the boxes and /Rotate
+    inherited from the parent nodes. The size is the /CropBox inside the
+    /MediaBox, turned by /Rotate. Answers None if the page cannot be
+    resolved, e.g. in case of compressed object streams.
+
+    >>> pdf = (b'%PDF-1.4 4 0 obj << /Type /Page /Parent 2 0 R /MediaBox [0 0 100 100] >> endobj '
+    ...     b'1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj '
+    ...     b'2 0 obj << /Type /Pages /Kids [3 0 R 4 0 R] /Count 2 /MediaBox [0 0 612 792] /Rotate 5 0 R >> endobj '
+    ...     b'5 0 obj 90 endobj '
+    ...     b'3 0 obj << /Type /Page /Parent 2 0 R /CropBox [36 36 576 756] >> endobj '
+    ...     b'trailer << /Size 6 /Root 1 0 R >>')
+    >>> getPDFPageInfo(pdf)
+    (720.0, 540.0, 2)
+    >>> getPDFPageInfo(pdf.replace(b'/Root 1 0 R', b'')) is None
+    True
+    """
+    root = None
+    for root in PDF_ROOT.finditer(data):
+        pass
+    if root is None:
+        return None
+    catalog = _getPDFNode(data, root.group(1))
+    node = _getPDFNode(data, _getPDFValue(data, catalog, b'Pages', resolve=False)) if catalog else None
+    if node is None:
+        return None
+    count = _getPDFValue(data, node, b'Count')
+    values = {}
+
+    for _ in range(MAX_PDF_DEPTH):
+        for name in (b'MediaBox', b'CropBox', b'Rotate'):
+            value = _getPDFValue(data, node, name)
+            if value is not None:
+                values[name] = value
+        kids = PDF_KIDS.search(node)
+        if kids is None: # Leaf of the page tree.
+            break
+        kid = PDF_REF.search(kids.group(1))
+        node = _getPDFNode(data, kid.group()) if kid else None
+        if node is None:
+            return None
+    else:
+        return None
+
+    mediaBox = _getPDFBox(values.get(b'MediaBox'))
+    if mediaBox is None:
+        return None
+    cropBox = _getPDFBox(values.get(b'CropBox')) or mediaBox
+    w = min(cropBox[2], mediaBox[2]) - max(cropBox[0], mediaBox[0])
+    h = min(cropBox[3], mediaBox[3]) - max(cropBox[1], mediaBox[1])
+    if w <= 0 or h <= 0:
+        return None
+    try:
+        rotate = int(float(values.get(b'Rotate', 0)))
+    except ValueError:
+        return None
+    if rotate % 180 == 90:
+        w, h = h, w
+    try:
+        pages = int(count) if count is not None else None
+    except ValueError:
+        pages = None
+    return round(w, 3), round(h, 3), pages
+
+def readPDFInfo(data):
+    """Answers the ImageInfo of the bytes (or memory map) of a PDF file. The
+    size is the box of the first page, answered by getPDFPageInfo. The
+    number of pages is the /Count of the root of the page tree, or else the
+    largest /Count of the page tree nodes. Values inside compressed object
+    streams cannot be read, in which case they are None.
+
+    >>> pdf = (b'%PDF-1.4 3 0 obj << /Type /Page /Parent 1 0 R >> endobj '
+    ...     b'2 0 obj << /Type /Catalog /Pages 1 0 R >> endobj '
+    ...     b'1 0 obj << /Type /Pages /Kids [3 0 R] /Count 3 /MediaBox [0 0 595.3 841.9] >> endobj '
+    ...     b'trailer << /Root 2 0 R >>')
+    >>> readPDFInfo(pdf)
+    <ImageInfo pdf 595.3x841.9 dpi=None pages=3>
+    >>> readPDFInfo(pdf.replace(b'/Root 2 0 R', b'')) # First page is unknown.
+    <ImageInfo pdf NonexNone dpi=None pages=3>
+    """
+    info = ImageInfo(FORMAT_PDF, pages=None)
+    pageInfo = getPDFPageInfo(data)
+    if pageInfo is not None:
+        info.w, info.h, info.pages = pageInfo
+
+    if info.pages is None:
+        for match in PDF_PAGES.finditer(data):
+            start = data.rfind(b'<<', 0, match.start())
+            end = data.find(b'endobj', match.end())
+            if end < 0:
+                end = len(data)
+            count = PDF_COUNT.search(data, max(0, start), end)
+            if count is not None:
+                info.pages = max(info.pages or 0, int(count.group(1)))
+
+    return info
+
+def readImageInfo(path):
+    """Answers the ImageInfo of the file, read from its header, or None if
+    it is not a PNG, JPEG, TIFF or PDF file.
+
+    >>> import tempfile
+    >>> from PIL import Image
+    >>> root = tempfile.mkdtemp()
+    >>> for extension in ('png', 'jpg', 'tif', 'pdf'):
+    ...     Image.new('RGB', (300, 200)).save(os.path.join(root, 'a.' + extension), dpi=(144, 144))
+    ...     readImageInfo(os.path.join(root, 'a.' + extension))
+    <ImageInfo png 300x200 dpi=(144.0, 144.0) pages=1>
+    <ImageInfo jpeg 300x200 dpi=(144, 144) pages=1>
+    <ImageInfo tiff 300x200 dpi=(144.0, 144.0) pages=1>
+    <ImageInfo pdf 150.0x100.0 dpi=None pages=1>
+    """
+    with open(path, 'rb') as f:
+        data = f.read(HEADER_SIZE)
+
+        if data.startswith(b'\x89PNG\r\n\x1a\n'):
+            return readPNGInfo(data)
+        if data.startswith(b'\xff\xd8'):
+            info = readJPEGInfo(data)
+            if info.w is None:
+                # Large APP segments (e.g. EXIF thumbnails) before the frame.
+                f.seek(0)
+                info = readJPEGInfo(f.read())
+            return info
+        if data[:4] in (b'II*\x00', b'MM\x00*'):
+            return readTIFFInfo(f)
+        if data.startswith(b'%PDF'):
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                return readPDFInfo(m)
+    return None
+
+class ImageInfoIndex:
+    """Index of ImageInfo of image files, read once for each (path,
+    modification time, size), so changed files are read again. If path is
+    defined, the index is read from that JSON file and written by
+    self.save().
+
+    >>> import tempfile
+    >>> from PIL import Image
+    >>> root = tempfile.mkdtemp()
+    >>> imagePath = os.path.join(root, 'a.png')
+    >>> Image.new('RGB', (300, 200)).save(imagePath)
+    >>> index = ImageInfoIndex(os.path.join(root, 'imageinfo.json'))
+    >>> index.getInfo(imagePath) is index.getInfo(imagePath)
+    True
+    >>> index.imageSize(imagePath), index.numberOfPages(imagePath)
+    ((300, 200), 1)
+    >>> index.hits, index.misses
+    (3, 1)
+    >>> index.getInfo(os.path.join(root, 'missing.png')) is None
+    True
+    >>> index.save()
+    >>> index = ImageInfoIndex(os.path.join(root, 'imageinfo.json'))
+    >>> index.getInfo(imagePath), index.hits
+    (<ImageInfo png 300x200 dpi=None pages=1>, 1)
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        # Key is absolute path, value is [mtime, size, ImageInfo or None].
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        if path is not None:
+            self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def getInfo(self, path):
+        """Answers the ImageInfo of the file, or None if it does not exist
+        or its format is unknown."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = os.path.abspath(path)
+        entry = self.entries.get(key)
+
+        if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            self.hits += 1
+            return entry[2]
+
+        self.misses += 1
+        try:
+            info = readImageInfo(path)
+        except (OSError, struct.error, ValueError):
+            info = None
+        self.entries[key] = [stat.st_mtime_ns, stat.st_size, info]
+        return info
+
+    def imageSize(self, path):
+        """Answers (w, h) of the image, or of the first page of multi-page
+        files, or None if unknown."""
+        info = self.getInfo(path)
+        if info is None or info.w is None or info.h is None:
+            return None
+        return info.w, info.h
+
+    def numberOfPages(self, path):
+        """Answers the number of pages of the image, or None if unknown."""
+        info = self.getInfo(path)
+        if info is None:
+            return None
+        return info.pages
+
+    def load(self, path=None):
+        """Reads the entries from the JSON file, if it exists."""
+        path = path or self.path
+        try:
+            with open(path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        for key, (mtime, size, info) in entries.items():
+            self.entries[key] = [mtime, size, ImageInfo.fromDict(info) if info else None]
+
+    def save(self, path=None):
+        """Writes the entries as JSON file."""
+        path = path or self.path
+        entries = {}
+        for key, (mtime, size, info) in self.entries.items():
+            entries[key] = [mtime, size, info.asDict() if info else None]
+        tmpPath = path + '.tmp'
+        with open(tmpPath, 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmpPath, path)
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     pixels.py
+#
+#     Batch sampling of pixel colors. Each image is decoded once into an RGBA
+#     NumPy buffer, optionally kept as .npy file that is memory-mapped by the
+#     next run, and any number of points is sampled with array indexing.
+#
+
+import os
+import hashlib
+import numpy
+from pagebotosx.toolbox.lrucache import LRUCache
+
+HAS_PIL = True
+
+try:
+    from PIL import Image
+except ImportError:
+    HAS_PIL = False
+
+def decodeImage(path, index=0):
+    """Answers the (h, w, 4) uint8 RGBA array of the image at path. Index
+    selects the frame of multi-frame images. Rows are in file order, top row
+    first.
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'a.png')
+    >>> Image.new('RGB', (3, 2), (255, 0, 0)).save(path)
+    >>> pixels = decodeImage(path)
+    >>> pixels.shape, pixels.dtype, pixels[0, 0].tolist()
+    ((2, 3, 4), dtype('uint8'), [255, 0, 0, 255])
+    """
+    assert HAS_PIL, 'Pillow is needed to decode images'
+    with Image.open(path) as image:
+        if index:
+            image.seek(index)
+        return numpy.asarray(image.convert('RGBA'))
+
+class PixelSampler:
+    """Samples the RGBA colors of many points in images. Decoded images are
+    kept in a LRU cache of maxImages. If cachePath is defined, decoded images
+    are also saved there as .npy files, which later runs memory-map instead
+    of decoding the image again. Points are (x, y) with the origin at the
+    bottom-left, as in DrawBot imagePixelColor.
+
+    >>> import tempfile
+    >>> root = tempfile.mkdtemp()
+    >>> path = os.path.join(root, 'a.png')
+    >>> image = Image.new('RGBA', (4, 2), (0, 0, 255, 255))
+    >>> image.putpixel((0, 0), (255, 0, 0, 128)) # Top-left in the file.
+    >>> image.save(path)
+    >>> sampler = PixelSampler(cachePath=os.path.join(root, '_pixels'))
+    >>> colors = sampler.sample(path, [(0, 1), (3.5, 0), (4, 0), (-1, 0)])
+    >>> colors.shape
+    (4, 4)
+    >>> colors[:2].round(3).tolist()
+    [[1.0, 0.0, 0.0, 0.502], [0.0, 0.0, 1.0, 1.0]]
+    >>> bool(numpy.isnan(colors[2:]).all()) # Outside of the image.
+    True
+    >>> sampler.sample(path, numpy.zeros((0, 2))).shape
+    (0, 4)
+    >>> sampler.cache.misses, sampler.cache.hits
+    (1, 1)
+    >>> pixels = PixelSampler(cachePath=os.path.join(root, '_pixels')).getPixels(path)
+    >>> isinstance(pixels, numpy.memmap) # Next run maps the decoded file.
+    True
+    """
+
+    def __init__(self, maxImages=8, cachePath=None):
+        self.cache = LRUCache(maxImages)
+        self.cachePath = cachePath
+
+    def getPixels(self, path, index=0):
+        """Answers the (h, w, 4) uint8 RGBA array of the image."""
+        stat = os.stat(path)
+        key = os.path.abspath(path), index, stat.st_mtime_ns, stat.st_size
+        return self.cache.getOrCreate(key, self._loadPixels, path, index, key)
+
+    def _loadPixels(self, path, index, key):
+        """Answers the decoded pixels, memory-mapped from the .npy file in
+        self.cachePath if it exists."""
+        if self.cachePath is None:
+            return decodeImage(path, index)
+
+        name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        pixelsPath = os.path.join(self.cachePath, name + '.npy')
+        if os.path.exists(pixelsPath):
+            return numpy.load(pixelsPath, mmap_mode='r')
+
+        pixels = decodeImage(path, index)
+        os.makedirs(self.cachePath, exist_ok=True)
+        tmpPath = pixelsPath + '.tmp.npy'
+        numpy.save(tmpPath, pixels)
+        os.replace(tmpPath, pixelsPath)
+        return pixels
+
+    def sample(self, path, points, index=0):
+        """Answers the (N, 4) float64 array of RGBA colors, in the range 0-1,
+        of the (N, 2) array of (x, y) points. Coordinates are floored to the
+        pixel. Points outside the image answer NaN."""
+        pixels = self.getPixels(path, index)
+        h, w = pixels.shape[:2]
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        x = numpy.floor(points[:, 0]).astype(numpy.intp)
+        # Origin at the bottom-left, rows in the buffer start at the top.
+        y = h - 1 - numpy.floor(points[:, 1]).astype(numpy.intp)
+        inside = (x >= 0) & (x < w) & (y >= 0) & (y < h)
+
+        colors = numpy.full((len(points), 4), numpy.nan)
+        colors[inside] = pixels[y[inside], x[inside]] / 255
+        return colors
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     prescale.py
+#
+#     Batch scaling of images into cache files, in a pool of worker
+#     processes. Each worker has its own drawing state, so the canvas of the
+#     main process is not touched and pages can be drawn while images are
+#     scaled.
+#
+
+import os
+import importlib.util
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+
+HAS_PIL = True
+
+try:
+    from PIL import Image
+except ImportError:
+    HAS_PIL = False
+
+class ScaleJob:
+    """Image at path to be scaled to (w, h), for page index in case of a
+    multi-page source (e.g. PDF), and saved as target."""
+
+    def __init__(self, path, w, h, index=None, target=None):
+        self.path = path
+        self.w = w
+        self.h = h
+        self.index = index or 0
+        self.target = target
+
+    def __repr__(self):
+        return '<%s %s %dx%d.%d>' % (self.__class__.__name__,
+                os.path.basename(self.path), self.w, self.h, self.index)
+
+class ScaleResult:
+    """Result of a ScaleJob, with the seconds that the scaling took, or the
+    error message if it failed. Skipped is True if the target already
+    existed."""
+
+    def __init__(self, job, seconds=0, skipped=False, error=None):
+        self.job = job
+        self.seconds = seconds
+        self.skipped = skipped
+        self.error = error
+
+    def __repr__(self):
+        if self.error:
+            state = 'error %s' % self.error
+        elif self.skipped:
+            state = 'skipped'
+        else:
+            state = '%0.1f ms' % (self.seconds * 1000)
+        return '<%s %s %s>' % (self.__class__.__name__,
+                os.path.basename(self.job.target or ''), state)
+
+    def _get_path(self):
+        """Answers the path of the scaled image, or None if it failed."""
+        if self.error:
+            return None
+        return self.job.target
+    path = property(_get_path)
+
+def drawBotScaleImage(path, w, h, index, target):
+    """Scales the image in a new DrawBot drawing of (w, h) and saves it as
+    target, the same as DrawBotContext.scaleImage. Only to be called in a
+    worker process, as it replaces the drawing of the process."""
+    import drawBot
+
+    drawBot.newDrawing()
+    drawBot.newPage(w, h)
+    iw, ih = drawBot.imageSize(path)
+    s = min(w / iw, h / ih)
+    drawBot.scale(s, s)
+    drawBot.image(path, (0, 0), pageNumber=index)
+    drawBot.saveImage(target)
+    drawBot.endDrawing()
+
+def pillowScaleImage(path, w, h, index, target):
+    """Pillow stand-in of drawBotScaleImage, so that scaling and cache
+    handling also run without DrawBot. The image is scaled proportionally
+    to fit (w, h) and placed bottom-left on a transparent (w, h) canvas, as in
+    the DrawBot page. Index selects the frame of multi-frame images."""
+    assert HAS_PIL, 'Pillow is needed for pillowScaleImage'
+
+    with Image.open(path) as image:
+        if index:
+            image.seek(index)
+        s = min(w / image.width, h / image.height)
+        sw = max(1, round(image.width * s))
+        sh = max(1, round(image.height * s))
+        scaled = image.convert('RGBA').resize((sw, sh), Image.LANCZOS)
+
+    canvas = Image.new('RGBA', (int(w), int(h)), (0, 0, 0, 0))
+    canvas.paste(scaled, (0, int(h) - sh))
+    if os.path.splitext(target)[1].lower() in ('.jpg', '.jpeg'):
+        background = Image.new('RGB', canvas.size, (255, 255, 255))
+        background.paste(canvas, mask=canvas.getchannel('A'))
+        canvas = background
+    canvas.save(target)
+
+def getDefaultScaler():
+    """Answers drawBotScaleImage if DrawBot is installed, otherwise
+    pillowScaleImage. DrawBot is only imported by the workers.
+
+    >>> getDefaultScaler() in (drawBotScaleImage, pillowScaleImage)
+    True
+    """
+    if importlib.util.find_spec('drawBot') is not None:
+        return drawBotScaleImage
+    return pillowScaleImage
+
+def _runScaleJob(scaler, job):
+    """Runs the job in a worker. Answers a ScaleResult with the time of the
+    scaling or the error."""
+    t = perf_counter()
+    try:
+        targetDir = os.path.dirname(job.target)
+        if targetDir:
+            os.makedirs(targetDir, exist_ok=True)
+        scaler(job.path, job.w, job.h, job.index, job.target)
+    except Exception as e:
+        return ScaleResult(job, perf_counter() - t, error='%s: %s' % (
+            e.__class__.__name__, e))
+    return ScaleResult(job, perf_counter() - t)
+
+def prescaleImages(jobs, scaler=None, workers=None, force=False):
+    """Scales the images of the ScaleJob instances into their targets,
+    answering the list of ScaleResult instances in order of jobs. Jobs with
+    an existing target are skipped, unless force is True. Scaling runs in a
+    pool of workers processes (default the number of CPUs), also for a
+    single job or worker, so the drawing of this process is not touched.
+
+    >>> import tempfile
+    >>> from PIL import Image
+    >>> root = tempfile.mkdtemp()
+    >>> path = os.path.join(root, 'image.png')
+    >>> Image.new('RGB', (400, 200), (255, 0, 0)).save(path)
+    >>> jobs = [ScaleJob(path, 100, 100, target=os.path.join(root, '_scaled', 'a.png')),
+    ...     ScaleJob(path, 40, 20, target=os.path.join(root, '_scaled', 'b.jpg'))]
+    >>> results = prescaleImages(jobs, scaler=pillowScaleImage, workers=2)
+    >>> [(r.skipped, r.error, r.seconds > 0) for r in results]
+    [(False, None, True), (False, None, True)]
+    >>> Image.open(results[0].path).size, Image.open(results[0].path).getpixel((0, 99))
+    ((100, 100), (255, 0, 0, 255))
+    >>> [r.skipped for r in prescaleImages(jobs, scaler=pillowScaleImage, workers=1)]
+    [True, True]
+    >>> result = prescaleImages([ScaleJob(path + 'x', 10, 10, target=path + '.png')],
+    ...     scaler=pillowScaleImage)[0]
+    >>> result.path, result.error.startswith('FileNotFoundError')
+    (None, True)
+    """
+    if scaler is None:
+        scaler = getDefaultScaler()
+    results = [None] * len(jobs)
+    todo = []
+
+    for jobIndex, job in enumerate(jobs):
+        if not force and os.path.exists(job.target):
+            results[jobIndex] = ScaleResult(job, skipped=True)
+        else:
+            todo.append(jobIndex)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if todo:
+        # Scalers can replace the drawing of their process, so even a
+        # single job runs in a worker.
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(todo)))) as executor:
+            futures = [executor.submit(_runScaleJob, scaler, jobs[jobIndex])
+                    for jobIndex in todo]
+            for jobIndex, future in zip(todo, futures):
+                results[jobIndex] = future.result()
+
+    return results
+
+def prescaleReport(results):
+    """Answers the text with the timing of each scaled image and the
+    totals.
+
+    >>> job = ScaleJob('/images/a.png', 100, 80, target='/images/_scaled/a.100x80.0.png')
+    >>> print(prescaleReport([ScaleResult(job, 0.25), ScaleResult(job, skipped=True)]))
+    a.png 100x80.0      250.0 ms
+    a.png 100x80.0    skipped
+    1 scaled, 1 skipped, 0 errors, 250.0 ms in total
+    """
+    lines = []
+    scaled = skipped = errors = 0
+    seconds = 0
+
+    for result in results:
+        job = result.job
+        name = '%s %dx%d.%d' % (os.path.basename(job.path), job.w, job.h, job.index)
+        if result.error:
+            errors += 1
+            lines.append('%-16s  error %s' % (name, result.error))
+        elif result.skipped:
+            skipped += 1
+            lines.append('%-16s  skipped' % name)
+        else:
+            scaled += 1
+            seconds += result.seconds
+            lines.append('%-16s %8.1f ms' % (name, result.seconds * 1000))
+
+    lines.append('%d scaled, %d skipped, %d errors, %0.1f ms in total' % (
+        scaled, skipped, errors, seconds * 1000))
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     scaledcache.py
+#
+#     Cache folder of scaled images, keyed on the content hash of the source
+#     image and the scale parameters. A JSON manifest in the folder records
+#     the source, its hash, the parameters, the file size and the times of
+#     creation and last use of each scaled image. The total size can be
+#     limited, in which case the least recently used images are removed.
+#
+
+import os
+import json
+import hashlib
+from time import time
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+# Number of hexadecimal characters of the content hash in file names.
+HASH_LENGTH = 16
+HASH_BLOCK_SIZE = 1 << 20
+
+def getFileHash(path):
+    """Answers the SHA-256 hex digest of the content of the file.
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'a.txt')
+    >>> with open(path, 'wb') as f:
+    ...     _ = f.write(b'PageBot')
+    >>> getFileHash(path)[:16]
+    '0d3fb409fc6298ec'
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            h.update(block)
+    return h.hexdigest()
+
+class ScaledImageCache:
+    """Folder of scaled images with a JSON manifest. Scaled file names are
+    made from the source name, the parameters and the content hash of the
+    source, so a changed source never answers a stale scaled image. Hashes
+    of sources are kept for their (modification time, size), so unchanged
+    files are not read again. If maxSize (in bytes) is defined, adding images
+    removes the least recently used images until the total size fits.
+
+    >>> import tempfile
+    >>> from PIL import Image
+    >>> root = tempfile.mkdtemp()
+    >>> source = os.path.join(root, 'Image.png')
+    >>> Image.new('RGB', (400, 200), (255, 0, 0)).save(source)
+    >>> def scale(path, w, h, index, target):
+    ...     Image.open(path).resize((w, h)).save(target)
+    >>> cache = ScaledImageCache(os.path.join(root, '_scaled'))
+    >>> fileName = cache.getFileName(source, 100, 50)
+    >>> fileName.startswith('Image.100x50.0.') and fileName.endswith('.png')
+    True
+    >>> scaledPath = cache.getOrCreate(source, 100, 50, scale=scale)
+    >>> os.path.basename(scaledPath) == fileName
+    True
+    >>> cache.getOrCreate(source, 100, 50, scale=scale) == scaledPath
+    True
+    >>> cache.stats()['hits'], cache.stats()['misses'], cache.stats()['entries']
+    (1, 1, 1)
+    >>> entry = cache.manifest['images'][fileName]
+    >>> entry['source'] == source, entry['w'], entry['h'], entry['index']
+    (True, 100, 50, 0)
+    >>> # A changed source gets a new scaled image.
+    >>> Image.new('RGB', (400, 200), (0, 0, 255)).save(source)
+    >>> os.utime(source, ns=(0, 0))
+    >>> cache.getOrCreate(source, 100, 50, scale=scale) == scaledPath
+    False
+    >>> # The manifest is saved and read again.
+    >>> ScaledImageCache(cache.root).stats()['entries']
+    2
+    >>> cache.prune() == [scaledPath] # Source of first image has changed.
+    True
+    >>> os.path.exists(scaledPath), len(cache)
+    (False, 1)
+    """
+
+    def __init__(self, root, maxSize=None, autoSave=True):
+        self.root = root
+        self.maxSize = maxSize
+        # Save the manifest after each change.
+        self.autoSave = autoSave
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.manifest = self._readManifest()
+
+    def __len__(self):
+        return len(self.manifest['images'])
+
+    def __repr__(self):
+        return '<%s %s %d images>' % (self.__class__.__name__, self.root, len(self))
+
+    def _get_manifestPath(self):
+        return os.path.join(self.root, MANIFEST_NAME)
+    manifestPath = property(_get_manifestPath)
+
+    def _get_totalSize(self):
+        """Answers the total size in bytes of the scaled images."""
+        return sum(entry['size'] for entry in self.manifest['images'].values())
+    totalSize = property(_get_totalSize)
+
+    def _readManifest(self):
+        """Answers the manifest dictionary of the folder, or a new one if it
+        does not exist or cannot be read."""
+        try:
+            with open(self.manifestPath) as f:
+                manifest = json.load(f)
+            if manifest.get('version') == MANIFEST_VERSION:
+                return manifest
+        except (OSError, ValueError):
+            pass
+        return dict(version=MANIFEST_VERSION, images={}, sources={})
+
+    def save(self):
+        """Writes the manifest. The file is replaced in one step, so readers
+        never see a partial manifest."""
+        os.makedirs(self.root, exist_ok=True)
+        tmpPath = self.manifestPath + '.tmp'
+        with open(tmpPath, 'w') as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(tmpPath, self.manifestPath)
+
+    def _changed(self):
+        if self.autoSave:
+            self.save()
+
+    #   K E Y S
+
+    def getSourceHash(self, path):
+        """Answers the content hash of the source image, or None if it does
+        not exist. The hash is read again only if the modification time or
+        the size of the file changed."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        source = self.manifest['sources'].get(os.path.abspath(path))
+        if source is not None and source[:2] == [stat.st_mtime_ns, stat.st_size]:
+            return source[2]
+        sourceHash = getFileHash(path)
+        self.manifest['sources'][os.path.abspath(path)] = [stat.st_mtime_ns,
+                stat.st_size, sourceHash]
+        return sourceHash
+
+    def getFileName(self, path, w, h, index=None, exportExtension=None):
+        """Answers the name of the scaled image file, made of the source name,
+        the parameters and the content hash of the source. Sources that do
+        not exist answer the name without hash."""
+        fileNameParts = os.path.basename(path).split('.')
+        if not exportExtension:
+            exportExtension = fileNameParts[-1].lower()
+        parts = ['.'.join(fileNameParts[:-1]), '%dx%d' % (w, h), '%d' % (index or 0)]
+        sourceHash = self.getSourceHash(path)
+        if sourceHash:
+            parts.append(sourceHash[:HASH_LENGTH])
+        parts.append(exportExtension)
+        return '.'.join(parts)
+
+    def getPath(self, path, w, h, index=None, exportExtension=None):
+        """Answers the path of the scaled image in the cache folder, existing
+        or not."""
+        return os.path.join(self.root, self.getFileName(path, w, h, index,
+            exportExtension))
+
+    #   A C C E S S
+
+    def get(self, path, w, h, index=None, exportExtension=None):
+        """Answers the path of the cached scaled image, or None if it is not
+        in the cache. Counts as a hit or a miss. The new time of use is
+        written with the next change of the manifest, or by self.save()."""
+        fileName = self.getFileName(path, w, h, index, exportExtension)
+        entry = self.manifest['images'].get(fileName)
+        scaledPath = os.path.join(self.root, fileName)
+
+        if entry is not None and os.path.exists(scaledPath):
+            entry['used'] = time()
+            self.hits += 1
+            return scaledPath
+
+        self.misses += 1
+        return None
+
+    def add(self, path, w, h, index=None, exportExtension=None):
+        """Registers the scaled image of the source that was saved at
+        self.getPath(...) and removes the least recently used images if the
+        total size is over maxSize. Answers the path of the scaled image."""
+        fileName = self.getFileName(path, w, h, index, exportExtension)
+        scaledPath = os.path.join(self.root, fileName)
+        now = time()
+        self.manifest['images'][fileName] = dict(source=os.path.abspath(path),
+            sourceHash=self.getSourceHash(path), w=w, h=h, index=index or 0,
+            exportExtension=fileName.split('.')[-1],
+            size=os.path.getsize(scaledPath), created=now, used=now)
+        self.evict(keep=fileName)
+        self._changed()
+        return scaledPath
+
+    def getOrCreate(self, path, w, h, index=None, exportExtension=None,
+            scale=None):
+        """Answers the path of the scaled image. In case it is not in the
+        cache, call `scale(path, w, h, index, scaledPath)` to make it, then
+        add it."""
+        scaledPath = self.get(path, w, h, index, exportExtension)
+        if scaledPath is None:
+            os.makedirs(self.root, exist_ok=True)
+            scale(path, w, h, index or 0, self.getPath(path, w, h, index,
+                exportExtension))
+            scaledPath = self.add(path, w, h, index, exportExtension)
+        return scaledPath
+
+    def remove(self, fileName):
+        """Removes the scaled image file and its manifest entry."""
+        self.manifest['images'].pop(fileName, None)
+        try:
+            os.remove(os.path.join(self.root, fileName))
+        except OSError:
+            pass
+
+    def evict(self, maxSize=None, keep=None):
+        """Removes the least recently used images until the total size is
+        not larger than maxSize (default self.maxSize). The keep file is
+        not removed. Answers the list of removed paths."""
+        if maxSize is None:
+            maxSize = self.maxSize
+        removed = []
+        if maxSize is None:
+            return removed
+
+        images = self.manifest['images']
+        totalSize = self.totalSize
+        for fileName in sorted(images, key=lambda name: images[name]['used']):
+            if totalSize <= maxSize:
+                break
+            if fileName == keep:
+                continue
+            totalSize -= images[fileName]['size']
+            self.remove(fileName)
+            self.evictions += 1
+            removed.append(os.path.join(self.root, fileName))
+        return removed
+
+    def prune(self, maxSize=None, maxAge=None):
+        """Cleans the cache folder. Removes entries of which the scaled file
+        is missing, scaled images of sources that changed or no longer
+        exist, images not used in the last maxAge seconds, files that are not
+        in the manifest, and then the least recently used images over
+        maxSize. Answers the sorted list of removed paths."""
+        images = self.manifest['images']
+        removed = []
+        now = time()
+
+        # Forget the source hashes, so that changed sources are read again.
+        oldSources = self.manifest['sources']
+        self.manifest['sources'] = {}
+
+        for fileName, entry in list(images.items()):
+            scaledPath = os.path.join(self.root, fileName)
+            if not os.path.exists(scaledPath):
+                del images[fileName]
+            elif (self.getSourceHash(entry['source']) != entry['sourceHash'] or
+                    (maxAge is not None and now - entry['used'] > maxAge)):
+                self.remove(fileName)
+                removed.append(scaledPath)
+
+        # Keep the hashes of sources that are still in use.
+        for entry in images.values():
+            if entry['source'] not in self.manifest['sources'] and entry['source'] in oldSources:
+                self.manifest['sources'][entry['source']] = oldSources[entry['source']]
+
+        if os.path.isdir(self.root):
+            for fileName in os.listdir(self.root):
+                if fileName not in images and fileName != MANIFEST_NAME:
+                    path = os.path.join(self.root, fileName)
+                    if os.path.isfile(path):
+                        os.remove(path)
+                        removed.append(path)
+
+        removed += self.evict(maxSize)
+        self.save()
+        return sorted(removed)
+
+    def invalidate(self):
+        """Removes all scaled images and clears the manifest."""
+        for fileName in list(self.manifest['images']):
+            self.remove(fileName)
+        self.manifest['sources'] = {}
+        self._changed()
+
+    def resetCounters(self):
+        self.hits = self.misses = self.evictions = 0
+
+    def _get_hitRate(self):
+        total = self.hits + self.misses
+        if not total:
+            return 0
+        return self.hits / total
+    hitRate = property(_get_hitRate)
+
+    def stats(self):
+        """Answers the dictionary with the number of images, their total size
+        and the hits, misses and evictions since the cache was opened."""
+        return dict(entries=len(self), size=self.totalSize,
+                maxSize=self.maxSize, hits=self.hits, misses=self.misses,
+                evictions=self.evictions, hitRate=self.hitRate)
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     contours.py
+#
+
+import numpy
+
+class ContourView:
+    """Read-only view on one contour of ContourArrays, behaving as the list
+    of (x, y) tuples that getFlattenedContours answers."""
+
+    __slots__ = ('_points',)
+
+    def __init__(self, points):
+        self._points = points
+
+    def __len__(self):
+        return len(self._points)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [tuple(p) for p in self._points[index].tolist()]
+        return tuple(self._points[index].tolist())
+
+    def __iter__(self):
+        for p in self._points.tolist():
+            yield tuple(p)
+
+    def __repr__(self):
+        return '<%s %d points>' % (self.__class__.__name__, len(self))
+
+    def _get_points(self):
+        """Answers the (n, 2) array of the points of this contour."""
+        return self._points
+    points = property(_get_points)
+
+class ContourArrays:
+    """Flattened contours stored as one (N, 2) float64 point buffer and an
+    array of contour offsets, where contour i holds the points
+    points[offsets[i]:offsets[i+1]].
+
+    >>> contours = ContourArrays.fromContours([[(0, 0), (10, 0), (10, 10)], [(20, 20), (30, 20)]])
+    >>> len(contours), contours.points.shape, contours.offsets.tolist()
+    (2, (5, 2), [0, 3, 5])
+    >>> contours[1].points.tolist()
+    [[20.0, 20.0], [30.0, 20.0]]
+    >>> list(contours[1])
+    [(20.0, 20.0), (30.0, 20.0)]
+    >>> contours.toLists()
+    [[(0.0, 0.0), (10.0, 0.0), (10.0, 10.0)], [(20.0, 20.0), (30.0, 20.0)]]
+    >>> contours.bounds()
+    (0.0, 0.0, 30.0, 20.0)
+    """
+
+    def __init__(self, points, offsets):
+        self.points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        self.offsets = numpy.asarray(offsets, dtype=numpy.intp)
+        assert len(self.offsets) >= 1 and self.offsets[-1] == len(self.points)
+
+    @classmethod
+    def fromContours(cls, contours):
+        """Answers a new ContourArrays from a list of point lists."""
+        offsets = [0]
+        for contour in contours:
+            offsets.append(offsets[-1] + len(contour))
+        points = [p for contour in contours for p in contour]
+        return cls(numpy.array(points, dtype=numpy.float64).reshape(-1, 2),
+                offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return ContourView(self.points[self.offsets[index]:self.offsets[index+1]])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __repr__(self):
+        return '<%s %d contours, %d points>' % (self.__class__.__name__,
+                len(self), len(self.points))
+
+    def toLists(self):
+        """Answers the contours as list of lists of (x, y) tuples, as answered
+        by getFlattenedContours."""
+        return [list(contour) for contour in self]
+
+    def bounds(self):
+        """Answers (minX, minY, maxX, maxY) of all points, or None if there
+        are no points."""
+        if not len(self.points):
+            return None
+        (minX, minY), (maxX, maxY) = self.points.min(axis=0), self.points.max(axis=0)
+        return float(minX), float(minY), float(maxX), float(maxY)
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
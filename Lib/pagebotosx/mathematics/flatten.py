@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     flatten.py
+#
+#     Backend-neutral flattening of Bézier command streams into ContourArrays,
+#     without NSBezierPath, so it also runs outside OS X. The number of line
+#     segments for each curve follows Wang's formula for the given flatness
+#     tolerance, and all curves are evaluated together by NumPy.
+#
+
+import numpy
+from pagebotosx.graphics.glyphoutlines import getGlyphCommands
+from pagebotosx.mathematics.contours import ContourArrays
+
+# Same default flatness as NSBezierPath.
+DEFAULT_FLATNESS = 0.6
+# Maximum number of line segments for a single curve.
+MAX_CURVE_STEPS = 1000
+
+def getCurveSteps(p0, p1, p2, p3, tolerance=DEFAULT_FLATNESS):
+    """Answers the array with the number of line segments for each of the
+    cubic curves in the (K, 2) arrays of points, so that no point of the
+    curve is more than tolerance away from the segments (Wang's formula).
+
+    >>> p = numpy.array
+    >>> getCurveSteps(p([[0, 0]]), p([[10, 0]]), p([[20, 0]]), p([[30, 0]])).tolist() # Straight
+    [1]
+    >>> getCurveSteps(p([[0, 0]]), p([[0, 100]]), p([[100, 100]]), p([[100, 0]])).tolist()
+    [14]
+    >>> getCurveSteps(p([[0, 0]]), p([[0, 100]]), p([[100, 100]]), p([[100, 0]]), 0.01).tolist()
+    [103]
+    """
+    d1 = numpy.hypot(*(p0 - 2*p1 + p2).T)
+    d2 = numpy.hypot(*(p1 - 2*p2 + p3).T)
+    steps = numpy.ceil(numpy.sqrt(0.75 * numpy.maximum(d1, d2) / tolerance))
+    return numpy.clip(steps, 1, MAX_CURVE_STEPS).astype(numpy.intp)
+
+def evaluateCurves(p0, p1, p2, p3, steps):
+    """Answers the (sum(steps), 2) array of points of all cubic curves,
+    sampled at t = 1/n, 2/n, ... 1 for each curve with n steps. The start
+    point of each curve is not included, as it is the end of the previous
+    segment.
+
+    >>> p = numpy.array
+    >>> evaluateCurves(p([[0, 0]]), p([[0, 10]]), p([[10, 10]]), p([[10, 0]]), p([2])).tolist()
+    [[5.0, 7.5], [10.0, 0.0]]
+    """
+    # Index of the curve of each sample, and t of each sample.
+    curveIndices = numpy.repeat(numpy.arange(len(steps)), steps)
+    starts = numpy.cumsum(steps) - steps
+    k = numpy.arange(len(curveIndices)) - starts[curveIndices] + 1
+    t = (k / steps[curveIndices])[:, None]
+    mt = 1 - t
+
+    return (mt**3 * p0[curveIndices] + 3 * mt**2 * t * p1[curveIndices] +
+            3 * mt * t**2 * p2[curveIndices] + t**3 * p3[curveIndices])
+
+def flattenCommands(commands, tolerance=DEFAULT_FLATNESS):
+    """Answers the ContourArrays of the flattened command stream of
+    (command, points) tuples, as answered by getGlyphCommands. Quadratic
+    'qCurveTo' segments are elevated to cubics. Similar to
+    getFlattenedContours, a new contour starts after each closePath.
+
+    >>> commands = [('moveTo', ((0, 0),)), ('lineTo', ((100, 0),)),
+    ...     ('curveTo', ((100, 50), (50, 100), (0, 100))), ('closePath', None)]
+    >>> contours = flattenCommands(commands)
+    >>> len(contours), len(contours[1]) # Empty contour after closePath.
+    (2, 0)
+    >>> contours[0][:2], contours[0][-1]
+    ([(0.0, 0.0), (100.0, 0.0)], (0.0, 100.0))
+    >>> len(flattenCommands(commands, tolerance=0.01)[0]) > len(contours[0])
+    True
+    >>> flattenCommands([('moveTo', ((0, 0),)), ('qCurveTo', ((50, 100), (100, 0)))], 4)[0][:]
+    [(0.0, 0.0), (25.0, 37.5), (50.0, 50.0), (75.0, 37.5), (100.0, 0.0)]
+    """
+    # Pieces of each contour: a single point, or the index of a curve.
+    contours = [[]]
+    curves = []
+    current = (0, 0)
+
+    for command, points in commands:
+        if command in ('moveTo', 'lineTo'):
+            current = points[0]
+            contours[-1].append(current)
+        elif command == 'curveTo':
+            curves.append((current,) + tuple(points))
+            contours[-1].append(len(curves) - 1)
+            current = points[-1]
+        elif command == 'qCurveTo':
+            (qx, qy), (x, y) = points
+            cx, cy = current
+            curves.append((current, (cx + 2*(qx - cx)/3, cy + 2*(qy - cy)/3),
+                (x + 2*(qx - x)/3, y + 2*(qy - y)/3), (x, y)))
+            contours[-1].append(len(curves) - 1)
+            current = (x, y)
+        elif command == 'closePath':
+            contours.append([])
+
+    if curves:
+        p0, p1, p2, p3 = numpy.array(curves, dtype=numpy.float64).transpose(1, 0, 2)
+        steps = getCurveSteps(p0, p1, p2, p3, tolerance)
+        curvePoints = evaluateCurves(p0, p1, p2, p3, steps)
+        curveEnds = numpy.cumsum(steps)
+    else:
+        steps = curvePoints = curveEnds = None
+
+    blocks = []
+    offsets = [0]
+    for contour in contours:
+        size = 0
+        for piece in contour:
+            if isinstance(piece, tuple):
+                blocks.append(numpy.array([piece], dtype=numpy.float64))
+                size += 1
+            else:
+                end = curveEnds[piece]
+                blocks.append(curvePoints[end - steps[piece]:end])
+                size += steps[piece]
+        offsets.append(offsets[-1] + size)
+
+    if blocks:
+        points = numpy.concatenate(blocks)
+    else:
+        points = numpy.empty((0, 2), dtype=numpy.float64)
+    return ContourArrays(points, offsets)
+
+def flattenGlyph(glyph, p=None, tolerance=DEFAULT_FLATNESS):
+    """Answers the ContourArrays of the flattened glyph.cubic stream, with
+    components resolved and optional offset p, the same stream that
+    getGlyphPath draws.
+
+    >>> from types import SimpleNamespace as Glyph
+    >>> glyph = Glyph(name='I', cubic=[('moveTo', (0, 0)), ('lineTo', (0, 10)),
+    ...     ('lineTo', (5, 10)), ('closePath', None)])
+    >>> flattenGlyph(glyph, (100, 0)).toLists()
+    [[(100.0, 0.0), (100.0, 10.0), (105.0, 10.0)], []]
+    """
+    return flattenCommands(getGlyphCommands(glyph, p), tolerance=tolerance)
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
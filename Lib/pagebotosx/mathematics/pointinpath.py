@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     pointinpath.py
+#
+#     Vectorized winding-number test of many points against flattened
+#     contours, as alternative to NSBezierPath.containsPoint_ for each single
+#     point.
+#
+
+import numpy
+
+FILL_RULE_NONZERO = 'nonzero'
+FILL_RULE_EVENODD = 'evenodd'
+FILL_RULES = (FILL_RULE_NONZERO, FILL_RULE_EVENODD)
+
+# Maximum number of point-edge pairs that are tested in one NumPy block.
+MAX_BLOCK_SIZE = 1 << 22
+
+def getEdges(contours):
+    """Answers the (ax, ay, bx, by) arrays of all edges of the ContourArrays.
+    Contours are closed implicitly, from the last point back to the first.
+
+    >>> from pagebotosx.mathematics.contours import ContourArrays
+    >>> contours = ContourArrays.fromContours([[(0, 0), (10, 0), (10, 10)], []])
+    >>> [v.tolist() for v in getEdges(contours)]
+    [[0.0, 10.0, 10.0], [0.0, 0.0, 10.0], [10.0, 10.0, 0.0], [0.0, 10.0, 0.0]]
+    """
+    points = contours.points
+    offsets = contours.offsets
+    ends = numpy.arange(1, len(points) + 1)
+    # The edge from the last point of each (non-empty) contour goes back to
+    # its first point.
+    starts, lasts = offsets[:-1], offsets[1:] - 1
+    nonEmpty = lasts >= starts
+    ends[lasts[nonEmpty]] = starts[nonEmpty]
+    ax, ay = points.T
+    bx, by = points[ends].T
+    return ax, ay, bx, by
+
+def windingNumbers(points, contours):
+    """Answers the int array with the winding number of each (x, y) in the
+    (N, 2) array of points, for all edges of the ContourArrays. Points outside
+    the bounding box of the contours answer 0 without testing the edges.
+
+    >>> from pagebotosx.mathematics.contours import ContourArrays
+    >>> square = [(0, 0), (100, 0), (100, 100), (0, 100)]
+    >>> inner = [(25, 25), (75, 25), (75, 75), (25, 75)] # Same direction.
+    >>> contours = ContourArrays.fromContours([square, inner])
+    >>> windingNumbers([(50, 50), (10, 10), (150, 50), (-1, 50)], contours).tolist()
+    [2, 1, 0, 0]
+    """
+    points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+    winding = numpy.zeros(len(points), dtype=numpy.intp)
+    bounds = contours.bounds()
+
+    if bounds is None or not len(points):
+        return winding
+
+    minX, minY, maxX, maxY = bounds
+    px, py = points.T
+    inBox = numpy.flatnonzero((px >= minX) & (px <= maxX) & (py >= minY) & (py <= maxY))
+
+    ax, ay, bx, by = getEdges(contours)
+    blockSize = max(1, MAX_BLOCK_SIZE // max(1, len(ax)))
+
+    for blockStart in range(0, len(inBox), blockSize):
+        indices = inBox[blockStart:blockStart+blockSize]
+        x = px[indices, None]
+        y = py[indices, None]
+        # Positive if the point is left of the edge.
+        isLeft = (bx - ax) * (y - ay) - (x - ax) * (by - ay)
+        upward = (ay <= y) & (by > y) & (isLeft > 0)
+        downward = (ay > y) & (by <= y) & (isLeft < 0)
+        winding[indices] = upward.sum(axis=1) - downward.sum(axis=1)
+
+    return winding
+
+def pointsInContours(points, contours, fillRule=FILL_RULE_NONZERO):
+    """Answers the boolean mask of the (x, y) points in the (N, 2) array that
+    are inside the ContourArrays, for the 'nonzero' or 'evenodd' fill rule.
+
+    >>> from pagebotosx.mathematics.contours import ContourArrays
+    >>> square = [(0, 0), (100, 0), (100, 100), (0, 100)]
+    >>> inner = [(25, 25), (75, 25), (75, 75), (25, 75)]
+    >>> contours = ContourArrays.fromContours([square, inner])
+    >>> points = [(50, 50), (10, 10), (150, 50)]
+    >>> pointsInContours(points, contours).tolist()
+    [True, True, False]
+    >>> pointsInContours(points, contours, fillRule='evenodd').tolist()
+    [False, True, False]
+    >>> pointsInContours(points, contours, fillRule='xor')
+    Traceback (most recent call last):
+        ...
+    ValueError: Fill rule "xor" must be one of ('nonzero', 'evenodd')
+    """
+    if fillRule not in FILL_RULES:
+        raise ValueError('Fill rule "%s" must be one of %s' % (fillRule, FILL_RULES))
+
+    winding = windingNumbers(points, contours)
+
+    if fillRule == FILL_RULE_EVENODD:
+        return (winding & 1).astype(bool)
+    return winding != 0
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
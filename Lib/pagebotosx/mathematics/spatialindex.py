@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     spatialindex.py
+#
+#     Uniform grid over the segments of flattened contours, so that point,
+#     rectangle and nearest-segment queries only test the segments in the
+#     nearby cells. The index is built once and can be queried any number of
+#     times.
+#
+
+import numpy
+from pagebotosx.mathematics.contours import ContourArrays
+from pagebotosx.mathematics.pointinpath import getEdges
+
+# Average number of segments per grid cell.
+SEGMENTS_PER_CELL = 4
+# Maximum number of cells of the grid in each direction.
+MAX_GRID_SIZE = 1024
+
+class ContourIndex:
+    """Spatial index of the segments of ContourArrays (or lists of point
+    lists, as answered by getFlattenedContours). Holds the bounding box of
+    each contour and of each segment, and a uniform grid of cells with the
+    indices of the segments that overlap each cell.
+
+    >>> square = [(0, 0), (100, 0), (100, 100), (0, 100)]
+    >>> hole = [(25, 25), (25, 75), (75, 75), (75, 25)]
+    >>> dot = [(200, 200), (210, 200), (210, 210), (200, 210)]
+    >>> index = ContourIndex([square, hole, dot])
+    >>> index
+    <ContourIndex 3 contours, 12 segments>
+    >>> index.contourBounds[2].tolist()
+    [200.0, 200.0, 210.0, 210.0]
+    >>> index.contoursAt(50, 50), index.contoursAt(10, 10), index.contoursAt(150, 150)
+    ([0, 1], [0], [])
+    >>> index.contoursInRect((90, 90, 205, 205)) # Touches square and dot.
+    [0, 2]
+    >>> index.contoursInRect((40, 40, 60, 60)) # Inside the hole.
+    [0, 1]
+    >>> index.segmentsInRect((-10, 40, 10, 60))
+    [3]
+    >>> segment, contour, distance, p = index.nearestSegment(50, 30)
+    >>> segment, contour, distance, p
+    (7, 1, 5.0, (50.0, 25.0))
+    >>> index.nearestSegment(215, 205)
+    (9, 2, 5.0, (210.0, 205.0))
+    """
+
+    def __init__(self, contours):
+        if not isinstance(contours, ContourArrays):
+            contours = ContourArrays.fromContours(contours)
+        self.contours = contours
+
+        # Segments of all contours, closed from the last to the first point.
+        self.ax, self.ay, self.bx, self.by = getEdges(contours)
+        counts = numpy.diff(contours.offsets)
+        self.segmentContours = numpy.repeat(numpy.arange(len(counts)), counts)
+        self.segmentBounds = numpy.stack((numpy.minimum(self.ax, self.bx),
+            numpy.minimum(self.ay, self.by), numpy.maximum(self.ax, self.bx),
+            numpy.maximum(self.ay, self.by)), axis=1)
+
+        # Bounds of each contour, NaN for empty contours.
+        self.contourBounds = numpy.full((len(counts), 4), numpy.nan)
+        nonEmpty = numpy.flatnonzero(counts)
+        if len(nonEmpty):
+            starts = contours.offsets[nonEmpty]
+            b = self.segmentBounds
+            self.contourBounds[nonEmpty, 0] = numpy.minimum.reduceat(b[:, 0], starts)
+            self.contourBounds[nonEmpty, 1] = numpy.minimum.reduceat(b[:, 1], starts)
+            self.contourBounds[nonEmpty, 2] = numpy.maximum.reduceat(b[:, 2], starts)
+            self.contourBounds[nonEmpty, 3] = numpy.maximum.reduceat(b[:, 3], starts)
+
+        self._buildGrid()
+
+    def __len__(self):
+        return len(self.ax)
+
+    def __repr__(self):
+        return '<%s %d contours, %d segments>' % (self.__class__.__name__,
+                len(self.contours), len(self))
+
+    def _buildGrid(self):
+        """Sorts the segments into the cells of the grid that their bounding
+        boxes overlap, as one array of segment indices sorted by cell and an
+        array with the start of each cell."""
+        n = len(self)
+        if n:
+            x0, y0 = self.segmentBounds[:, :2].min(axis=0)
+            x1, y1 = self.segmentBounds[:, 2:].max(axis=0)
+        else:
+            x0 = y0 = 0
+            x1 = y1 = 1
+        w = max(x1 - x0, 1e-9)
+        h = max(y1 - y0, 1e-9)
+        cells = max(1, n // SEGMENTS_PER_CELL)
+        cellSize = (w * h / cells) ** 0.5 or max(w, h) / cells
+        self.columns = int(min(MAX_GRID_SIZE, max(1, numpy.ceil(w / cellSize))))
+        self.rows = int(min(MAX_GRID_SIZE, max(1, numpy.ceil(h / cellSize))))
+        self.origin = x0, y0
+        self.cellSize = w / self.columns, h / self.rows
+
+        c0, r0 = self._getCell(self.segmentBounds[:, 0], self.segmentBounds[:, 1])
+        c1, r1 = self._getCell(self.segmentBounds[:, 2], self.segmentBounds[:, 3])
+        spanX = c1 - c0 + 1
+        spanY = r1 - r0 + 1
+        counts = spanX * spanY
+
+        # For each (segment, cell) pair, the segment index and its cell.
+        segments = numpy.repeat(numpy.arange(n), counts)
+        k = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        columns = c0[segments] + k % spanX[segments]
+        rows = r0[segments] + k // spanX[segments]
+        cellIndices = rows * self.columns + columns
+
+        order = numpy.argsort(cellIndices, kind='stable')
+        self._cellSegments = segments[order]
+        self._cellStarts = numpy.searchsorted(cellIndices[order],
+                numpy.arange(self.rows * self.columns + 1))
+
+    def _getCell(self, x, y):
+        """Answers the (column, row) of the cells of x and y, clipped to the
+        grid."""
+        (x0, y0), (cw, ch) = self.origin, self.cellSize
+        column = numpy.clip(numpy.floor((numpy.asarray(x) - x0) / cw), 0, self.columns - 1)
+        row = numpy.clip(numpy.floor((numpy.asarray(y) - y0) / ch), 0, self.rows - 1)
+        return column.astype(numpy.intp), row.astype(numpy.intp)
+
+    def _getCellSegments(self, c0, r0, c1, r1):
+        """Answers the unique segment indices in the cells from (c0, r0) to
+        (c1, r1), inclusive."""
+        blocks = []
+        for row in range(r0, r1 + 1):
+            start = self._cellStarts[row * self.columns + c0]
+            end = self._cellStarts[row * self.columns + c1 + 1]
+            blocks.append(self._cellSegments[start:end])
+        if not blocks:
+            return numpy.empty(0, dtype=numpy.intp)
+        return numpy.unique(numpy.concatenate(blocks))
+
+    def _getRectCells(self, x0, y0, x1, y1):
+        """Answers the (c0, r0, c1, r1) cells of the rectangle, or None if it
+        is outside the grid."""
+        gx, gy = self.origin
+        if (x1 < gx or y1 < gy or x0 > gx + self.columns * self.cellSize[0] or
+                y0 > gy + self.rows * self.cellSize[1]):
+            return None
+        c0, r0 = self._getCell(x0, y0)
+        c1, r1 = self._getCell(x1, y1)
+        return int(c0), int(r0), int(c1), int(r1)
+
+    def windingNumbers(self, x, y):
+        """Answers the array with the winding number of the point for each
+        contour. Only the segments in the grid row of the point, right of the
+        point, can cross its horizontal ray."""
+        winding = numpy.zeros(len(self.contours), dtype=numpy.intp)
+        cells = self._getRectCells(x, y, x, y)
+        if cells is None:
+            return winding
+        c0, row, _, _ = cells
+        segments = self._getCellSegments(c0, row, self.columns - 1, row)
+        ax, ay, bx, by = (v[segments] for v in (self.ax, self.ay, self.bx, self.by))
+        isLeft = (bx - ax) * (y - ay) - (x - ax) * (by - ay)
+        crossings = (((ay <= y) & (by > y) & (isLeft > 0)).astype(numpy.intp) -
+                ((ay > y) & (by <= y) & (isLeft < 0)))
+        numpy.add.at(winding, self.segmentContours[segments], crossings)
+        return winding
+
+    def contoursAt(self, x, y):
+        """Answers the sorted list of indices of the contours that contain
+        the point, each contour tested on its own (nonzero winding)."""
+        return numpy.flatnonzero(self.windingNumbers(x, y)).tolist()
+
+    def segmentsInRect(self, rect):
+        """Answers the sorted list of indices of the segments that intersect
+        the (x0, y0, x1, y1) rectangle."""
+        x0, y0, x1, y1 = rect
+        cells = self._getRectCells(x0, y0, x1, y1)
+        if cells is None:
+            return []
+        segments = self._getCellSegments(*cells)
+        b = self.segmentBounds[segments]
+        segments = segments[(b[:, 0] <= x1) & (b[:, 2] >= x0) & (b[:, 1] <= y1) & (b[:, 3] >= y0)]
+
+        # The segment intersects if the corners of the rectangle are not all
+        # on the same side of its line.
+        ax, ay, bx, by = (v[segments, None] for v in (self.ax, self.ay, self.bx, self.by))
+        cx = numpy.array((x0, x1, x1, x0))
+        cy = numpy.array((y0, y0, y1, y1))
+        sides = numpy.sign((bx - ax) * (cy - ay) - (cx - ax) * (by - ay))
+        crossing = (sides.min(axis=1) <= 0) & (sides.max(axis=1) >= 0)
+        return segments[crossing].tolist()
+
+    def contoursInRect(self, rect):
+        """Answers the sorted list of indices of the contours with an outline
+        that intersects the (x0, y0, x1, y1) rectangle, or that contain the
+        rectangle."""
+        x0, y0, x1, y1 = rect
+        segments = self.segmentsInRect(rect)
+        contours = set(self.segmentContours[segments].tolist())
+        # Rectangles without crossing segments can be inside a contour.
+        contours.update(self.contoursAt(x0, y0))
+        return sorted(contours)
+
+    def nearestSegment(self, x, y):
+        """Answers (segment, contour, distance, (nx, ny)) of the segment that
+        is nearest to the point, where (nx, ny) is the nearest point on the
+        segment. The search starts in the cell of the point and grows ring by
+        ring until no closer segment can exist. Answers None if there are no
+        segments."""
+        if not len(self):
+            return None
+        cw, ch = self.cellSize
+        cellSize = min(cw, ch)
+        c, r = (int(v) for v in self._getCell(x, y))
+        best = None
+        maxRing = max(self.columns, self.rows)
+
+        for ring in range(maxRing + 1):
+            segments = self._getCellSegments(max(0, c - ring), max(0, r - ring),
+                    min(self.columns - 1, c + ring), min(self.rows - 1, r + ring))
+            if len(segments):
+                distances, nx, ny = self._getDistances(segments, x, y)
+                index = int(numpy.argmin(distances))
+                best = (int(segments[index]), float(distances[index]),
+                        (float(nx[index]), float(ny[index])))
+                # Segments outside the searched cells are at least this far.
+                if best[1] <= ring * cellSize:
+                    break
+        segment, distance, p = best
+        return segment, int(self.segmentContours[segment]), distance, p
+
+    def _getDistances(self, segments, x, y):
+        """Answers the distances from the point to the segments, and the
+        nearest points on the segments."""
+        ax, ay, bx, by = (v[segments] for v in (self.ax, self.ay, self.bx, self.by))
+        dx = bx - ax
+        dy = by - ay
+        lengths = dx*dx + dy*dy
+        t = numpy.clip(((x - ax)*dx + (y - ay)*dy) / numpy.where(lengths, lengths, 1), 0, 1)
+        nx = ax + t * dx
+        ny = ay + t * dy
+        return numpy.hypot(nx - x, ny - y), nx, ny
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
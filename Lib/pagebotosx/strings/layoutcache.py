@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     layoutcache.py
+#
+#     Caches the result of wrapping a BabelString into lines. The key is made
+#     from the exact values of the runs, not from the BabelString instance, so
+#     equal paragraphs share their layout and changed runs make a new key.
+#     Styles with values that have no exact key are not cached.
+#
+
+from pagebotosx.toolbox.lrucache import LRUCache
+
+# Maximum nesting of style values, e.g. units with a base unit.
+MAX_KEY_DEPTH = 8
+
+def styleValueKey(value, depth=0):
+    """Answers the exact hashable key of a style value. Values that hash by
+    value are their own key, containers are keyed on their items, fonts on
+    their path and other objects, such as units and colors, on their class
+    and attributes. Raises TypeError if there is no exact key.
+
+    >>> from types import SimpleNamespace as Unit
+    >>> styleValueKey(Unit(v=1.125, base=12)) == styleValueKey(Unit(v=1.13, base=12))
+    False
+    >>> styleValueKey(Unit(v=1, base=12)) == styleValueKey(Unit(v=1, base=24))
+    False
+    >>> styleValueKey([1, dict(a=2)])
+    ('list', 1, ('dict', ('a', 2)))
+    >>> styleValueKey(len)
+    Traceback (most recent call last):
+    ...
+    TypeError: No exact key for builtin_function_or_method
+    """
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return value
+    if depth > MAX_KEY_DEPTH or callable(value):
+        raise TypeError('No exact key for %s' % type(value).__name__)
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__,) + tuple(styleValueKey(item, depth + 1)
+                for item in value)
+    if isinstance(value, dict):
+        return ('dict',) + tuple(sorted(((key, styleValueKey(item, depth + 1))
+                for key, item in value.items()), key=lambda item: repr(item[0])))
+    if type(value).__hash__ not in (None, object.__hash__):
+        return value # Compares and hashes by value.
+    path = getattr(value, 'path', None)
+    if isinstance(path, str):
+        return type(value), path
+    attributes = getattr(value, '__dict__', None)
+    if attributes is None:
+        raise TypeError('No exact key for %s' % type(value).__name__)
+    return (type(value),) + tuple(sorted((name, styleValueKey(item, depth + 1))
+            for name, item in attributes.items()))
+
+def styleFingerprint(style):
+    """Answers a hashable fingerprint of the style dictionary, made from the
+    exact keys of its values. Answers None if a value has no exact key, in
+    which case the style is not cached.
+
+    >>> styleFingerprint(dict(fontSize=12, font='PageBot-Regular'))
+    (('font', 'PageBot-Regular'), ('fontSize', 12))
+    >>> styleFingerprint(None)
+    ()
+    >>> styleFingerprint(dict(fontSize=12, hyphenate=len)) is None
+    True
+    """
+    if not style:
+        return ()
+    try:
+        return tuple(sorted((key, styleValueKey(value)) for key, value in style.items()))
+    except TypeError:
+        return None
+
+def textFingerprint(bs):
+    """Answers the hashable fingerprint of the runs of the BabelString: the
+    run strings with their style fingerprints. Answers None if a style has
+    no fingerprint.
+
+    >>> from types import SimpleNamespace as Run
+    >>> bs = Run(runs=[Run(s='AB', style=dict(fontSize=12))])
+    >>> textFingerprint(bs)
+    (('AB', (('fontSize', 12),)),)
+    >>> bs.runs.append(Run(s='C', style=dict(fontSize=len)))
+    >>> textFingerprint(bs) is None
+    True
+    """
+    fingerprint = []
+    for run in bs.runs:
+        style = styleFingerprint(run.style)
+        if style is None:
+            return None
+        fingerprint.append((run.s, style))
+    return tuple(fingerprint)
+
+def textKey(bs, *args):
+    """Answers the cache key of bs with args, e.g. the width of a
+    measurement, or None if bs has no fingerprint.
+
+    >>> from types import SimpleNamespace as Run
+    >>> textKey(Run(runs=[Run(s='AB', style=None)]), 100)
+    ((('AB', ()),), 100)
+    """
+    fingerprint = textFingerprint(bs)
+    if fingerprint is None:
+        return None
+    return (fingerprint,) + args
+
+class TextLayoutCache(LRUCache):
+    """Bounded cache of text layouts, keyed on the content and styles of the
+    BabelString runs and the (w, h) of the layout box. The layout itself is
+    made by a function that is supplied by the context (e.g. the CoreText
+    framesetter of DrawBotContext.getTextLines).
+
+    >>> from types import SimpleNamespace as Run
+    >>> calls = []
+    >>> def framesetter(bs, w, h):
+    ...     calls.append((w, h))
+    ...     return ['line %d' % i for i in range(len(bs.runs[0].s) // 10)]
+    >>> cache = TextLayoutCache(maxSize=2)
+    >>> bs1 = Run(runs=[Run(s='A' * 20, style=dict(fontSize=12))])
+    >>> bs2 = Run(runs=[Run(s='A' * 20, style=dict(fontSize=12))])
+    >>> cache.getLayout(bs1, 100, 200, framesetter)
+    ['line 0', 'line 1']
+    >>> cache.getLayout(bs2, 100, 200, framesetter) # Equal content, no new layout.
+    ['line 0', 'line 1']
+    >>> calls, cache.hits, cache.misses
+    ([(100, 200)], 1, 1)
+    >>> bs2.runs[0].style['fontSize'] = 14 # Changed style makes a new key.
+    >>> len(cache.getLayout(bs2, 100, 200, framesetter)), len(calls)
+    (2, 2)
+    >>> len(cache.getLayout(bs1, 50, 200, framesetter)), len(calls) # Other width.
+    (2, 3)
+    >>> cache.evictions
+    1
+    >>> cache.invalidate(bs1) # Removes all layouts of this content.
+    >>> len(cache)
+    1
+    """
+
+    def layoutKey(self, bs, w, h):
+        return textKey(bs, w, h)
+
+    def getLayout(self, bs, w, h, layout):
+        """Answers the cached layout of bs in a (w, h) box. Otherwise call
+        `layout(bs, w, h)` and store the result."""
+        return self.getOrCreate(self.layoutKey(bs, w, h), layout, bs, w, h)
+
+    def invalidate(self, key=None):
+        """Removes the layouts of key from the cache. Key can be a layout key,
+        or a BabelString, in which case all cached sizes of its content are
+        removed. Clears the cache if key is None."""
+        if key is None or not hasattr(key, 'runs'):
+            super().invalidate(key)
+        else:
+            fingerprint = textFingerprint(key)
+            if fingerprint is None:
+                return
+            for layoutKey in self.keys():
+                if layoutKey[0] == fingerprint:
+                    super().invalidate(layoutKey)
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
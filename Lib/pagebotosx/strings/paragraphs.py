@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     paragraphs.py
+#
+
+def splitParagraphs(runs):
+    """Answers the list of paragraphs in the runs, where each paragraph is a
+    list of (s, style) tuples. A paragraph ends after a newline, which stays
+    part of the paragraph. The style dictionaries are not copied.
+
+    >>> from types import SimpleNamespace as Run
+    >>> NL = chr(10)
+    >>> runs = [Run(s='AB'+NL+'CD', style=1), Run(s='EF'+NL, style=2), Run(s='GH', style=3)]
+    >>> paragraphs = splitParagraphs(runs)
+    >>> [[s.strip() for s, _ in paragraph] for paragraph in paragraphs]
+    [['AB'], ['CD', 'EF'], ['GH']]
+    >>> [[style for _, style in paragraph] for paragraph in paragraphs]
+    [[1], [1, 2], [3]]
+    >>> len(splitParagraphs([Run(s=NL+NL, style=1)]))
+    2
+    >>> splitParagraphs([])
+    []
+    """
+    paragraphs = []
+    paragraph = []
+
+    for run in runs:
+        parts = run.s.split('\n')
+        for part in parts[:-1]:
+            paragraph.append((part + '\n', run.style))
+            paragraphs.append(paragraph)
+            paragraph = []
+        if parts[-1]:
+            paragraph.append((parts[-1], run.style))
+
+    if paragraph:
+        paragraphs.append(paragraph)
+    return paragraphs
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
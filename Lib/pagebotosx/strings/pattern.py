@@ -15,10 +15,14 @@
 #     pattern.py
 #
 
+import re
+from bisect import bisect_right
+
 class FoundPattern:
     """Searches for regex patterns inside a TextLine."""
 
-    def __init__(self, s, x, ix, y=None, w=None, h=None, line=None, run=None):
+    def __init__(self, s, x, ix, y=None, w=None, h=None, line=None, run=None,
+            pattern=None):
         # Found string.
         self.s = s
         self.x = x
@@ -30,6 +34,8 @@ class FoundPattern:
         self.line = line
         # List of this string.
         self.run = run
+        # Pattern that was searched for.
+        self.pattern = pattern
 
     def __repr__(self):
         return '[Found "%s" @ %d,%d]' % (self.s, self.x, self.y)
@@ -49,4 +55,135 @@ def findPattern(textLines, pattern):
             foundPatterns.append(foundPattern)
     return foundPatterns
 
+class IndexedLine:
+    """Entry of TextSearchIndex with the string range of a laid-out line."""
+
+    def __init__(self, start, end, y=None, h=None, w=None, line=None,
+            runs=None, offset=None):
+        # Range of the line in the source text, end is not inclusive.
+        self.start = start
+        self.end = end
+        self.y = y
+        self.h = h
+        # Horizontal position of the end of the line.
+        self.w = w
+        # Native line info (e.g. BabelLineInfo).
+        self.line = line
+        # Sorted list of (start, end, run) ranges of the runs in the line.
+        self.runs = runs or []
+        self._runStarts = [runStart for runStart, _, _ in self.runs]
+        # Function that answers the x of a text index inside the line.
+        self.offset = offset
+
+    def __repr__(self):
+        return '<%s %d-%d>' % (self.__class__.__name__, self.start, self.end)
+
+    def getX(self, index):
+        if self.offset is None:
+            return 0
+        return self.offset(index)
+
+    def getRun(self, index):
+        """Answers the run that contains the text index, or None."""
+        runIndex = bisect_right(self._runStarts, index) - 1
+        if runIndex >= 0 and index < self.runs[runIndex][1]:
+            return self.runs[runIndex][2]
+        return None
+
+class TextSearchIndex:
+    r"""Index of the string ranges of the lines in a laid-out text. The
+    patterns are searched in the source text, after which the lines of each
+    match are found by bisection of the line ranges, instead of scanning
+    every line for every pattern.
+
+    >>> NL = chr(10)
+    >>> text = 'Footnote[1] in line one.' + NL + 'Index[A] and [2] here.'
+    >>> index = TextSearchIndex(text)
+    >>> index.addLine(0, 25, y=10, h=12, w=200, offset=lambda i: i * 8)
+    >>> index.addLine(25, 47, y=24, h=12, w=170, offset=lambda i: (i - 25) * 8)
+    >>> patterns = [r'\[[0-9]+\]', r'Index\[[A-Z]\]']
+    >>> found = index.search(patterns)
+    >>> found
+    [[Found "[1]" @ 64,10], [Found "Index[A]" @ 0,24], [Found "[2]" @ 104,24]]
+    >>> [(f.w, f.h, f.ix, patterns.index(f.pattern)) for f in found]
+    [(24, 12, 8, 0), (64, 12, 25, 1), (24, 12, 38, 0)]
+    >>> found = index.search(['one.' + NL + 'Index']) # Spans 2 lines.
+    >>> [(f.s.strip(), f.x, f.w) for f in found]
+    [('one.', 160, 40), ('Index', 0, 40)]
+    >>> [f.s for f in index.search([r'(?i)index', r'(\w)\1'])] # Flags, backreferences.
+    ['oo', 'Index']
+    >>> [(f.s, f.ix) for f in index.search([r'Index\[A\]', r'\[A\]'])] # Overlapping.
+    [('Index[A]', 25), ('[A]', 30)]
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.lines = []
+        self._lineStarts = []
+
+    def __len__(self):
+        return len(self.lines)
+
+    def addLine(self, start, end, y=None, h=None, w=None, line=None,
+            runs=None, offset=None):
+        """Adds the string range of the next line. Lines must be added in
+        order of the text."""
+        assert not self.lines or start >= self.lines[-1].start
+        self.lines.append(IndexedLine(start, end, y=y, h=h, w=w, line=line,
+            runs=runs, offset=offset))
+        self._lineStarts.append(start)
+
+    def getLineIndex(self, index):
+        """Answers the index of the line that contains the text index, or None
+        if it is not in a line (e.g. in overflow)."""
+        lineIndex = bisect_right(self._lineStarts, index) - 1
+        if lineIndex >= 0 and index < self.lines[lineIndex].end:
+            return lineIndex
+        return None
+
+    def search(self, patterns):
+        """Answers the list of FoundPattern instances, in order of the text,
+        for all regex patterns. Each pattern is compiled and searched by
+        itself, so matches of different patterns can overlap, as with
+        findPattern. Matches that span multiple lines answer a FoundPattern
+        for each line."""
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        matches = []
+
+        for patternIndex, pattern in enumerate(patterns):
+            for match in re.compile(pattern).finditer(self.text):
+                if match.start() < match.end():
+                    matches.append((match.start(), patternIndex, match, pattern))
+        matches.sort(key=lambda item: item[:2])
+
+        foundPatterns = []
+
+        for _, _, match, pattern in matches:
+            lineIndex = self.getLineIndex(match.start())
+
+            while lineIndex is not None and lineIndex < len(self.lines):
+                indexedLine = self.lines[lineIndex]
+                if indexedLine.start >= match.end():
+                    break
+                start = max(match.start(), indexedLine.start)
+                end = min(match.end(), indexedLine.end)
+                x = indexedLine.getX(start)
+
+                if end < indexedLine.end or indexedLine.w is None:
+                    w = indexedLine.getX(end) - x
+                else:
+                    w = indexedLine.w - x
+
+                foundPatterns.append(FoundPattern(self.text[start:end], x,
+                    start, y=indexedLine.y, w=w, h=indexedLine.h,
+                    line=indexedLine.line, run=indexedLine.getRun(start),
+                    pattern=pattern))
+                lineIndex += 1
+
+        return foundPatterns
 
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
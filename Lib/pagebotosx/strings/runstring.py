@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     runstring.py
+#
+#     CoreText string ranges count UTF-16 code units, as NSString does, while
+#     Python strings count code points. The two only differ for characters
+#     outside the Basic Multilingual Plane (e.g. emoji), which take a
+#     surrogate pair in UTF-16.
+#
+
+class RunStringSlicer:
+    """Answers the substrings of a source string for (location, length)
+    ranges in UTF-16 code units, such as answered by CTRunGetStringRange.
+
+    >>> slicer = RunStringSlicer('Hello "world"' + chr(10))
+    >>> slicer.slice(0, 5), slicer.slice(6, 7)
+    ('Hello', '"world"')
+    >>> slicer.runString(6, 8) # Line breaks are not part of the run string.
+    '"world"'
+    >>> s = 'A' + chr(0x1F600) + 'BC' # The emoji takes 2 UTF-16 code units.
+    >>> slicer = RunStringSlicer(s)
+    >>> slicer.slice(1, 2) == chr(0x1F600)
+    True
+    >>> slicer.slice(3, 2)
+    'BC'
+    """
+
+    def __init__(self, s):
+        self.s = s
+        # Only strings with characters outside the BMP need the UTF-16
+        # encoding. Otherwise the ranges can slice the string directly.
+        if s and max(s) > '\uffff':
+            self._utf16 = s.encode('utf-16-le')
+        else:
+            self._utf16 = None
+
+    def slice(self, location, length):
+        """Answers the substring of the range in UTF-16 code units."""
+        if self._utf16 is None:
+            return self.s[location:location+length]
+        return self._utf16[2*location:2*(location+length)].decode('utf-16-le')
+
+    def index(self, location):
+        """Answers the index in the Python string of a location in UTF-16
+        code units.
+
+        >>> s = chr(0x1F600) + 'ABC'
+        >>> RunStringSlicer(s).index(3), RunStringSlicer('ABC').index(1)
+        (2, 1)
+        """
+        if self._utf16 is None:
+            return location
+        return len(self._utf16[:2*location].decode('utf-16-le'))
+
+    def utf16Index(self, index):
+        """Answers the location in UTF-16 code units of an index in the
+        Python string.
+
+        >>> s = chr(0x1F600) + 'ABC'
+        >>> RunStringSlicer(s).utf16Index(2), RunStringSlicer('ABC').utf16Index(1)
+        (3, 1)
+        """
+        if self._utf16 is None:
+            return index
+        return len(self.s[:index].encode('utf-16-le')) // 2
+
+    def runString(self, location, length):
+        """Answers the run string of the range, without line breaks, as
+        stored in BabelRunInfo.s."""
+        return self.slice(location, length).replace('\n', '')
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     stylecache.py
+#
+
+import copy
+from pagebotosx.toolbox.lrucache import LRUCache
+
+# Names of the CTRun attributes that the reconstructed style depends on.
+RUN_STYLE_ATTRIBUTES = ('NSFont', 'NSParagraphStyle', 'NSColor',
+        'NSBaselineOffset', 'NSLanguage')
+
+def runStyleKey(attributes):
+    """Answers the hashable key of the style attributes of a run. The
+    AppKit objects compare and hash by value (isEqual: and hash), so runs
+    with equal attributes answer equal keys.
+
+    >>> runStyleKey(dict(NSFont='Roboto 12', NSColor='red', NSLanguage='en'))
+    ('Roboto 12', None, 'red', None, 'en')
+    """
+    return tuple(attributes.get(name) for name in RUN_STYLE_ATTRIBUTES)
+
+class RunStyle(dict):
+    """Read-only style dictionary that is shared by runs with equal
+    attributes. Copies, made by copy.copy, copy.deepcopy, style.copy() or
+    dict(style), are normal dictionaries that can be changed.
+
+    >>> style = RunStyle(font='Roboto', fontSize=12)
+    >>> style['fontSize'] = 14
+    Traceback (most recent call last):
+    ...
+    TypeError: RunStyle is read-only, change a copy made by dict(style)
+    >>> style.update(fontSize=14)
+    Traceback (most recent call last):
+    ...
+    TypeError: RunStyle is read-only, change a copy made by dict(style)
+    >>> copied = copy.copy(style)
+    >>> copied['fontSize'] = 14
+    >>> type(copied).__name__, copied['fontSize'], style['fontSize']
+    ('dict', 14, 12)
+    >>> type(copy.deepcopy(style)).__name__, type(style.copy()).__name__
+    ('dict', 'dict')
+    >>> isinstance(style, dict), style == dict(font='Roboto', fontSize=12)
+    (True, True)
+    """
+
+    def _readOnly(self, *args, **kwargs):
+        raise TypeError('%s is read-only, change a copy made by dict(style)'
+                % self.__class__.__name__)
+
+    __setitem__ = __delitem__ = __ior__ = _readOnly
+    update = setdefault = pop = popitem = clear = _readOnly
+
+    def copy(self):
+        return dict(self)
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(dict(self), memo)
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+class StyleCache(LRUCache):
+    """Cache of the style dictionaries that are reconstructed from text runs.
+    Runs with equal attributes share the same style record, which is read-only
+    to make sure that one run cannot alter the style of another.
+
+    >>> calls = []
+    >>> def makeStyle(fontSize):
+    ...     calls.append(fontSize)
+    ...     return dict(fontSize=fontSize)
+    >>> cache = StyleCache()
+    >>> style1 = cache.getStyle(('Roboto', 12), makeStyle, 12)
+    >>> style2 = cache.getStyle(('Roboto', 12), makeStyle, 12)
+    >>> style1 is style2, style1['fontSize'], calls
+    (True, 12, [12])
+    >>> style1['fontSize'] = 14
+    Traceback (most recent call last):
+    ...
+    TypeError: RunStyle is read-only, change a copy made by dict(style)
+    >>> style = dict(style1) # Mutable copy.
+    >>> style['fontSize'] = 14
+    >>> style['fontSize'], style1['fontSize']
+    (14, 12)
+    >>> style3 = cache.getStyle(('Roboto', 24), makeStyle, 24)
+    >>> cache.uniqueStyles, cache.hits
+    (2, 1)
+    >>> cache = StyleCache(maxSize=1) # Styles made again after eviction.
+    >>> for fontSize in (12, 24, 12, 24):
+    ...     style = cache.getStyle(('Roboto', fontSize), makeStyle, fontSize)
+    >>> cache.uniqueStyles, cache.misses
+    (2, 4)
+    """
+
+    def __init__(self, maxSize=4096):
+        super().__init__(maxSize=maxSize)
+        # Keys of the styles that were made since the counters were reset.
+        self._styleKeys = set()
+
+    @staticmethod
+    def _makeStyle(factory, *args):
+        return RunStyle(factory(*args))
+
+    def getStyle(self, key, factory, *args):
+        """Answers the shared read-only style of key. Otherwise make it by
+        `factory(*args)` and store it."""
+        if key not in self:
+            self._styleKeys.add(key)
+        return self.getOrCreate(key, self._makeStyle, factory, *args)
+
+    def resetCounters(self):
+        super().resetCounters()
+        self._styleKeys.clear()
+
+    def _get_uniqueStyles(self):
+        """Answers the number of different styles that were made since the
+        counters were reset. Styles that are made again after they were
+        evicted are counted once."""
+        return len(self._styleKeys)
+    uniqueStyles = property(_get_uniqueStyles)
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     textflow.py
+#
+
+def flowFrames(length, boxes, placeFrame):
+    """Flows a text of length characters through the boxes, where each frame
+    starts at the end of the visible range of the previous one. The function
+    `placeFrame(start, box)` places a frame and answers the tuple (frame,
+    visibleLength). Answers the tuple (frames, overflowStart), where frames is
+    a list of (start, visibleLength, frame) for the boxes that were used and
+    overflowStart is the index of the first character that did not fit, or
+    None if all text fits. Each character is placed once, so the flow is
+    linear in the length of the text.
+
+    >>> def placeFrame(start, box): # Stand-in framesetter, box holds 10 chars/line.
+    ...     w, h = box
+    ...     visibleLength = min(length - start, h // 10 * 10)
+    ...     return 'Frame@%d' % start, visibleLength
+    >>> length = 45
+    >>> flowFrames(length, [(100, 20), (100, 20)], placeFrame)
+    ([(0, 20, 'Frame@0'), (20, 20, 'Frame@20')], 40)
+    >>> flowFrames(length, [(100, 30), (100, 30), (100, 30)], placeFrame)
+    ([(0, 30, 'Frame@0'), (30, 15, 'Frame@30')], None)
+    >>> flowFrames(length, [(100, 5), (100, 50)], placeFrame) # First box too small.
+    ([(0, 0, 'Frame@0'), (0, 45, 'Frame@0')], None)
+    """
+    frames = []
+    start = 0
+
+    for box in boxes:
+        if start >= length:
+            break
+        frame, visibleLength = placeFrame(start, box)
+        frames.append((start, visibleLength, frame))
+        start += visibleLength
+
+    if start >= length:
+        return frames, None
+    return frames, start
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     batch.py
+#
+
+from concurrent.futures import ThreadPoolExecutor
+
+def mapUnique(function, items, keys, workers=None):
+    """Answers the list of `function(item)` results, in the order of items.
+    The function is called once for every different key, with the first item
+    of that key. If workers is larger than 1, then the calls are spread over a
+    pool of threads.
+
+    >>> calls = []
+    >>> def measure(s):
+    ...     calls.append(s)
+    ...     return len(s)
+    >>> items = ['ab', 'abc', 'ab', 'abcd', 'abc']
+    >>> mapUnique(measure, items, items)
+    [2, 3, 2, 4, 3]
+    >>> calls
+    ['ab', 'abc', 'abcd']
+    >>> mapUnique(measure, items, items, workers=4)
+    [2, 3, 2, 4, 3]
+    >>> mapUnique(measure, [], [])
+    []
+    """
+    assert len(items) == len(keys)
+    # Index of the first item for every different key, in order of keys.
+    firstIndices = {}
+    for index, key in enumerate(keys):
+        if key not in firstIndices:
+            firstIndices[key] = index
+    uniqueItems = [items[index] for index in firstIndices.values()]
+
+    if workers is not None and workers > 1 and len(uniqueItems) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            uniqueResults = list(executor.map(function, uniqueItems))
+    else:
+        uniqueResults = [function(item) for item in uniqueItems]
+
+    results = dict(zip(firstIndices.keys(), uniqueResults))
+    return [results[key] for key in keys]
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
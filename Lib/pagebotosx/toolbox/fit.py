@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     fit.py
+#
+
+def bisectFit(fits, minValue, maxValue, tolerance=0.1, maxEvaluations=50):
+    """Answers the tuple (value, evaluations) with the largest value between
+    minValue and maxValue for which `fits(value)` is True, within tolerance.
+    The function fits must be monotonic: if a value fits, then all smaller
+    values fit too. If maxValue fits, it is answered right away. Value is None
+    if not even minValue fits, or if minValue is larger than maxValue.
+
+    >>> calls = []
+    >>> def fits(fontSize):
+    ...     calls.append(fontSize)
+    ...     return fontSize * 10 <= 240 # E.g. 10 characters wide in 240pt.
+    >>> value, evaluations = bisectFit(fits, 1, 100)
+    >>> 23.9 < value <= 24, evaluations == len(calls)
+    (True, True)
+    >>> bisectFit(fits, 1, 20) # Early exit, the largest size fits.
+    (20, 1)
+    >>> bisectFit(fits, 30, 100)
+    (None, 2)
+    >>> bisectFit(fits, 1, 0.5) # Empty range.
+    (None, 0)
+    """
+    if minValue > maxValue:
+        return None, 0
+    if fits(maxValue):
+        return maxValue, 1
+    if not fits(minValue):
+        return None, 2
+
+    evaluations = 2
+    lo = minValue # Largest value known to fit.
+    hi = maxValue # Smallest value known not to fit.
+
+    while hi - lo > tolerance and evaluations < maxEvaluations:
+        value = (lo + hi) / 2
+        evaluations += 1
+        if fits(value):
+            lo = value
+        else:
+            hi = value
+    return lo, evaluations
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     fontmetrics.py
+#
+
+from pagebotosx.toolbox.lrucache import LRUCache
+
+class FontMetricsTable(LRUCache):
+    """Table of the vertical metrics of fonts, keyed on the font path. The
+    typographic ascender and descender are read from the font info once and
+    stored as fraction of the em, so they only need a multiplication by the
+    fontSize.
+
+    >>> from types import SimpleNamespace as Font
+    >>> info = Font(typoAscender=750, typoDescender=-250)
+    >>> font = Font(path='/fonts/Regular.ttf', upem=1000, info=info)
+    >>> table = FontMetricsTable()
+    >>> table.getMetrics(font)
+    (0.75, -0.25)
+    >>> table.getMetrics(font)
+    (0.75, -0.25)
+    >>> table.hits, table.misses
+    (1, 1)
+    """
+
+    def __init__(self, maxSize=None):
+        super().__init__(maxSize=maxSize)
+
+    @staticmethod
+    def _readMetrics(font):
+        upem = font.upem
+        return font.info.typoAscender / upem, font.info.typoDescender / upem
+
+    def getMetrics(self, font):
+        """Answers the tuple (ascender, descender) of the font, as fraction of
+        the em."""
+        return self.getOrCreate(font.path, self._readMetrics, font)
+
+    def lineAscDesc(self, runs):
+        """Answers the tuple (ascender, descender) of a line, for an iterator
+        of (font, fontSize, baselineShift) runs in points. For lines with
+        mixed sizes or fonts, the ascender is the highest of all runs and the
+        descender the lowest, which can come from different runs.
+
+        >>> from types import SimpleNamespace as Font
+        >>> info = Font(typoAscender=750, typoDescender=-250)
+        >>> font = Font(path='/fonts/Regular.ttf', upem=1000, info=info)
+        >>> info = Font(typoAscender=900, typoDescender=-100)
+        >>> display = Font(path='/fonts/Display.ttf', upem=1000, info=info)
+        >>> table = FontMetricsTable()
+        >>> table.lineAscDesc([(font, 10, 0)])
+        (7.5, -2.5)
+        >>> table.lineAscDesc([(font, 10, 0), (display, 20, 0)])
+        (18.0, -2.5)
+        >>> table.lineAscDesc([(font, 10, -5)]) # Shifted below the baseline.
+        (2.5, -7.5)
+        >>> table.lineAscDesc([])
+        (0, 0)
+        """
+        ascender = descender = None
+
+        for font, fontSize, baselineShift in runs:
+            fontAscender, fontDescender = self.getMetrics(font)
+            runAscender = fontSize * fontAscender + baselineShift
+            runDescender = fontSize * fontDescender + baselineShift
+
+            if ascender is None or runAscender > ascender:
+                ascender = runAscender
+            if descender is None or runDescender < descender:
+                descender = runDescender
+
+        if ascender is None:
+            return 0, 0
+        return ascender, descender
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
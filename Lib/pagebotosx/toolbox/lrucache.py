@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     lrucache.py
+#
+
+from collections import OrderedDict
+
+class LRUCache:
+    """Bounded dictionary that drops the least recently used item when more
+    than `maxSize` items are stored. Counts hits and misses, so callers can
+    report how effective the cache is.
+
+    >>> cache = LRUCache(maxSize=2)
+    >>> cache['a'] = 1
+    >>> cache['b'] = 2
+    >>> cache.get('a')
+    1
+    >>> cache['c'] = 3 # Drops 'b', as 'a' was used more recently.
+    >>> 'b' in cache, 'a' in cache, 'c' in cache
+    (False, True, True)
+    >>> cache.get('b') is None
+    True
+    >>> cache.hits, cache.misses, cache.evictions
+    (1, 1, 1)
+    >>> len(cache)
+    2
+    """
+
+    def __init__(self, maxSize=256):
+        assert maxSize is None or maxSize > 0
+        # Maximum number of items. None makes the cache unbounded.
+        self.maxSize = maxSize
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        return '<%s %d/%s>' % (self.__class__.__name__, len(self), self.maxSize)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        """Answers if the key is cached, without changing the counters or the
+        order of use."""
+        return key in self._items
+
+    def __setitem__(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+
+        if self.maxSize is not None:
+            while len(self._items) > self.maxSize:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, key, default=None):
+        """Answers the cached value of key, or default if it does not exist.
+
+        >>> cache = LRUCache()
+        >>> cache.get('x', 123)
+        123
+        >>> cache.misses
+        1
+        """
+        if key in self._items:
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key]
+        self.misses += 1
+        return default
+
+    def getOrCreate(self, key, factory, *args, **kwargs):
+        """Answers the cached value of key. If it does not exist, then call
+        `factory(*args, **kwargs)` and store the result. A key of None, for
+        values that have no exact key, is never stored.
+
+        >>> cache = LRUCache()
+        >>> cache.getOrCreate('x', lambda v: v * 2, 21)
+        42
+        >>> cache.getOrCreate('x', lambda v: v * 2, 1000)
+        42
+        >>> cache.hits, cache.misses
+        (1, 1)
+        >>> cache.getOrCreate(None, lambda v: v * 2, 1000), len(cache)
+        (2000, 1)
+        """
+        if key is None:
+            self.misses += 1
+            return factory(*args, **kwargs)
+        if key in self._items:
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key]
+        self.misses += 1
+        value = factory(*args, **kwargs)
+        self[key] = value
+        return value
+
+    def keys(self):
+        """Answers a list of the cached keys, least recently used first."""
+        return list(self._items.keys())
+
+    def invalidate(self, key=None):
+        """Removes key from the cache. Clears all items if key is None. The
+        counters are not changed.
+
+        >>> cache = LRUCache()
+        >>> cache['a'] = 1
+        >>> cache['b'] = 2
+        >>> cache.invalidate('a')
+        >>> cache.keys()
+        ['b']
+        >>> cache.invalidate()
+        >>> len(cache)
+        0
+        """
+        if key is None:
+            self._items.clear()
+        else:
+            self._items.pop(key, None)
+
+    def resetCounters(self):
+        self.hits = self.misses = self.evictions = 0
+
+    def _get_hitRate(self):
+        """Answers the ratio of hits over all lookups, 0 if nothing was looked
+        up yet.
+
+        >>> cache = LRUCache()
+        >>> cache.hitRate
+        0
+        >>> cache['a'] = 1
+        >>> cache.get('a'), cache.get('a'), cache.get('b')
+        (1, 1, None)
+        >>> round(cache.hitRate, 2)
+        0.67
+        """
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0
+        return self.hits / lookups
+    hitRate = property(_get_hitRate)
+
+    def stats(self):
+        """Answers a dictionary with the current size and counters.
+
+        >>> cache = LRUCache(maxSize=10)
+        >>> cache.stats()
+        {'size': 0, 'maxSize': 10, 'hits': 0, 'misses': 0, 'evictions': 0, 'hitRate': 0}
+        """
+        return dict(size=len(self), maxSize=self.maxSize, hits=self.hits,
+                misses=self.misses, evictions=self.evictions,
+                hitRate=self.hitRate)
+
+if __name__ == '__main__':
+    import doctest
+    import sys
+    sys.exit(doctest.testmod()[0])
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     exportmemory.py
+#
+#     Peak RSS of exporting 10, 100 and 1000 pages with saveDrawing (all
+#     pages in memory) and with exportStreaming. Each export runs in a new
+#     process, as the peak RSS of a process never goes down.
+#
+#     python3 scripts/benchmarks/exportmemory.py
+#
+
+import sys
+import subprocess
+
+from pagebotosx.contexts.drawbotcontext.drawbotcontext import DrawBotContext
+from pagebotosx.export.pageranges import drawNumberedPages
+from pagebotosx.export.streaming import getPeakRSS
+
+PAGE_COUNTS = (10, 100, 1000)
+MODES = ('saveDrawing', 'streaming')
+
+def export(mode, pageCount):
+    context = DrawBotContext()
+    path = '_export/exportmemory-%s-%d.pdf' % (mode, pageCount)
+    if mode == 'streaming':
+        context.exportStreaming(path, pageCount, drawNumberedPages)
+    else:
+        context.newDrawing()
+        drawNumberedPages(context, 0, pageCount)
+        context.saveDrawing(path, multiPage=True)
+    print(getPeakRSS())
+
+def run():
+    print('%8s %16s %16s' % (('pages',) + tuple('%s MB' % mode for mode in MODES)))
+    for pageCount in PAGE_COUNTS:
+        peaks = []
+        for mode in MODES:
+            output = subprocess.check_output([sys.executable, __file__,
+                '--child', mode, str(pageCount)])
+            peaks.append(int(output.split()[-1]) / 1024 / 1024)
+        print('%8d %16.1f %16.1f' % ((pageCount,) + tuple(peaks)))
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        export(sys.argv[2], int(sys.argv[3]))
+    else:
+        run()
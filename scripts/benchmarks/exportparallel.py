@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     exportparallel.py
+#
+#     Compares serial and parallel page range export of a numbered PDF
+#     document, for a number of pages and workers.
+#
+#     python3 scripts/benchmarks/exportparallel.py 600 1 2 4 8
+#
+
+import sys
+
+from pagebotosx.contexts.drawbotcontext.drawbotcontext import DrawBotContext
+from pagebotosx.export.pageranges import drawNumberedPages
+
+def run():
+    pageCount = int(sys.argv[1]) if len(sys.argv) > 1 else 600
+    workerCounts = [int(v) for v in sys.argv[2:]] or [1, 2, 4, 8]
+    context = DrawBotContext()
+    for workers in workerCounts:
+        report = context.exportParallel('_export/exportparallel-%d.pdf' % workers,
+                pageCount, drawNumberedPages, workers=workers, compare=True)
+        print(report)
+
+if __name__ == '__main__':
+    run()
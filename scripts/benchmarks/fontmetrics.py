@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     fontmetrics.py
+#
+#     Compares the line heights of textSize(ascDesc=True), read by run from
+#     the font info attributes, against the FontMetricsTable lookups.
+#
+#     python3 scripts/benchmarks/fontmetrics.py
+#
+
+from time import perf_counter
+
+from pagebot.toolbox.loremipsum import loremIpsum
+from pagebot.toolbox.units import pt, upt
+from pagebotosx.contexts.drawbotcontext.drawbotcontext import DrawBotContext
+from pagebotosx.toolbox.fontmetrics import FontMetricsTable
+
+STYLES = (dict(font='PageBot-Regular', fontSize=pt(12)),
+        dict(font='PageBot-Bold', fontSize=pt(18)))
+
+def attributeHeights(lines):
+    """The previous per-run lookup of the font info attributes."""
+    textHeight = 0
+    for line in lines:
+        lineHeight = 0
+        for run in line.runs:
+            size = upt(run.style['fontSize'])
+            font = run.style['font']
+            runHeight = size * (font.info.typoAscender - font.info.typoDescender) / font.upem
+            lineHeight = max(lineHeight, runHeight)
+        textHeight += lineHeight
+    return textHeight
+
+def tableHeights(lines, table):
+    textHeight = 0
+    for line in lines:
+        ascender, descender = table.lineAscDesc(
+            (run.style['font'], upt(run.style['fontSize']),
+                upt(run.style.get('baselineShift') or 0))
+            for run in line.runs)
+        textHeight += ascender - descender
+    return textHeight
+
+def run(repeat=20):
+    context = DrawBotContext()
+    print('%8s %8s %14s %14s' % ('paras', 'lines', 'attr ms', 'table ms'))
+    for paragraphs in (10, 100, 1000):
+        bs = context.newString('', w=pt(400))
+        for index in range(paragraphs):
+            bs.add(loremIpsum(doShuffle=True) + '\n', STYLES[index % 2])
+        lines = context.getTextLines(bs, w=pt(400), h=pt(paragraphs * 2000))
+        table = FontMetricsTable()
+
+        t = perf_counter()
+        for _ in range(repeat):
+            attributeHeights(lines)
+        tAttributes = (perf_counter() - t) / repeat
+
+        t = perf_counter()
+        for _ in range(repeat):
+            tableHeights(lines, table)
+        tTable = (perf_counter() - t) / repeat
+
+        print('%8d %8d %14.2f %14.2f' % (paragraphs, len(lines),
+            tAttributes * 1000, tTable * 1000))
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     frombabelstring.py
+#
+#     Times DrawBotContext.fromBabelString for 1, 100 and 10k runs: without
+#     caches, with only the run style cache (new text, known styles) and with
+#     the FormattedString cache (repeated text).
+#
+#     python3 scripts/benchmarks/frombabelstring.py
+#
+
+from time import perf_counter
+
+from pagebot.contexts.basecontext.babelstring import BabelString
+from pagebot.contexts.basecontext.babelrun import BabelRun
+from pagebot.toolbox.units import pt
+from pagebotosx.contexts.drawbotcontext.drawbotcontext import DrawBotContext
+
+STYLES = (dict(font='PageBot-Regular', fontSize=pt(12)),
+        dict(font='PageBot-Bold', fontSize=pt(12)),
+        dict(font='PageBot-Italic', fontSize=pt(12), textFill=(1, 0, 0)))
+
+def newString(context, runs, tag=''):
+    bs = BabelString(context=context)
+    for index in range(runs):
+        bs.runs.append(BabelRun('Word%s%d ' % (tag, index), STYLES[index % len(STYLES)]))
+    return bs
+
+def timeIt(function, repeat):
+    t = perf_counter()
+    for _ in range(repeat):
+        function()
+    return (perf_counter() - t) / repeat * 1000
+
+def run():
+    context = DrawBotContext()
+    print('%8s %14s %14s %14s' % ('runs', 'no cache ms', 'styles ms', 'cached ms'))
+    for runs in (1, 100, 10000):
+        repeat = max(1, 1000 // runs)
+        bs = newString(context, runs)
+
+        def uncached():
+            context.formattedStringCache.invalidate()
+            context.fsStyleCache.invalidate()
+            context.fromBabelString(bs)
+
+        counter = [0]
+        def stylesCached():
+            # Different text each time, with the same styles.
+            counter[0] += 1
+            context.fromBabelString(newString(context, runs, str(counter[0])))
+
+        def cached():
+            context.fromBabelString(bs)
+
+        tUncached = timeIt(uncached, repeat)
+        tNewStrings = timeIt(lambda: newString(context, runs, 'x'), repeat)
+        tStyles = timeIt(stylesCached, repeat) - tNewStrings
+        tCached = timeIt(cached, repeat)
+        print('%8d %14.3f %14.3f %14.3f' % (runs, tUncached, tStyles, tCached))
+
+if __name__ == '__main__':
+    run()
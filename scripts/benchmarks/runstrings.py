@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     runstrings.py
+#
+#     Compares the per-run cost of reconstructing CTRun strings by parsing
+#     str(ctRun) against slicing the source string by CTRunGetStringRange.
+#
+#     python3 scripts/benchmarks/runstrings.py
+#
+
+from time import perf_counter
+
+from CoreText import (CGPathAddRect, CTFramesetterCreateWithAttributedString,
+        CGPathCreateMutable, CTFramesetterCreateFrame, CTFrameGetLines,
+        CGRectMake, CTLineGetGlyphRuns, CTRunGetStringRange)
+from pagebot.toolbox.loremipsum import loremIpsum
+from pagebot.toolbox.units import pt
+from pagebotosx.contexts.drawbotcontext.drawbotcontext import DrawBotContext
+from pagebotosx.strings.runstring import RunStringSlicer
+
+W = 500
+H = 100000
+STYLES = (dict(font='PageBot-Regular', fontSize=pt(12)),
+        dict(font='PageBot-Bold', fontSize=pt(12)))
+
+def reprRunString(ctRun):
+    """The previous reconstruction of the run string, parsing the debug
+    representation of the CTRun."""
+    s = ''
+    splitString = str(ctRun).split('"')[1].replace('\\n', '').split('\\u')
+    for index, part in enumerate(splitString):
+        if index == 0:
+            s += part
+        elif len(part) >= 4:
+            s += chr(int(part[0:4], 16))
+    return s
+
+def getRuns(context, paragraphs):
+    bs = context.newString('')
+    for index in range(paragraphs):
+        bs.add(loremIpsum(doShuffle=True) + '\n', STYLES[index % 2])
+    attrString = bs.cs.getNSObject()
+    setter = CTFramesetterCreateWithAttributedString(attrString)
+    path = CGPathCreateMutable()
+    CGPathAddRect(path, None, CGRectMake(0, 0, W, H))
+    ctBox = CTFramesetterCreateFrame(setter, (0, 0), path, None)
+    ctRuns = []
+    for ctLine in CTFrameGetLines(ctBox):
+        ctRuns += CTLineGetGlyphRuns(ctLine)
+    return attrString, ctRuns
+
+def run():
+    context = DrawBotContext()
+    print('%8s %8s %14s %14s' % ('paras', 'runs', 'repr us/run', 'slice us/run'))
+    for paragraphs in (1, 10, 100):
+        attrString, ctRuns = getRuns(context, paragraphs)
+
+        t = perf_counter()
+        for ctRun in ctRuns:
+            reprRunString(ctRun)
+        tRepr = perf_counter() - t
+
+        t = perf_counter()
+        slicer = RunStringSlicer(str(attrString.string()))
+        for ctRun in ctRuns:
+            stringRange = CTRunGetStringRange(ctRun)
+            slicer.runString(stringRange.location, stringRange.length)
+        tSlice = perf_counter() - t
+
+        n = max(1, len(ctRuns))
+        print('%8d %8d %14.2f %14.2f' % (paragraphs, len(ctRuns),
+            tRepr / n * 1e6, tSlice / n * 1e6))
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     textoutlines.py
+#
+#     Times the outlines of a headline: DrawBot BezierPath.text, the combined
+#     path of DrawBotContext.getTextOutlinePath and the raw arrays of
+#     getTextOutlineArrays, all after the layout is cached.
+#
+#     python3 scripts/benchmarks/textoutlines.py
+#
+
+from time import perf_counter
+
+from pagebot.toolbox.units import pt
+from pagebotosx.contexts.drawbotcontext.drawbotcontext import DrawBotContext
+
+W, H = 1000, 1000
+HEADLINE = 'Poster Headline Typography '
+
+def timeIt(function, repeat):
+    t = perf_counter()
+    for _ in range(repeat):
+        function()
+    return (perf_counter() - t) / repeat * 1000
+
+def run():
+    context = DrawBotContext()
+    print('%8s %14s %14s %14s' % ('glyphs', 'text() ms', 'path ms', 'arrays ms'))
+    for repeatText in (1, 10, 100):
+        style = dict(font='PageBot-Bold', fontSize=pt(1000 / (4 * repeatText**0.5)))
+        bs = context.newString(HEADLINE * repeatText, style)
+        repeat = max(1, 100 // repeatText)
+        glyphs = len(context.getTextGlyphPlacements(bs, w=W, h=H))
+
+        def native():
+            path = context.newPath()
+            path.text(bs.cs, box=(0, 0, W, H))
+
+        tNative = timeIt(native, repeat)
+        tPath = timeIt(lambda: context.getTextOutlinePath(bs, w=W, h=H), repeat)
+        tArrays = timeIt(lambda: context.getTextOutlineArrays(bs, w=W, h=H), repeat)
+        print('%8d %14.3f %14.3f %14.3f' % (glyphs, tNative, tPath, tArrays))
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#     P A G E B O T
+#
+#     Copyright (c) 2016+ Buro Petr van Blokland + Claudia Mens
+#     www.pagebot.io
+#     Licensed under MIT conditions
+#
+#     Supporting DrawBot, www.drawbot.com
+#     Supporting Flat, xxyxyz.org/flat
+# -----------------------------------------------------------------------------
+#
+#     prunescaledimages.py
+#
+#     Prunes the _scaled image folders below the given directories: removes
+#     scaled images of changed or deleted sources, unknown files and, with
+#     the options, images that were not used recently or that are over the
+#     size limit.
+#
+#     python3 scripts/prunescaledimages.py docs/images --max-size 200 --max-days 30
+#
+
+import os
+import argparse
+
+from pagebotosx.images.scaledcache import ScaledImageCache
+
+SCALED_PATH = '_scaled'
+
+def run():
+    parser = argparse.ArgumentParser(description='Prune scaled image caches.')
+    parser.add_argument('roots', nargs='+', help='Directories to search for %s folders' % SCALED_PATH)
+    parser.add_argument('--max-size', type=float, default=None, help='Maximum size per folder in MB')
+    parser.add_argument('--max-days', type=float, default=None, help='Remove images not used for this number of days')
+    args = parser.parse_args()
+
+    maxSize = None if args.max_size is None else int(args.max_size * 1024 * 1024)
+    maxAge = None if args.max_days is None else args.max_days * 24 * 60 * 60
+
+    for root in args.roots:
+        for dirPath, dirNames, _ in os.walk(root):
+            if os.path.basename(dirPath) != SCALED_PATH:
+                continue
+            # Do not search inside the cache folder.
+            dirNames[:] = []
+            cache = ScaledImageCache(dirPath)
+            removed = cache.prune(maxSize=maxSize, maxAge=maxAge)
+            stats = cache.stats()
+            print('%s: removed %d files, %d images (%0.1f MB) left' % (dirPath,
+                len(removed), stats['entries'], stats['size'] / 1024 / 1024))
+
+if __name__ == '__main__':
+    run()
@@ -54,6 +54,7 @@ setup(
         'Topic :: Text Processing :: Fonts'],
     install_requires=[
         'pyobjc',
+        'numpy',
         'pagebot',
         # Direct URL's not allowed on PyPI: https://github.com/pypa/pip/issues/6301
         #'drawbot @ git+https://github.com/typemytype/drawbot.git',